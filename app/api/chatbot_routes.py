@@ -1,25 +1,49 @@
 """Chatbot routes."""
 
-from fastapi import APIRouter
+import logging
 
-from ..core.chatbot_handler import process_chat_message
+from fastapi import APIRouter, Request
+
+from ..core.admission import CHAT, admission
+from ..core.chatbot_handler import process_chat_message, stream_chat_message
+from ..core.logs import sample_bodies, truncate
+from ..core.sessions import chat_sessions
+from ..core.streaming import sse_response
 from ..models.chatbot_models import ChatbotRequest, ChatbotResponse
 
+logger = logging.getLogger(__name__)
+
 # Create a new router
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatbotResponse)
-async def handle_chat_request(chat_request: ChatbotRequest):
+async def handle_chat_request(chat_request: ChatbotRequest, request: Request):
     """
     This endpoint receives a user's message, processes it using the handler,
     and returns Lyra's reply.
     """
     # Call the central processing function from the handler
-    reply_text = await process_chat_message(chat_request.message)
-    
-    # Log the user's message and Lyra's reply
-    print(f"User: {chat_request.message}")
-    print(f"Vani: {reply_text}")    
+    session = chat_sessions.get(chat_request.session_id)
+    async with admission.admit(request, "/api/chat", None, CHAT):
+        reply_text = await process_chat_message(chat_request.message, session)
     
+    # Log sizes always; the message and reply text only for a sample of requests (LOG_BODY_SAMPLE_RATE)
+    fields: dict[str, object] = {"message_chars": len(chat_request.message), "reply_chars": len(reply_text)}
+    if sample_bodies():
+        fields.update(message_text=truncate(chat_request.message), reply_text=truncate(reply_text))
+    logger.info("chat reply", extra=fields)
+
     # Return the response in the format defined by ChatResponse
-    return ChatbotResponse(reply=reply_text)
+    return ChatbotResponse(reply=reply_text, session_id=session.id)
+
+
+@router.post("/chat/stream")
+async def handle_chat_stream_request(chat_request: ChatbotRequest):
+    """
+    Streaming variant of /chat: Vani's reply is sent token by token as
+    Server-Sent Events. The session ID is returned in the X-Session-ID header.
+    """
+    session = chat_sessions.get(chat_request.session_id)
+    response = sse_response(stream_chat_message(chat_request.message, session), endpoint="/api/chat/stream")
+    response.headers["X-Session-ID"] = session.id
+    return await admission.hold("/api/chat/stream", None, CHAT, response)
@@ -0,0 +1,65 @@
+"""Job routes: queue a long-running generation, then poll for its result."""
+
+import asyncio
+from typing import Any
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..core.admission import DETAILED, admission
+from ..core.chatbot_handler import improve_chatbot_prompt
+from ..core.jobs import JOB_LONG_POLL_MAX, job_queue
+from ..models.job_models import JobRequest
+from ..prompt_generator import gate_provider, generate
+
+router = APIRouter()
+
+# Kinds that need a provider.
+GENERATION_KINDS = ("short", "detailed")
+
+
+def _generation_runner(mode_name: str):
+    async def run(payload: dict[str, Any]) -> dict[str, Any]:
+        # The queue bounds jobs at the endpoint; the provider's gate is shared with the routes.
+        async with admission.slot(gate_provider(payload["task"], payload["provider"], mode_name), DETAILED):
+            result = await generate(payload["task"], payload["provider"], mode_name)
+        if not result.ok:
+            raise RuntimeError(result.text)
+        return {"prompt": result.text, "provider": result.provider, "cache": result.cache}
+
+    return run
+
+
+async def _improve_runner(payload: dict[str, Any]) -> dict[str, Any]:
+    return {"reply": await improve_chatbot_prompt(payload["task"])}
+
+
+# Short prompts are quick, so they are served ahead of detailed generations.
+job_queue.register("short", _generation_runner("short"), priority=0)
+job_queue.register("detailed", _generation_runner("detailed"), priority=1)
+job_queue.register("improve", _improve_runner, priority=1)
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(job_request: JobRequest):
+    """Queue a generation and return its ID straight away."""
+    if job_request.kind not in job_queue.kinds:
+        return JSONResponse({"error": f"Unknown job kind: {job_request.kind}"}, status_code=400)
+    if not job_request.task.strip():
+        return JSONResponse({"error": "Please provide a 'task'"}, status_code=400)
+    if job_request.kind in GENERATION_KINDS and not job_request.provider:
+        return JSONResponse({"error": "Please select a 'provider'"}, status_code=400)
+    try:
+        job = job_queue.submit(job_request.kind, job_request.model_dump(exclude={"kind"}))
+    except asyncio.QueueFull:
+        return JSONResponse({"error": "Too many jobs are queued. Please try again shortly."}, status_code=503, headers={"Retry-After": "1"})
+    return JSONResponse(job.to_dict(), status_code=202, headers={"Location": f"/jobs/{job.id}"})
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """The job's status and, once finished, its result. ``wait`` long-polls for up to that many seconds."""
+    job = await job_queue.get(job_id, wait=min(max(wait, 0), JOB_LONG_POLL_MAX))
+    if job is None:
+        return JSONResponse({"error": "Unknown or expired job"}, status_code=404)
+    return job
@@ -0,0 +1,45 @@
+"""Admin routes for on-demand profiles: list recent ones and download them."""
+
+import secrets
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from ..core.profiling import PROFILE_TOKEN, profiler
+
+router = APIRouter()
+
+FORMATS = ("speedscope", "collapsed", "lag")
+
+
+def _forbidden(request: Request) -> JSONResponse | None:
+    """With ``PROFILE_TOKEN`` set, the admin routes need it in ``X-Profile-Token``."""
+    if PROFILE_TOKEN and not secrets.compare_digest(request.headers.get("x-profile-token", ""), PROFILE_TOKEN):
+        return JSONResponse({"error": "A valid X-Profile-Token is required"}, status_code=403)
+    return None
+
+
+@router.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Recent profiles, newest first."""
+    if (denied := _forbidden(request)) is not None:
+        return denied
+    return {"profiles": [profile.summary() for profile in reversed(profiler.profiles)]}
+
+
+@router.get("/admin/profiles/{profile_id}")
+async def download_profile(request: Request, profile_id: str, format: str = "speedscope"):
+    """One profile as speedscope JSON, collapsed stacks (flamegraph.pl) or its loop-lag trace."""
+    if (denied := _forbidden(request)) is not None:
+        return denied
+    if format not in FORMATS:
+        return JSONResponse({"error": f"Unknown format: {format}; use one of {', '.join(FORMATS)}"}, status_code=400)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return JSONResponse({"error": "Unknown or expired profile"}, status_code=404)
+    filename = f"profile-{profile.id}"
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed(), headers={"Content-Disposition": f'attachment; filename="{filename}.collapsed.txt"'})
+    if format == "lag":
+        return {**profile.summary(), "lag": [{"t": t, "lag_ms": round(lag * 1000, 3)} for t, lag in profile.lag]}
+    return JSONResponse(profile.speedscope(), headers={"Content-Disposition": f'attachment; filename="{filename}.speedscope.json"'})
@@ -0,0 +1,275 @@
+"""Admission control and load shedding for the generation endpoints.
+
+Every endpoint and every provider has an ``AdmissionGate``. At most
+``limit`` requests run through a gate at once and at most ``queue`` more may
+wait, each for up to ``ADMISSION_QUEUE_TIMEOUT`` seconds. Anything beyond
+that is refused straight away with a 503 and ``Retry-After``. When the
+upstream slows down, the worker then sheds load instead of growing a backlog
+whose answers arrive after the clients have given up. Latency for the
+requests it does admit stays bounded.
+
+Waiters are admitted by priority class, then in arrival order: ``SHORT``
+prompts first, then ``CHAT``, then ``DETAILED`` generations. When a queue is
+full, a request of a better class displaces the worst waiter rather than
+being refused itself.
+
+``admit`` also cancels the work if the client disconnects while it runs, so
+no upstream call is made for an answer nobody will read. Streamed responses
+get the same from Starlette; ``hold`` keeps their slot until the stream ends.
+
+Upstream calls that are not made under a route's own gate (batch items,
+queued jobs and chat tool calls) take a slot in their provider's gate with
+``slot``, so every caller shares the same per-provider limit.
+"""
+
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from .metrics import counter, gauge, histogram
+
+ADMISSION_ENDPOINT_LIMIT = int(os.getenv("ADMISSION_ENDPOINT_LIMIT", "64"))
+ADMISSION_ENDPOINT_QUEUE = int(os.getenv("ADMISSION_ENDPOINT_QUEUE", "128"))
+ADMISSION_PROVIDER_LIMIT = int(os.getenv("ADMISSION_PROVIDER_LIMIT", "32"))
+ADMISSION_PROVIDER_QUEUE = int(os.getenv("ADMISSION_PROVIDER_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+# Optional per-gate "limit:queue" overrides, e.g. "/generate=16:32,llama=8:64"
+ADMISSION_OVERRIDES = os.getenv("ADMISSION_OVERRIDES", "")
+
+# Priority classes; lower is admitted first.
+SHORT, CHAT, DETAILED = 0, 1, 2
+PRIORITY_NAMES = {SHORT: "short", CHAT: "chat", DETAILED: "detailed"}
+
+admission_in_flight = gauge("admission_in_flight", "Requests admitted and running, per gate (endpoint or provider).", ("gate",))
+admission_queue_depth = gauge("admission_queue_depth", "Requests waiting for admission, per gate.", ("gate",))
+admission_wait_seconds = histogram("admission_wait_seconds", "Time admitted requests spent queued.", ("gate",))
+admission_shed = counter("admission_shed_total", "Requests refused with a 503: queue_full, timeout or displaced (by a higher priority class).", ("gate", "priority", "reason"))
+client_disconnects = counter("client_disconnects_total", "Requests whose work was cancelled because the client went away.", ("endpoint",))
+
+
+class Overloaded(Exception):
+    """Raised when a gate sheds a request; answered with a 503."""
+
+    def __init__(self, gate: str, reason: str, retry_after: int = ADMISSION_RETRY_AFTER):
+        super().__init__(f"{gate} is overloaded ({reason})")
+        self.gate = gate
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+class AdmissionGate:
+    """A concurrency limit with a bounded, prioritized wait queue."""
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def _update(self) -> None:
+        admission_in_flight.set(self.active, gate=self.name)
+        admission_queue_depth.set(len(self._waiters), gate=self.name)
+
+    def _shed(self, priority: int, reason: str) -> Overloaded:
+        admission_shed.inc(gate=self.name, priority=PRIORITY_NAMES.get(priority, str(priority)), reason=reason)
+        return Overloaded(self.name, reason)
+
+    async def acquire(self, priority: int) -> None:
+        """Wait for a slot; raises ``Overloaded`` if the request is shed instead."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._update()
+            return
+        if len(self._waiters) >= self.queue:
+            if not self._waiters or self._waiters[-1][0] <= priority:
+                raise self._shed(priority, "queue_full")
+            worst = self._waiters[-1]
+            self._waiters.pop()
+            worst[2].set_exception(self._shed(worst[0], "displaced"))
+        entry = (priority, next(self._order), asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, entry)
+        self._update()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(entry[2], self.timeout)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            raise self._shed(priority, "timeout") from None
+        except asyncio.CancelledError:
+            self._remove(entry)
+            if entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+                self.release()  # admitted just as the caller went away
+            raise
+        admission_wait_seconds.observe(time.perf_counter() - start, gate=self.name)
+
+    def _remove(self, entry: tuple[int, int, asyncio.Future]) -> None:
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            self._update()
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._waiters and self.active < self.limit:
+            _, _, future = self._waiters.pop(0)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+        self._update()
+
+
+class Ticket:
+    """Slots held in one or more gates; ``release`` is idempotent."""
+
+    def __init__(self, gates: list[AdmissionGate]):
+        self._gates = gates
+
+    def release(self) -> None:
+        gates, self._gates = self._gates, []
+        for gate in reversed(gates):
+            gate.release()
+
+
+class HeldResponse(Response):
+    """Sends ``inner`` and releases ``ticket`` once it is done, however it ends."""
+
+    def __init__(self, inner: Response, ticket: Ticket):
+        self.inner = inner
+        self.ticket = ticket
+        self.status_code = inner.status_code
+        self.background = None
+
+    @property
+    def headers(self):
+        return self.inner.headers
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.background is not None and self.inner.background is None:
+            self.inner.background = self.background
+        try:
+            await self.inner(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+class AdmissionController:
+    """One gate per endpoint and per provider, created on first use."""
+
+    def __init__(
+        self,
+        endpoint_limit: int = ADMISSION_ENDPOINT_LIMIT,
+        endpoint_queue: int = ADMISSION_ENDPOINT_QUEUE,
+        provider_limit: int = ADMISSION_PROVIDER_LIMIT,
+        provider_queue: int = ADMISSION_PROVIDER_QUEUE,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        overrides: dict[str, tuple[int, int]] | None = None,
+    ):
+        self.endpoint_limits = (endpoint_limit, endpoint_queue)
+        self.provider_limits = (provider_limit, provider_queue)
+        self.timeout = timeout
+        self.overrides = overrides or {}
+        self._gates: dict[str, AdmissionGate] = {}
+
+    def gate(self, name: str) -> AdmissionGate:
+        gate = self._gates.get(name)
+        if gate is None:
+            default = self.endpoint_limits if name.startswith("/") else self.provider_limits
+            limit, queue = self.overrides.get(name, default)
+            gate = self._gates[name] = AdmissionGate(name, limit, queue, self.timeout)
+        return gate
+
+    async def acquire(self, endpoint: str, provider: str | None, priority: int) -> Ticket:
+        """Take a slot in the endpoint's gate and then in the provider's; raises ``Overloaded``."""
+        held: list[AdmissionGate] = []
+        try:
+            for name in (endpoint, provider):
+                if name:
+                    gate = self.gate(name)
+                    await gate.acquire(priority)
+                    held.append(gate)
+        except BaseException:
+            Ticket(held).release()
+            raise
+        return Ticket(held)
+
+    @asynccontextmanager
+    async def slot(self, provider: str | None, priority: int) -> AsyncIterator[None]:
+        """Hold a slot in ``provider``'s gate alone, for upstream calls made outside ``admit``."""
+        ticket = await self.acquire("", provider, priority)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    @asynccontextmanager
+    async def admit(self, request: Request, endpoint: str, provider: str | None, priority: int) -> AsyncIterator[None]:
+        """Run the body once admitted; cancel it (raising ``ClientDisconnected``) if the client goes away."""
+        ticket = await self.acquire(endpoint, provider, priority)
+        task = asyncio.current_task()
+        if task is None:
+            ticket.release()
+            raise RuntimeError("admit() must run inside a task")
+        disconnected = False
+
+        async def watch() -> None:
+            nonlocal disconnected
+            # The body has been read, so the next message is the disconnect.
+            while (await request.receive())["type"] != "http.disconnect":
+                pass
+            disconnected = True
+            task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            if hasattr(task, "uncancel"):  # 3.11+: mark the cancellation as handled
+                task.uncancel()
+            client_disconnects.inc(endpoint=endpoint)
+            raise ClientDisconnected() from None
+        finally:
+            watcher.cancel()
+            ticket.release()
+
+    async def hold(self, endpoint: str, provider: str | None, priority: int, response: Response) -> Response:
+        """Admit a streamed response and keep its slots until it has been sent."""
+        return HeldResponse(response, await self.acquire(endpoint, provider, priority))
+
+
+def overloaded_response(request: Request, exc: Exception) -> Response:
+    retry_after = exc.retry_after if isinstance(exc, Overloaded) else ADMISSION_RETRY_AFTER
+    return JSONResponse({"error": "The service is busy. Please try again shortly."}, status_code=503, headers={"Retry-After": str(retry_after)})
+
+
+def disconnected_response(request: Request, exc: Exception) -> Response:
+    # Nobody is listening; 499 (as nginx logs it) keeps these apart from real errors in metrics.
+    return Response(status_code=499)
+
+
+def _parse_overrides(raw: str) -> dict[str, tuple[int, int]]:
+    overrides = {}
+    for item in raw.split(","):
+        name, _, limits = item.partition("=")
+        limit, _, queue = limits.partition(":")
+        if name.strip() and limit.strip():
+            overrides[name.strip()] = (int(limit), int(queue or 0))
+    return overrides
+
+
+admission = AdmissionController(overrides=_parse_overrides(ADMISSION_OVERRIDES))
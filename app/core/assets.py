@@ -0,0 +1,158 @@
+"""Front-end delivery for the prompt page.
+
+``Bundle`` turns the sources in ``app/static`` into the assets the
+page loads. The purged Tailwind utilities (``tailwind.css``) and
+``style.css`` are concatenated into one minified ``app.css``; ``main.js`` is
+served as written. Each asset is named after a hash of its content (e.g.
+``main.1a2b3c4d5e6f.js``), so browsers may cache it forever. Each is also
+compressed once, with gzip and, when the optional ``brotli`` package is
+installed, brotli.
+
+The ``/assets/{name}`` route serves them with an immutable ``Cache-Control``
+and the smallest encoding the client accepts. The page itself has no
+per-request content, so it is rendered once per process and served with an
+ETag. A browser revalidating it gets a 304 with no body.
+"""
+
+import gzip
+import hashlib
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.templating import Jinja2Templates
+
+try:
+    import brotli
+except ImportError:  # optional; without it only gzip variants are built
+    brotli = None
+
+STATIC_DIR = Path("app/static")
+# Served name -> source files in STATIC_DIR, concatenated in order.
+BUNDLES = {
+    "app.css": ("tailwind.css", "style.css"),
+    "main.js": ("main.js",),
+}
+CONTENT_TYPES = {".css": "text/css; charset=utf-8", ".js": "text/javascript; charset=utf-8", ".html": "text/html; charset=utf-8"}
+# Hashed names change whenever the content does, so the old URL can be cached forever.
+IMMUTABLE = "public, max-age=31536000, immutable"
+# The page keeps its URL, so browsers revalidate it (cheaply, with If-None-Match) on every load.
+REVALIDATE = "no-cache"
+# Preferred first when the client accepts several.
+ENCODINGS = ("br", "gzip", "identity")
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_SPACE = re.compile(r"\s+")
+_AROUND_PUNCTUATION = re.compile(r"\s*([{};])\s*")
+
+
+@dataclass(frozen=True)
+class Asset:
+    name: str
+    content_type: str
+    etag: str
+    cache_control: str
+    # Content-Encoding ("identity", "gzip", "br") -> body.
+    variants: dict[str, bytes] = field(repr=False)
+
+    def etag_for(self, encoding: str) -> str:
+        """Each encoding is a different representation, so it gets its own tag."""
+        return self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return any(self.etag_for(encoding) in tags for encoding in self.variants)
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and redundant whitespace; selectors and values are left alone."""
+    text = _SPACE.sub(" ", _COMMENT.sub("", text))
+    return _AROUND_PUNCTUATION.sub(r"\1", text).strip()
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    """The body in every supported encoding that is actually smaller than the original."""
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {"identity": body, **{encoding: data for encoding, data in variants.items() if len(data) < len(body)}}
+
+
+def make_asset(name: str, body: bytes, cache_control: str) -> Asset:
+    digest = hashlib.sha256(body).hexdigest()
+    return Asset(name, CONTENT_TYPES[Path(name).suffix], f'"{digest[:16]}"', cache_control, compress(body))
+
+
+class Bundle:
+    """The built assets, by their hashed name and by the name templates refer to them with."""
+
+    def __init__(self, static_dir: Path = STATIC_DIR, bundles: dict[str, tuple[str, ...]] = BUNDLES):
+        self.by_name: dict[str, Asset] = {}
+        self._urls: dict[str, str] = {}
+        for name, sources in bundles.items():
+            text = "\n".join((static_dir / source).read_text(encoding="utf-8") for source in sources)
+            if name.endswith(".css"):
+                text = minify_css(text)
+            body = text.encode("utf-8")
+            stem, suffix = name.rsplit(".", 1)
+            hashed = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}.{suffix}"
+            self.by_name[hashed] = make_asset(hashed, body, IMMUTABLE)
+            self._urls[name] = f"/assets/{hashed}"
+
+    def url(self, name: str) -> str:
+        """The content-hashed URL of ``name`` (e.g. "main.js"), for use in templates."""
+        return self._urls[name]
+
+
+_bundle: Bundle | None = None
+_pages: dict[str, Asset] = {}
+
+
+def bundle() -> Bundle:
+    """The asset bundle, built on first use."""
+    global _bundle
+    if _bundle is None:
+        _bundle = Bundle()
+    return _bundle
+
+
+def page(templates: Jinja2Templates, name: str) -> Asset:
+    """The rendered template ``name``, rendered once and then reused."""
+    rendered = _pages.get(name)
+    if rendered is None:
+        html = templates.get_template(name).render(asset_url=bundle().url)
+        rendered = _pages[name] = make_asset(name, html.encode("utf-8"), REVALIDATE)
+    return rendered
+
+
+def negotiate(accept_encoding: str, available: dict[str, bytes]) -> str:
+    """The preferred encoding in ``available`` that ``accept_encoding`` allows (``q=0`` refuses one)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 1.0 if encoding == "identity" else 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def serve(request: Request, asset: Asset) -> Response:
+    """``asset`` in the best encoding for ``request``, or a 304 when the client's copy is current."""
+    encoding = negotiate(request.headers.get("accept-encoding", ""), asset.variants)
+    headers = {"ETag": asset.etag_for(encoding), "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+    if asset.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.variants[encoding], media_type=asset.content_type, headers=headers)
@@ -0,0 +1,172 @@
+"""Response cache for generated prompts.
+
+Two tiers sit in front of the provider call:
+
+* ``LRUCache`` - in-process, bounded by entry count, with a TTL.
+* ``SQLiteCache`` - optional on-disk tier (``PROMPT_CACHE_PATH``) that
+  survives restarts, bounded by entry count with least-recently-used eviction.
+  It defaults to ``SHARED_STATE_PATH`` when that is set, so worker processes
+  share one tier.
+
+Keys combine provider, mode, model, a hash of the system prompt and the
+normalized task text (see ``cache_key``).
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from .metrics import counter
+from .shared_state import SHARED_STATE_PATH, connect
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "86400"))
+PROMPT_CACHE_PATH = os.getenv("PROMPT_CACHE_PATH", SHARED_STATE_PATH)
+PROMPT_CACHE_DISK_SIZE = int(os.getenv("PROMPT_CACHE_DISK_SIZE", "100000"))
+
+cache_hits = counter("prompt_cache_hits_total", "Prompt cache hits by tier.", ("tier",))
+cache_misses = counter("prompt_cache_misses_total", "Prompt cache misses.")
+cache_evictions = counter("prompt_cache_evictions_total", "Entries evicted to stay within the size bound.", ("tier",))
+
+
+def normalize_task(task: str) -> str:
+    """Case-fold and collapse whitespace so trivially different tasks share a key."""
+    return " ".join(task.lower().split())
+
+
+def cache_scope(provider: str, mode: str, model: str, system_prompt: str) -> str:
+    """Everything except the task that decides what a cached prompt is valid for."""
+    system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    return "\x1f".join((provider, mode, model, system_hash))
+
+
+def cache_key(provider: str, mode: str, model: str, system_prompt: str, task: str) -> str:
+    raw = "\x1f".join((cache_scope(provider, mode, model, system_prompt), normalize_task(task)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """In-process LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_SIZE, ttl: float = PROMPT_CACHE_TTL, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_evictions.inc(tier="memory")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class SQLiteCache:
+    """On-disk cache tier; the connection is opened on first use."""
+
+    def __init__(self, path: str, max_entries: int = PROMPT_CACHE_DISK_SIZE, ttl: float = PROMPT_CACHE_TTL, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS prompt_cache_accessed ON prompt_cache (accessed_at)")
+        return self._conn
+
+    def get(self, key: str) -> str | None:
+        now = self._clock()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, expires_at FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE prompt_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = self._clock()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO prompt_cache VALUES (?, ?, ?, ?)", (key, value, now + self.ttl, now))
+            (count,) = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute("DELETE FROM prompt_cache WHERE key IN (SELECT key FROM prompt_cache ORDER BY accessed_at LIMIT ?)", (excess,))
+                cache_evictions.inc(excess, tier="disk")
+            conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ResponseCache:
+    """Memory tier backed by an optional disk tier; disk I/O runs off the event loop."""
+
+    def __init__(self, memory: LRUCache, disk: SQLiteCache | None = None):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> tuple[str | None, str | None]:
+        """Return ``(value, tier)``; ``tier`` is ``"memory"``, ``"disk"`` or ``None`` on a miss."""
+        value = self.memory.get(key)
+        if value is not None:
+            cache_hits.inc(tier="memory")
+            return value, "memory"
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+                cache_hits.inc(tier="disk")
+                return value, "disk"
+        cache_misses.inc()
+        return None, None
+
+    async def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value)
+
+
+def build_cache() -> ResponseCache:
+    disk = SQLiteCache(PROMPT_CACHE_PATH) if PROMPT_CACHE_PATH else None
+    return ResponseCache(LRUCache(), disk)
+
+
+prompt_cache = build_cache()
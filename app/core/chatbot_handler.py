@@ -1,212 +1,194 @@
 import logging
 import httpx
-from together import Together
-import asyncio
-from pathlib import Path
-
-# Ensure logs are written to the project root (AI-tools)
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-LOG_FILE = PROJECT_ROOT / "chatbot_handler.log"
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(str(LOG_FILE)),
-    ]
-)
-
-# load_dotenv()
-client = Together()  # Uses TOGETHER_API_KEY from environment
-
-async def improve_chatbot_prompt(prompt: str) -> str:   
-    # The system prompt is updated to request Markdown output with specific headings.
-    await asyncio.sleep(1)
-    system_prompt = """
-                    ##You are Vani, a master-level AI prompt optimization specialist. Your mission: transform any user prompt into precision-crafted prompts that unlock AI's full potential across all platforms.
-                    ## THE 4-D METHODOLOGY
-
-                    ### 1. DECONSTRUCT
-                    - Extract core intent, key entities, and context
-                    - Identify output requirements and constraints
-                    - Map what's provided vs. what is missing
+import os
+import time
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Sequence
 
-                    ### 2. DIAGNOSE
-                    - Audit for clarity gaps and ambiguity
-                    - Check specificity and completeness
-                    - Assess structure and complexity needs
+from .admission import CHAT, Overloaded, admission
+from .commands import Command, CommandRegistry, chat_timeouts  # noqa: F401  (chat_timeouts re-exported)
+from .generation_controls import TokenBudget
+from .prompt_templates import load_template, record_prompt_cost
+from .providers import extract_content, registry
+from .routing import ROUTING_ENABLED, Decision, router
+from .sessions import Session, chat_sessions
+from .singleflight import SingleFlight
 
-                    ### 3. DEVELOP
-                    - Select optimal techniques based on request type:
-                    * **Creative** → Multi-perspective + tone emphasis  
-                    * **Technical** → Constraint-based + precision focus  
-                    * **Educational** → Few-shot examples + clear structure  
-                    * **Complex** → Chain-of-thought + systematic frameworks
-                    - Assign appropriate AI role/expertise
-                    - Enhance context and implement logical structure
+logger = logging.getLogger(__name__)
 
-                    ### 4. DELIVER
-                    - Construct optimized prompt
-                    - Format based on mode complexity
-                    - Provide implementation guidance
+VANI_SYSTEM_PROMPT = load_template("vani_system").text
+VANI_USER_PREFIX = "user prompt: "
+record_prompt_cost("/api/chat", "vani", VANI_SYSTEM_PROMPT, VANI_USER_PREFIX)
+record_prompt_cost("/api/chat/stream", "vani", VANI_SYSTEM_PROMPT, VANI_USER_PREFIX)
 
-                    ## OPTIMIZATION TECHNIQUES
+# max_tokens per command, sized from the user's text instead of a flat 1000.
+REPLY_BUDGETS = {
+    "improve": TokenBudget(base=400, per_input_token=3.0, ceiling=1000),
+    "ask": TokenBudget(base=600, per_input_token=2.0, ceiling=1000),
+}
 
-                    **Foundational:** Role assignment, context layering, output specs, task decomposition
 
-                    **Advanced:** Chain-of-thought, few-shot learning, multi-perspective analysis, constraint optimization
+TIMEOUT_REPLY = "Sorry, that took longer than expected. Please try again in a moment."
 
-                    **Platform Notes:**
-                    - **ChatGPT/GPT-4:** Structured sections, conversation starters
-                    - **Claude:** Longer context, reasoning frameworks
-                    - **Gemini:** Creative tasks, comparative analysis
-                    - **Others:** Apply universal best practices
+# Concurrent identical chat requests share one upstream call.
+chat_flight = SingleFlight("chat")
 
-                    ## OPERATING MODES
 
-                    **DETAIL MODE:**  
-                    - Gather context with smart defaults  
-                    - Ask 2-3 targeted clarifying questions  
-                    - Provide comprehensive optimization
-
-                    **BASIC MODE:**  
-                    - Quick fix primary issues  
-                    - Apply core techniques only  
-                    - Deliver ready-to-use prompt
+async def _complete(provider: str, messages: list[dict[str, str]], max_tokens: int = 1000) -> str:
+    """Run a chat completion, mapping failures to user-facing RuntimeErrors."""
+    try:
+        async with admission.slot(provider, CHAT):
+            response = await registry.get(provider).chat(messages=messages, max_tokens=max_tokens)
+        content = extract_content(response)
+        if content:
+            return content
+        else:
+            raise RuntimeError("No content received from AI service.")
+    except Overloaded:
+        raise
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error occurred: {e}")
+        raise RuntimeError(
+            f"Sorry, I encountered an error with the AI service: {e.response.status_code}"
+        )
+    except httpx.TimeoutException as e:
+        logger.error(f"Upstream timed out: {e!r}")
+        raise RuntimeError(TIMEOUT_REPLY)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+        raise RuntimeError("Sorry, I encountered an unexpected error. Please try again later.")
 
-                    ## RESPONSE FORMATS
 
-                    **Simple Requests:**
+def _improve_messages(prompt: str, history: Sequence[dict[str, str]]) -> list[dict[str, str]]:
+    return [
+        {"role": "system", "content": VANI_SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": f"{VANI_USER_PREFIX}{prompt}"},
+    ]
 
-                    **Your Optimized Prompt:**  
-                    [Improved prompt]
 
-                    **What Changed:** [Key improvements]
+def _route(default: str, text: str) -> tuple[str, Decision | None]:
+    """The provider for a chat tool call: ``default``, or with ROUTING_ENABLED the smallest adequate one."""
+    if not ROUTING_ENABLED:
+        return default, None
+    decision = router.route(text, "chat")
+    return decision.provider, decision
 
-                    **Complex Requests:**
 
-                    **Your Optimized Prompt:**  
-                    [Improved prompt]
+async def _timed(decision: Decision | None, call: Awaitable[str]) -> str:
+    """Await ``call``, recording its latency against the routed tier."""
+    start = time.perf_counter()
+    reply = await call
+    if decision is not None:
+        router.observe(decision, time.perf_counter() - start)
+    return reply
 
-                    **Key Improvements:**  
-                    [Primary changes and benefits]
 
-                    **Techniques Applied:** [Brief mention]
+def _flight_key(provider: str, messages: Sequence[dict[str, str]]) -> tuple:
+    # Keyed on everything sent: the system prompt tells the tools apart, and a conversation only coalesces with itself.
+    return (provider, tuple((message["role"], message["content"]) for message in messages))
 
-                    **Pro Tip:** [Usage guidance]
 
-                    ## WELCOME MESSAGE (REQUIRED)
+async def improve_chatbot_prompt(prompt: str, history: Sequence[dict[str, str]] = ()) -> str:
+    # The system prompt is updated to request Markdown output with specific headings.
+    logger.info("Async: Improving prompt", extra={"command": "improve", "chars": len(prompt)})
+    messages = _improve_messages(prompt, history)
+    provider, decision = _route("vani", prompt)
+    return await chat_flight.do(_flight_key(provider, messages), lambda: _timed(decision, _complete(provider, messages, REPLY_BUDGETS["improve"].for_task(prompt))))
 
-                    When activated, display EXACTLY:
 
-                    "Hello! I'm Vani, your AI prompt optimizer. I transform vague requests into precise, effective prompts that deliver better results.
+async def stream_improved_prompt(prompt: str, history: Sequence[dict[str, str]] = ()) -> AsyncGenerator[str, None]:
+    logger.info("Async: Improving prompt (stream)", extra={"command": "improve", "chars": len(prompt)})
+    provider, decision = _route("vani", prompt)
+    async for delta in _stream_completion(provider, _improve_messages(prompt, history), REPLY_BUDGETS["improve"].for_task(prompt), decision):
+        yield delta
 
-                    **What I need to know:**  
-                    *Target AI:* ChatGPT, Claude, Gemini, or Other  
-                    *Prompt Style:* DETAIL (I'll ask clarifying questions first) or BASIC (quick optimization)
 
-                    **Examples:**  
-                    *DETAIL using ChatGPT - Write me a marketing email*  
-                    *BASIC using Claude - Help with my resume*
+async def search_internet(query: str, history: Sequence[dict[str, str]] = ()) -> str:
+    """
+    Simulates an async search on the internet.
+    """
+    logger.info("Async: Searching internet", extra={"command": "search", "chars": len(query)})
+    return f"Searching the web for '{query}'... Here are the top results I found."
 
-                    Just share your rough prompt and I'll handle the optimization!"
+async def ask_gpt(question: str, history: Sequence[dict[str, str]] = ()) -> str:
+    logger.info("Async: Asking GPT model", extra={"command": "ask", "chars": len(question)})
+    messages = [*history, {"role": "system", "content": question}]
+    provider, decision = _route("gpt", question)
+    return await chat_flight.do(_flight_key(provider, messages), lambda: _timed(decision, _complete(provider, messages, REPLY_BUDGETS["ask"].for_task(question))))
 
-                    ## PROCESSING FLOW
 
-                    1. Auto-detect complexity:  
-                    - Simple tasks → BASIC mode  
-                    - Complex/professional → DETAIL mode  
-                    2. Inform user, allow override option  
-                    3. Execute chosen mode protocol  
-                    4. Deliver optimized prompt
+async def stream_gpt_answer(question: str, history: Sequence[dict[str, str]] = ()) -> AsyncGenerator[str, None]:
+    provider, decision = _route("gpt", question)
+    async for delta in _stream_completion(provider, [*history, {"role": "system", "content": question}], REPLY_BUDGETS["ask"].for_task(question), decision):
+        yield delta
 
-                    **Memory Note:** Do not save any information from optimization sessions to memory.                   
-                """
 
+async def _stream_completion(provider: str, messages: list[dict[str, str]], max_tokens: int = 1000, decision: Decision | None = None) -> AsyncIterator[str]:
+    """Stream a chat completion, mapping failures to the same messages as the non-streaming calls."""
     try:
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-            messages=[
-                {"role": "system", "content": system_prompt },
-                {"role": "user", "content": f"user prompt: {prompt}"}
-            ],
-            max_tokens=1000,
-            stream=False
-        )
-        if response.choices and response.choices[0].message.content:  # type: ignore
-            content = response.choices[0].message.content  # type: ignore
-            if isinstance(content, str):
-                return content
-            elif isinstance(content, list):
-                return " ".join(str(item) for item in content)
-            else:
-                return str(content)
-        else:
-            raise RuntimeError("No content received from AI service.")
+        async with admission.slot(provider, CHAT):
+            start = time.perf_counter()
+            async for delta in registry.get(provider).stream_chat(messages, max_tokens=max_tokens):
+                yield delta
+        if decision is not None:
+            router.observe(decision, time.perf_counter() - start)
+    except Overloaded:
+        raise
     except httpx.HTTPStatusError as e:
-        logging.error(f"HTTP error occurred: {e}")
+        logger.error(f"HTTP error occurred: {e}")
         raise RuntimeError(
             f"Sorry, I encountered an error with the AI service: {e.response.status_code}"
         )
+    except httpx.TimeoutException as e:
+        logger.error(f"Upstream timed out: {e!r}")
+        raise RuntimeError(TIMEOUT_REPLY)
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         raise RuntimeError("Sorry, I encountered an unexpected error. Please try again later.")
-async def search_internet(query: str) -> str:
+
+
+# Chat tools, their trigger phrases, latency budgets (seconds) and concurrency limits.
+# When a budget is exceeded the call is cancelled and the user gets TIMEOUT_REPLY instead.
+commands = CommandRegistry(timeout_reply=TIMEOUT_REPLY)
+commands.register(Command(
+    "improve", ("improve my prompt:",), improve_chatbot_prompt, stream_improved_prompt,
+    deadline=float(os.getenv("CHAT_DEADLINE_IMPROVE", "45")),
+    concurrency=int(os.getenv("CHAT_CONCURRENCY_IMPROVE", "16")),
+))
+commands.register(Command(
+    "search", ("search the internet for",), search_internet,
+    deadline=float(os.getenv("CHAT_DEADLINE_SEARCH", "5")),
+    concurrency=int(os.getenv("CHAT_CONCURRENCY_SEARCH", "32")),
+))
+# Default to the general 'ask_gpt' function if no specific command is found
+commands.register(Command(
+    "ask", ("ask gpt:",), ask_gpt, stream_gpt_answer,
+    deadline=float(os.getenv("CHAT_DEADLINE_ASK", "30")),
+    concurrency=int(os.getenv("CHAT_CONCURRENCY_ASK", "16")),
+), default=True)
+
+
+async def process_chat_message(message: str, session: Session | None = None) -> str:
     """
-    Simulates an async search on the internet.
+    The main async handler function. It routes the user's message to the correct services,
+    running several requested tools at once. With a ``session``, earlier turns are sent as
+    context and this exchange is stored.
     """
-    print(f"Async: Searching internet for: {query}")
-    await asyncio.sleep(0.5) # Simulates network delay
-    return f"Searching the web for '{query}'... Here are the top results I found."
+    reply = await commands.run(commands.parse(message), chat_sessions.history(session))
+    if session is not None and TIMEOUT_REPLY not in reply:
+        chat_sessions.add_exchange(session, message, reply)
+    return reply
 
-async def ask_gpt(question: str) -> str:
-    logging.info(f"Async: Asking dummy GPT model: {question}")
-    await asyncio.sleep(0.5) # Simulates network delay
-    try:
-        response = client.chat.completions.create(
-            model="openai/gpt-oss-20b",
-            messages=[
-                {"role": "system", "content": question },
-            ],
-            max_tokens=1000,
-            stream=False
-        )
-        if response.choices and response.choices[0].message.content:  # type: ignore
-            content = response.choices[0].message.content  # type: ignore
-            if isinstance(content, str):
-                return content
-            elif isinstance(content, list):
-                return " ".join(str(item) for item in content)
-            else:
-                return str(content)
-        else:
-            raise RuntimeError("No content received from AI service.")
-    except httpx.HTTPStatusError as e:    
-        logging.error(f"HTTP error occurred: {e}")
-        raise RuntimeError(
-            f"Sorry, I encountered an error with the AI service: {e.response.status_code}"
-        )
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        raise RuntimeError("Sorry, I encountered an unexpected error. Please try again later.")
-async def process_chat_message(message: str) -> str:
+
+async def stream_chat_message(message: str, session: Session | None = None) -> AsyncIterator[str]:
     """
-    The main async handler function. It routes the user's message to the correct service.
+    Streaming variant of ``process_chat_message``: yields reply tokens as they arrive.
     """
-    if message.lower().startswith("improve my prompt:"):
-        user_prompt = message[len("improve my prompt:"):].strip()
-        logging.info(f"Async: Improving prompt: {user_prompt}") 
-        return await improve_chatbot_prompt(user_prompt)
-    
-    elif message.lower().startswith("search the internet for"):
-        query = message[len("search the internet for"):].strip()
-        return await search_internet(query)
-        
-    elif message.lower().startswith("ask gpt:"):
-        question = message[len("ask gpt:"):].strip()
-        return await ask_gpt(question)
-        
-    else:
-        # Default to the general 'ask_gpt' function if no specific command is found
-        return await ask_gpt(message)   
\ No newline at end of file
+    parts = []
+    async for delta in commands.stream(commands.parse(message), chat_sessions.history(session)):
+        parts.append(delta)
+        yield delta
+    # Failed streams raise before getting here, so only complete replies are stored.
+    reply = "".join(parts)
+    if session is not None and reply and TIMEOUT_REPLY not in reply:
+        chat_sessions.add_exchange(session, message, reply)
@@ -0,0 +1,178 @@
+"""Chat command registry.
+
+Each command declares its trigger phrases, a latency budget and how many of
+its calls may run at once. ``CommandRegistry.parse`` splits a message into
+``(command, argument)`` calls in a single regex pass. A command can start the
+message or follow a separator: a newline, ";", "," or "and"/"then"/"also".
+Text before the first trigger goes to the default command.
+
+``run`` executes every call in a message concurrently. Each call gets its
+own deadline; a call that overruns it is cancelled and replaced by
+``timeout_reply``, without affecting the others. The replies are joined in
+message order, so a multi-step message takes as long as its slowest step,
+not the sum.
+"""
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Sequence
+
+from .metrics import counter
+
+logger = logging.getLogger(__name__)
+
+chat_timeouts = counter("chat_timeouts_total", "Chat commands that exceeded their latency budget.", ("command",))
+chat_commands = counter("chat_commands_total", "Chat commands run, by whether the message asked for one command or several.", ("command", "fanout"))
+
+# Separates replies when one message runs several commands.
+REPLY_SEPARATOR = "\n\n"
+
+
+@dataclass
+class Command:
+    """A chat tool: ``run(argument, history)`` returns the reply; ``stream`` (optional) yields it in pieces."""
+
+    name: str
+    triggers: tuple[str, ...]
+    run: Callable[[str, Sequence[dict[str, str]]], Awaitable[str]]
+    stream: Callable[[str, Sequence[dict[str, str]]], AsyncGenerator[str, None]] | None = None
+    deadline: float = 30.0
+    concurrency: int = 16
+    _semaphore: asyncio.Semaphore | None = field(default=None, repr=False)
+    _loop: asyncio.AbstractEventLoop | None = field(default=None, repr=False)
+
+    def limit(self) -> asyncio.Semaphore:
+        """The per-command concurrency limit, bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.concurrency), loop
+        return self._semaphore
+
+
+Call = tuple[Command, str]
+
+
+def _argument(text: str) -> str:
+    """A command's argument, without the separator that came before the next command."""
+    return text.strip().rstrip(",;").rstrip()
+
+
+def _count(calls: list[Call]) -> None:
+    fanout = "single" if len(calls) == 1 else "multi"
+    for command, _ in calls:
+        chat_commands.inc(command=command.name, fanout=fanout)
+
+
+class CommandRegistry:
+    def __init__(self, timeout_reply: str):
+        self.timeout_reply = timeout_reply
+        self._commands: dict[str, Command] = {}
+        self._by_trigger: dict[str, Command] = {}
+        self._default: Command | None = None
+        self._pattern: re.Pattern | None = None
+
+    def __getitem__(self, name: str) -> Command:
+        return self._commands[name]
+
+    def register(self, command: Command, default: bool = False) -> Command:
+        self._commands[command.name] = command
+        for trigger in command.triggers:
+            self._by_trigger[trigger.lower()] = command
+        if default:
+            self._default = command
+        # Longest triggers first, so one that extends another wins.
+        triggers = sorted(self._by_trigger, key=len, reverse=True)
+        self._pattern = re.compile(rf"(?:^|[\n;,]|\s(?:and then|and|then|also))\s*({'|'.join(map(re.escape, triggers))})", re.IGNORECASE)
+        return command
+
+    def parse(self, message: str) -> list[Call]:
+        """Split ``message`` into the commands it asks for, in order."""
+        matches = list(self._pattern.finditer(message)) if self._pattern else []
+        calls: list[Call] = []
+        leading = _argument(message[: matches[0].start() if matches else len(message)])
+        if leading or not matches:
+            if self._default is None:
+                raise LookupError("No command matches the message and there is no default command")
+            calls.append((self._default, leading))
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(message)
+            calls.append((self._by_trigger[match.group(1).lower()], _argument(message[match.end() : end])))
+        return calls
+
+    async def run_one(self, command: Command, argument: str, history: Sequence[dict[str, str]]) -> str:
+        """Run one call within its deadline and concurrency limit; the timeout reply if it overruns."""
+
+        async def limited() -> str:
+            async with command.limit():
+                return await command.run(argument, history)
+
+        try:
+            return await asyncio.wait_for(limited(), timeout=command.deadline)
+        except asyncio.TimeoutError:
+            chat_timeouts.inc(command=command.name)
+            logger.warning(f"Chat command '{command.name}' exceeded its {command.deadline}s budget")
+            return self.timeout_reply
+
+    async def run(self, calls: list[Call], history: Sequence[dict[str, str]]) -> str:
+        """Run ``calls`` concurrently and join their replies in order.
+
+        A single failing call raises as before. With several, a failure only
+        replaces that call's reply with its error message.
+        """
+        _count(calls)
+        if len(calls) == 1:
+            return await self.run_one(*calls[0], history)
+        results = await asyncio.gather(*(self.run_one(command, argument, history) for command, argument in calls), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return REPLY_SEPARATOR.join(str(result) for result in results)
+
+    async def stream(self, calls: list[Call], history: Sequence[dict[str, str]]) -> AsyncIterator[str]:
+        """Stream the first call's reply as it is generated while the others run alongside it.
+
+        Their replies follow, in order, as soon as the first one is complete.
+        """
+        _count(calls)
+        (first, argument), rest = calls[0], calls[1:]
+        pending = [asyncio.ensure_future(self.run_one(command, arg, history)) for command, arg in rest]
+        try:
+            if first.stream is None:
+                yield await self.run_one(first, argument, history)
+            else:
+                async for delta in self._within_deadline(first, first.stream(argument, history)):
+                    yield delta
+            for task in pending:
+                try:
+                    reply = await task
+                except Exception as e:
+                    reply = str(e)
+                yield f"{REPLY_SEPARATOR}{reply}"
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _within_deadline(self, command: Command, chunks: AsyncGenerator[str, None]) -> AsyncIterator[str]:
+        """Relay ``chunks`` until the command's budget runs out, then cancel the stream."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + command.deadline
+        try:
+            async with command.limit():
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        chat_timeouts.inc(command=command.name)
+                        logger.warning(f"Streaming chat command '{command.name}' exceeded its {command.deadline}s budget")
+                        yield f"{REPLY_SEPARATOR}{self.timeout_reply}"
+                        return
+                    yield chunk
+        finally:
+            await chunks.aclose()
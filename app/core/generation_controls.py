@@ -0,0 +1,110 @@
+"""Server-side limits on how much the model generates.
+
+Models asked to "review" their own prompt append a Review section that the
+UI never shows. ``SectionCutter`` removes such trailing sections, both from
+complete replies and from token streams. Only heading-shaped lines count
+("Review:", "## Review", "**Review**"), so a task line that merely starts
+with the word ("Review the attached pull request") is kept. The matching
+stop sequences let the upstream stop generating them in the first place. ``TokenBudget`` sizes
+``max_tokens`` from the task's length instead of a flat ceiling. A reply that
+still runs into ``max_tokens`` is incomplete, so callers serve it but never
+cache it (counted in ``generation_truncated_total``).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+from .metrics import counter
+from .prompt_templates import estimate_tokens
+
+sections_cut = counter("generation_sections_cut_total", "Replies that still contained a trailing section and were cut server-side.", ("section",))
+replies_truncated = counter("generation_truncated_total", "Replies cut off at max_tokens; served but not cached.", ("provider", "mode"))
+
+# OpenAI-compatible APIs, Together's included, reject more than four stop sequences.
+MAX_STOP_SEQUENCES = 4
+
+# Markdown decoration allowed around a section heading: "## Review", "**Review:**", "- Review:".
+_DECORATION = " \t#*>_-"
+
+
+def _heading_pattern(names: str, boundary: str, line_end: str) -> re.Pattern[str]:
+    """A line opening one of ``names`` as a heading: after "#"s, or followed by ":", closing emphasis or the line end."""
+    return re.compile(
+        rf"^[ \t>]*(?:#{{1,6}}[ \t]+(?:\*\*|__)?(?:{names}){boundary}|(?:[-*+][ \t]+)?(?:\*\*|__)?(?:{names})(?:[ \t]*:|\*\*|__|[ \t]*{line_end}))",
+        re.MULTILINE,
+    )
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """``max_tokens`` of ``base`` plus ``per_input_token`` for each task token, capped at ``ceiling``."""
+
+    base: int
+    per_input_token: float = 0.0
+    ceiling: int = 1000
+
+    def for_task(self, text: str) -> int:
+        return min(self.ceiling, self.base + round(self.per_input_token * estimate_tokens(text)))
+
+
+class SectionCutter:
+    """Drops everything from the first line that opens one of ``headings``."""
+
+    def __init__(self, *headings: str):
+        self.headings = headings
+        names = "|".join(map(re.escape, headings))
+        self._pattern = _heading_pattern(names, r"(?!\w)", "$")
+        # Mid-stream, a heading only counts once the character after it has arrived.
+        self._stream_pattern = _heading_pattern(names, r"(?=\W)", r"(?=\n)")
+
+    def stop_sequences(self) -> list[str]:
+        """Upstream ``stop`` values for the usual ways a model opens these sections."""
+        return [form.format(heading) for heading in self.headings for form in ("\n{}:", "\n**{}", "\n## {}", "\n### {}")][:MAX_STOP_SEQUENCES]
+
+    def cut(self, text: str) -> str:
+        match = self._pattern.search(text)
+        if match is None:
+            return text
+        sections_cut.inc(section=self.headings[0])
+        return text[: match.start()].rstrip()
+
+    def _held(self, text: str) -> int:
+        """Length of the trailing partial line while it could still become a heading."""
+        tail = text[text.rfind("\n") + 1 :]
+        opening = tail.lstrip(_DECORATION)
+        for heading in self.headings:
+            if heading.startswith(opening) or (opening.startswith(heading) and not opening[len(heading) :].strip(_DECORATION + ":")):
+                return len(tail)
+        return 0
+
+    async def cut_stream(self, deltas: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Relay ``deltas`` up to the first cut section, then stop (closing ``deltas``).
+
+        Only a trailing partial line that might turn into a heading is held
+        back, so ordinary tokens are not delayed.
+        """
+        text, sent = "", 0
+        try:
+            async for delta in deltas:
+                text += delta
+                match = self._stream_pattern.search(text, text.rfind("\n", 0, sent) + 1)
+                if match is not None:
+                    break
+                ready = len(text) - self._held(text)
+                if ready > sent:
+                    yield text[sent:ready]
+                    sent = ready
+            else:
+                # The held last line is complete now; it may still be a heading.
+                match = self._pattern.search(text, text.rfind("\n", 0, sent) + 1)
+                if match is None:
+                    if sent < len(text):
+                        yield text[sent:]
+                    return
+            sections_cut.inc(section=self.headings[0])
+            rest = text[sent : match.start()].rstrip()
+            if rest:
+                yield rest
+        finally:
+            await deltas.aclose()
@@ -0,0 +1,158 @@
+"""Hedged requests and provider failover.
+
+``Hedger.run`` calls the requested provider first. If it fails, the next
+provider in its fallback chain is tried (failover). With hedging enabled, a
+backup call to the next provider is also fired when the primary is still
+running after its observed ``HEDGE_PERCENTILE`` latency; whichever succeeds
+first wins and the other call is cancelled.
+
+Chains come from ``PROVIDER_FALLBACKS``, e.g. ``"llama=gemma,openai;gemma=openai"``.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+from .metrics import counter
+
+T = TypeVar("T")
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Until a provider has this many samples, hedge after HEDGE_DEFAULT_DELAY seconds.
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "5"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+PROVIDER_FALLBACKS = os.getenv("PROVIDER_FALLBACKS", "llama=gemma,openai;openai=gemma,llama;gemma=openai,llama")
+
+hedges_fired = counter("hedge_fired_total", "Backup requests fired because the primary was slower than its hedge delay.", ("provider",))
+hedges_won = counter("hedge_wins_total", "Hedged requests won by the backup provider.", ("provider", "backup"))
+failovers = counter("provider_failovers_total", "Provider errors handed on to another provider in the fallback chain.", ("provider",))
+
+
+class LatencyWindow:
+    """The most recent successful call latencies for one provider."""
+
+    def __init__(self, size: int = HEDGE_WINDOW):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class Hedger:
+    """Runs a call against a provider chain with optional hedging."""
+
+    def __init__(
+        self,
+        fallbacks: dict[str, list[str]] | None = None,
+        enabled: bool = HEDGE_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        default_delay: float = HEDGE_DEFAULT_DELAY,
+        window: int = HEDGE_WINDOW,
+    ):
+        self.fallbacks = fallbacks or {}
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.window = window
+        self._latencies: dict[str, LatencyWindow] = {}
+
+    def chain(self, provider: str, available: Iterable[str] | None = None) -> list[str]:
+        """``provider`` followed by its fallbacks, keeping only ``available`` names."""
+        backups = self.fallbacks.get(provider, [])
+        if available is not None:
+            allowed = set(available)
+            backups = [name for name in backups if name in allowed]
+        return list(dict.fromkeys([provider, *backups]))
+
+    def latencies(self, provider: str) -> LatencyWindow:
+        window = self._latencies.get(provider)
+        if window is None:
+            window = self._latencies[provider] = LatencyWindow(self.window)
+        return window
+
+    def hedge_delay(self, provider: str) -> float:
+        window = self.latencies(provider)
+        if len(window) < self.min_samples:
+            return self.default_delay
+        return window.percentile(self.percentile)
+
+    async def _timed(self, provider: str, call: Callable[[str], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        result = await call(provider)
+        self.latencies(provider).observe(time.monotonic() - start)
+        return result
+
+    async def run(self, chain: list[str], call: Callable[[str], Awaitable[T]]) -> tuple[T, str]:
+        """Return ``(result, provider)`` from the first provider in ``chain`` to succeed.
+
+        Raises the last error if every provider fails.
+        """
+        if not chain:
+            raise RuntimeError("no candidates")
+        primary = chain[0]
+        remaining = list(chain)
+        pending: dict[asyncio.Future, str] = {}
+        hedge_at = time.monotonic() + self.hedge_delay(primary) if self.enabled else None
+        hedged = False
+        last_error: BaseException | None = None
+
+        def launch() -> None:
+            name = remaining.pop(0)
+            pending[asyncio.ensure_future(self._timed(name, call))] = name
+
+        launch()
+        try:
+            while pending:
+                # Hedge at most once, and only while the primary is the sole call in flight.
+                timeout = None
+                if hedge_at is not None and not hedged and remaining and list(pending.values()) == [primary]:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges_fired.inc(provider=primary)
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and primary in pending.values():
+                            hedges_won.inc(provider=primary, backup=name)
+                        return task.result(), name
+                    last_error = task.exception()
+                    if pending or remaining:
+                        failovers.inc(provider=name)
+                if not pending and remaining:
+                    launch()
+            # The loop only ends once every launched call has failed.
+            assert last_error is not None
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def parse_fallbacks(raw: str) -> dict[str, list[str]]:
+    fallbacks = {}
+    for item in raw.split(";"):
+        provider, _, chain = item.partition("=")
+        if provider.strip():
+            fallbacks[provider.strip()] = [name.strip() for name in chain.split(",") if name.strip()]
+    return fallbacks
+
+
+hedger = Hedger(parse_fallbacks(PROVIDER_FALLBACKS))
@@ -0,0 +1,80 @@
+"""Request instrumentation: where does the time go?
+
+``MetricsMiddleware`` times every HTTP request (including the full body of
+streamed responses) by route template, tracks requests in flight and counts
+unhandled exceptions by type. Provider calls report their own time through
+``add_upstream_time``, so each request's latency can be split into upstream
+time and our own overhead (queueing, rendering, serialization).
+"""
+
+import contextvars
+import time
+from typing import Any, Iterable
+
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import counter, gauge, histogram
+
+http_requests_in_flight = gauge("http_requests_in_flight", "HTTP requests currently being handled.", ("route",))
+http_request_duration_seconds = histogram("http_request_duration_seconds", "HTTP request latency, including streamed bodies.", ("method", "route", "status"))
+http_request_upstream_seconds = histogram("http_request_upstream_seconds", "Part of each request's latency spent waiting on upstream model calls.", ("route",))
+http_request_overhead_seconds = histogram("http_request_overhead_seconds", "Part of each request's latency not spent on upstream calls.", ("route",))
+http_exceptions = counter("http_exceptions_total", "Unhandled exceptions raised while handling a request.", ("route", "type"))
+
+# Seconds of upstream time accumulated by the current request; a list so tasks spawned from the request share it.
+_upstream_time: contextvars.ContextVar[list[float] | None] = contextvars.ContextVar("upstream_time", default=None)
+
+
+def add_upstream_time(seconds: float) -> None:
+    """Attribute ``seconds`` of upstream waiting to the request being handled, if any."""
+    total = _upstream_time.get()
+    if total is not None:
+        total[0] += seconds
+
+
+def route_template(routes: Iterable[BaseRoute], scope: Scope) -> str:
+    """The matching route's path template (``/generate``), so labels stay low-cardinality."""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed until their last byte."""
+
+    def __init__(self, app: ASGIApp, routes: Iterable[BaseRoute] = ()):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(self.routes, scope)
+        status: dict[str, Any] = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        upstream = [0.0]
+        token = _upstream_time.set(upstream)
+        http_requests_in_flight.inc(route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            http_exceptions.inc(route=route, type=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec(route=route)
+            _upstream_time.reset(token)
+            http_request_duration_seconds.observe(elapsed, method=scope["method"], route=route, status=str(status["code"]))
+            http_request_upstream_seconds.observe(upstream[0], route=route)
+            http_request_overhead_seconds.observe(max(0.0, elapsed - upstream[0]), route=route)
@@ -0,0 +1,219 @@
+"""Asynchronous jobs for long-running generations.
+
+``POST /jobs`` queues work and returns an ID at once. The client then polls
+or long-polls ``GET /jobs/{id}``, so a slow detailed generation no longer
+holds an HTTP connection open. A job also finishes, and its result is kept,
+when the client that submitted it has gone away.
+
+``JobQueue`` runs ``JOB_WORKERS`` worker tasks in-process that share one
+priority queue. Kinds with a lower priority number are served first: short
+prompts go ahead of detailed ones. At most ``JOB_QUEUE_MAX`` jobs may wait;
+beyond that ``submit`` raises ``asyncio.QueueFull``. Finished jobs are written
+to SQLite (``JOB_STORE_PATH``: the shared state database when one is set,
+otherwise ``jobs.sqlite3``), so results survive a restart, and expire after
+``JOB_RESULT_TTL`` seconds. At shutdown, ``drain`` lets queued and running
+jobs finish before ``close`` cancels what is left.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from .metrics import counter, gauge, histogram
+from .shared_state import SHARED_STATE_PATH, connect
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", SHARED_STATE_PATH or "jobs.sqlite3")
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_LONG_POLL_MAX = float(os.getenv("JOB_LONG_POLL_MAX", "30"))
+
+jobs_submitted = counter("jobs_submitted_total", "Jobs accepted into the queue.", ("kind",))
+jobs_rejected = counter("jobs_rejected_total", "Jobs refused because the queue was full.", ("kind",))
+jobs_finished = counter("jobs_finished_total", "Jobs that finished, by outcome (done / failed).", ("kind", "status"))
+job_queue_depth = gauge("job_queue_depth", "Jobs waiting for a worker.", ("kind",))
+job_wait_seconds = histogram("job_wait_seconds", "Time jobs spent queued before a worker picked them up.", ("kind",))
+job_run_seconds = histogram("job_run_seconds", "Time workers spent running jobs.", ("kind",))
+
+Runner = Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]
+
+
+class Job:
+    __slots__ = ("id", "kind", "payload", "status", "result", "error", "created_at", "done")
+
+    def __init__(self, kind: str, payload: dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.status = "queued"  # queued, running, done or failed
+        self.result: dict[str, Any] | None = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"id": self.id, "kind": self.kind, "status": self.status, "result": self.result, "error": self.error, "created_at": self.created_at}
+
+
+class JobStore:
+    """Finished jobs in SQLite; the connection is opened on first use."""
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: float = JOB_RESULT_TTL, clock: Callable[[], float] = time.time):
+        self.path = path or ":memory:"
+        self.ttl = ttl
+        self._clock = clock
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, record TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires_at)")
+        return self._conn
+
+    def put(self, record: dict[str, Any]) -> None:
+        now = self._clock()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (record["id"], json.dumps(record), now + self.ttl))
+            # Expired rows are cleared as new ones arrive; the index keeps this cheap.
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
+            conn.commit()
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._connect().execute("SELECT record, expires_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[1] <= self._clock():
+            return None
+        return json.loads(row[0])
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobQueue:
+    """Priority queue of jobs served by a pool of worker tasks, started on first use."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS, max_depth: int = JOB_QUEUE_MAX):
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self._runners: dict[str, tuple[int, Runner]] = {}
+        self._active: dict[str, Job] = {}
+        self._order = itertools.count()
+        self._queue: asyncio.PriorityQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def register(self, kind: str, runner: Runner, priority: int) -> None:
+        """Run jobs of ``kind`` with ``runner``; lower ``priority`` numbers are served first."""
+        self._runners[kind] = (priority, runner)
+
+    @property
+    def kinds(self) -> list[str]:
+        return list(self._runners)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def unfinished(self) -> int:
+        """Jobs queued or running."""
+        return len(self._active)
+
+    def _start(self) -> asyncio.PriorityQueue:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.PriorityQueue(maxsize=self.max_depth)
+            self._tasks = [asyncio.ensure_future(self._work(self._queue)) for _ in range(self.workers)]
+        return self._queue
+
+    def submit(self, kind: str, payload: dict[str, Any]) -> Job:
+        """Queue a job; raises ``KeyError`` for an unknown kind and ``asyncio.QueueFull`` when full."""
+        priority, _ = self._runners[kind]
+        queue = self._start()
+        job = Job(kind, payload)
+        try:
+            queue.put_nowait((priority, next(self._order), job))
+        except asyncio.QueueFull:
+            jobs_rejected.inc(kind=kind)
+            raise
+        self._active[job.id] = job
+        jobs_submitted.inc(kind=kind)
+        job_queue_depth.inc(kind=kind)
+        return job
+
+    async def get(self, job_id: str, wait: float = 0.0) -> dict[str, Any] | None:
+        """The job's current state, waiting up to ``wait`` seconds for it to finish; ``None`` if unknown or expired."""
+        job = self._active.get(job_id)
+        if job is None:
+            return await asyncio.to_thread(self.store.get, job_id)
+        if wait > 0:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return job.to_dict()
+
+    async def _work(self, queue: asyncio.PriorityQueue) -> None:
+        while True:
+            _, _, job = await queue.get()
+            job_queue_depth.dec(kind=job.kind)
+            job_wait_seconds.observe(time.time() - job.created_at, kind=job.kind)
+            job.status = "running"
+            start = time.perf_counter()
+            try:
+                job.result = await self._runners[job.kind][1](job.payload)
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "The server shut down before the job finished."
+                raise
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            finally:
+                job_run_seconds.observe(time.perf_counter() - start, kind=job.kind)
+                jobs_finished.inc(kind=job.kind, status=job.status)
+                await self._finish(job)
+
+    async def _finish(self, job: Job) -> None:
+        try:
+            await asyncio.to_thread(self.store.put, job.to_dict())
+        finally:
+            self._active.pop(job.id, None)
+            job.done.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait for queued and running jobs to finish; ``False`` if the timeout hit first."""
+        pending = [job.done.wait() for job in self._active.values()]
+        if not pending:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self) -> None:
+        """Stop the workers; jobs still queued or running are recorded as failed."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in list(self._active.values()):
+            job.status, job.error = "failed", "The server shut down before the job finished."
+            job_queue_depth.dec(kind=job.kind)
+            await self._finish(job)
+        self._queue = None
+
+
+job_queue = JobQueue(JobStore())
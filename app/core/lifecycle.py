@@ -0,0 +1,155 @@
+"""Startup and shutdown for the FastAPI lifespan.
+
+Startup optionally pre-warms the upstream connection pool (DNS, TCP and TLS)
+so the first user request does not pay for it; the worker only starts
+accepting requests once the lifespan has started.
+
+Shutdown drains: ``DrainMiddleware`` turns new requests away with a 503 and
+waits (up to ``SHUTDOWN_DRAIN_TIMEOUT``) for in-flight ones to finish before
+the job workers, the shared HTTP client and caches are closed.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .assets import bundle
+from .cache import prompt_cache
+from .jobs import job_queue
+from .logs import configure_logging, shutdown_logging
+from .metrics import gauge
+from .providers import aclose, registry
+from .ratelimit import limiters
+from .shared_state import shared_metrics
+
+UPSTREAM_PREWARM = os.getenv("UPSTREAM_PREWARM", "0") == "1"
+UPSTREAM_PREWARM_CONNECTIONS = int(os.getenv("UPSTREAM_PREWARM_CONNECTIONS", "4"))
+UPSTREAM_PREWARM_TIMEOUT = float(os.getenv("UPSTREAM_PREWARM_TIMEOUT", "5"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+app_startup_seconds = gauge("app_startup_seconds", "Time the lifespan startup took (including pre-warming).")
+app_draining = gauge("app_draining", "1 while the worker is draining in-flight requests before shutdown.")
+
+
+class Drain:
+    """Counts in-flight requests and lets shutdown wait for them to finish."""
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.draining = False
+        # Created by ``wait`` so it binds to the loop that is shutting down.
+        self._idle: asyncio.Event | None = None
+
+    def reset(self) -> None:
+        self.draining = False
+        app_draining.set(0)
+
+    def enter(self) -> None:
+        self.active += 1
+
+    def exit(self) -> None:
+        self.active -= 1
+        if self.active == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Stop admitting requests and wait for in-flight ones; ``False`` if the timeout hit first."""
+        self.draining = True
+        app_draining.set(1)
+        if self.active == 0:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class DrainMiddleware:
+    """Tracks HTTP requests in ``drain``; answers 503 once draining has started."""
+
+    def __init__(self, app: ASGIApp, drain: Drain):
+        self.app = app
+        self.drain = drain
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.drain.draining:
+            await send({"type": "http.response.start", "status": 503, "headers": [(b"content-type", b"text/plain"), (b"connection", b"close")]})
+            await send({"type": "http.response.body", "body": b"Server is shutting down"})
+            return
+        self.drain.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drain.exit()
+
+
+async def prewarm(connections: int = UPSTREAM_PREWARM_CONNECTIONS, timeout: float = UPSTREAM_PREWARM_TIMEOUT) -> int:
+    """Open ``connections`` keep-alive connections to the upstream; returns how many succeeded.
+
+    Each one is a cheap authenticated ``GET /models``; failures are logged
+    and never block startup beyond ``timeout``.
+    """
+    client = registry.http_client
+
+    async def one() -> bool:
+        try:
+            response = await client.get("/models", timeout=timeout)
+            await response.aclose()
+            return True
+        except Exception as e:
+            logger.warning(f"Upstream pre-warm request failed: {e!r}")
+            return False
+
+    results = await asyncio.gather(*(one() for _ in range(connections)))
+    return sum(results)
+
+
+@asynccontextmanager
+async def lifespan(drain: Drain, warm: bool = UPSTREAM_PREWARM, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> AsyncIterator[None]:
+    """Start up (optionally pre-warming) and, on exit, drain and release shared resources."""
+    start = time.perf_counter()
+    # Configured here rather than at import, so importing the app has no side effects.
+    configure_logging()
+    drain.reset()
+    # Hash and compress the front-end assets now rather than on the first page view.
+    await asyncio.to_thread(bundle)
+    if warm:
+        warmed = await prewarm()
+        logger.info(f"Pre-warmed {warmed} upstream connection(s)")
+    app_startup_seconds.set(time.perf_counter() - start)
+    # With several workers, each publishes its metrics so /metrics can report totals.
+    publisher = asyncio.ensure_future(shared_metrics.run()) if shared_metrics is not None else None
+    try:
+        yield
+    finally:
+        deadline = time.perf_counter() + drain_timeout
+        if not await drain.wait(drain_timeout):
+            logger.warning(f"Shutting down with {drain.active} request(s) still in flight after {drain_timeout}s")
+        # Queued and running jobs get the rest of the drain timeout before they are cancelled.
+        if not await job_queue.drain(max(deadline - time.perf_counter(), 0.0)):
+            logger.warning(f"Shutting down with {job_queue.unfinished()} job(s) unfinished after {drain_timeout}s")
+        await job_queue.close()
+        await aclose()
+        await asyncio.to_thread(job_queue.store.close)
+        if prompt_cache.disk is not None:
+            await asyncio.to_thread(prompt_cache.disk.close)
+        if publisher is not None and shared_metrics is not None:
+            publisher.cancel()
+            # A last snapshot, so nothing this worker counted is lost.
+            await asyncio.to_thread(shared_metrics.publish)
+            await asyncio.to_thread(shared_metrics.close)
+        if limiters.store is not None:
+            await asyncio.to_thread(limiters.store.close)
+        shutdown_logging()
@@ -0,0 +1,255 @@
+"""Rule-based prompt generation that needs no network.
+
+``render_local(task, mode)`` fills the structure the upstream is asked for
+(Persona / Task / Constraints / Audience / Tone & Style) from the task text
+alone. The persona and its constraints come from ``DOMAINS``, picked by
+keyword. Audience, tone, length and format are used only when the task states
+them. Everything is a dictionary lookup or a precompiled regex, so one call
+takes tens of microseconds.
+
+The result is plainer than a model's, but it is instant. It serves the
+explicit "local" provider and is the degraded-mode answer when the upstream
+fails or exceeds ``LOCAL_FALLBACK_BUDGET`` (see ``app.prompt_generator``).
+"""
+
+import re
+from dataclasses import dataclass
+
+from .metrics import counter
+
+LOCAL_PROVIDER = "local"
+
+local_fallbacks = counter("local_fallbacks_total", "Generations answered with the local prompt because the upstream failed or exceeded LOCAL_FALLBACK_BUDGET.", ("provider", "mode", "reason"))
+
+
+@dataclass(frozen=True)
+class Domain:
+    persona: str
+    keywords: frozenset[str]
+    constraints: tuple[str, ...]
+
+
+# Checked in order; the domain with the most keyword hits wins and ties go to the earlier one.
+DOMAINS = (
+    Domain(
+        "a senior software engineer who writes clean, well-tested, production-ready code",
+        frozenset("code coding python javascript typescript java sql function script api bug debug refactor program algorithm database backend frontend regex class unit test tests docker".split()),
+        (
+            "Provide complete, runnable code with the necessary imports.",
+            "Handle edge cases and invalid input explicitly.",
+            "Explain the key design decisions briefly after the code.",
+        ),
+    ),
+    Domain(
+        "an award-winning creative writer",
+        frozenset("poem poetry story stories haiku song lyrics novel fiction fairy tale screenplay script limerick sonnet".split()),
+        (
+            "Use vivid, concrete imagery and an original angle.",
+            "Keep a consistent voice and point of view throughout.",
+            "End with a memorable closing line.",
+        ),
+    ),
+    Domain(
+        "a seasoned marketing copywriter",
+        frozenset("marketing ad ads advert campaign slogan tagline seo product description landing page brand tweet post instagram linkedin newsletter sales".split()),
+        (
+            "Lead with the main benefit to the reader.",
+            "Include a clear call to action.",
+            "Keep sentences short and scannable.",
+        ),
+    ),
+    Domain(
+        "a professional business writer",
+        frozenset("email letter memo resume cv cover proposal report announcement invitation apology complaint meeting".split()),
+        (
+            "State the purpose in the first sentence.",
+            "Use a clear structure with a greeting, body and sign-off where appropriate.",
+            "Keep it concise and free of jargon.",
+        ),
+    ),
+    Domain(
+        "an experienced data analyst",
+        frozenset("data dataset analysis analyze analyse statistics statistical chart graph excel spreadsheet metrics kpi dashboard trend forecast".split()),
+        (
+            "State any assumptions about the data explicitly.",
+            "Support conclusions with specific figures.",
+            "Summarize the key findings before the details.",
+        ),
+    ),
+    Domain(
+        "an expert educator who explains complex topics clearly",
+        frozenset("explain teach lesson course tutorial essay research summary summarize summarise study learn quiz homework concept guide".split()),
+        (
+            "Build up from fundamentals to advanced points.",
+            "Use at least one concrete example or analogy.",
+            "Define technical terms when they first appear.",
+        ),
+    ),
+    Domain(
+        "a strategy consultant with startup and enterprise experience",
+        frozenset("business strategy startup pitch investor investors market competitor competitors revenue pricing growth roadmap swot".split()),
+        (
+            "Structure the answer around clear, prioritized recommendations.",
+            "Quantify impact, cost or effort where possible.",
+            "Call out the main risks and how to mitigate them.",
+        ),
+    ),
+    Domain(
+        "a certified nutrition and fitness coach",
+        frozenset("recipe recipes meal meals diet nutrition workout fitness exercise training health healthy cook cooking".split()),
+        (
+            "Give specific quantities, times or repetitions.",
+            "Note safety considerations and common mistakes.",
+            "Offer an easier and a harder variation where relevant.",
+        ),
+    ),
+    Domain(
+        "an experienced travel planner",
+        frozenset("travel trip itinerary vacation holiday tour visit destination hotel flight".split()),
+        (
+            "Organize the plan day by day or stop by stop.",
+            "Include practical details such as timing, transport and budget.",
+            "Suggest one local or lesser-known option.",
+        ),
+    ),
+)
+DEFAULT_PERSONA = "a domain expert with years of hands-on experience in the subject"
+GENERAL_CONSTRAINTS = (
+    "Be accurate and specific; avoid filler and generic statements.",
+    "Use Markdown headings or lists where they improve readability.",
+)
+
+# Words that start an instruction; anything else is framed as a request.
+VERBS = frozenset(
+    "write create draft generate compose design build develop make produce explain describe summarize summarise analyze analyse "
+    "compare list outline plan suggest recommend translate rewrite improve edit review fix debug refactor implement convert "
+    "teach prepare give find brainstorm propose calculate optimize optimise help tell".split()
+)
+# People a task can be "for"; "code for parsing" is a purpose, not an audience.
+AUDIENCES = frozenset(
+    "beginners novices students kids children teenagers teens developers engineers programmers executives managers "
+    "leaders customers clients investors teachers parents readers users audience team colleagues recruiters professionals "
+    "experts seniors adults employees stakeholders founders marketers designers scientists researchers nurses doctors".split()
+)
+TONES = frozenset("formal informal casual friendly professional humorous funny witty persuasive academic conversational playful serious empathetic inspirational motivational technical warm enthusiastic authoritative neutral sarcastic poetic".split())
+
+_WORDS = re.compile(r"[a-z0-9+#']+")
+_SPACE = re.compile(r"\s+")
+# "for"/"to" and up to four words; the audience runs up to the first word in AUDIENCES.
+# The words are a lookahead so that "to parse dates for beginners" also tries "for beginners".
+_AUDIENCE = re.compile(r"\b(?:for|aimed at|targeting|targeted at|to)\s+(?=((?:[\w-]+\s*){1,4}))", re.IGNORECASE)
+_NOT_AUDIENCE = frozenset("for to at in with about on of".split())
+_TONE = re.compile(r"\b(?:in|with|using)\s+an?\s+([a-z-]+(?:\s+(?:and|,)\s*[a-z-]+)?)\s+(?:tone|style|voice)\b|\b([a-z-]+)\s+(?:tone|style|voice)\b", re.IGNORECASE)
+_LENGTH = re.compile(r"\b(\d+)\s*(words?|sentences?|paragraphs?|lines?|bullet points?|bullets?|points?|steps?|tips?|ideas?|examples?|slides?|tweets?)\b", re.IGNORECASE)
+_FORMAT = re.compile(r"\b(?:as an?|in an?|in|as)\s+(table|bullet(?:ed)? list|numbered list|list|json|markdown|csv|yaml|outline|checklist)\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class TaskFacts:
+    """What the rules could read from a task description."""
+
+    task: str
+    persona: str
+    constraints: tuple[str, ...]
+    audience: str | None = None
+    tone: str | None = None
+    length: str | None = None
+    format: str | None = None
+
+
+def _domain(lowered: str) -> Domain | None:
+    words = set(_WORDS.findall(lowered))
+    best, best_hits = None, 0
+    for domain in DOMAINS:
+        hits = len(words & domain.keywords)
+        if hits > best_hits:
+            best, best_hits = domain, hits
+    return best
+
+
+def _audience(task: str) -> str | None:
+    for match in _AUDIENCE.finditer(task):
+        words = match.group(1).split()
+        for end, word in enumerate(words, 1):
+            if word.lower() in _NOT_AUDIENCE:
+                break
+            if word.lower() in AUDIENCES:
+                return " ".join(words[:end])
+    return None
+
+
+def _tone(task: str) -> str | None:
+    for match in _TONE.finditer(task):
+        tone = match.group(1) or match.group(2)
+        if any(word in TONES for word in _WORDS.findall(tone.lower())):
+            return tone
+    return None
+
+
+def _instruction(task: str) -> str:
+    if not task:
+        # Nothing to go on (a blank task): the prompt asks for the task rather than failing.
+        return "Ask what the task is before doing anything else."
+    first = task.split(" ", 1)[0].lower()
+    text = task[0].upper() + task[1:]
+    if first not in VERBS:
+        text = f"Produce the following: {task}"
+    return text if text.endswith((".", "!", "?")) else text + "."
+
+
+def extract(task: str) -> TaskFacts:
+    """Read persona, constraints, audience, tone, length and format from ``task``."""
+    task = _SPACE.sub(" ", task).strip()
+    lowered = task.lower()
+    domain = _domain(lowered)
+    length = _LENGTH.search(task)
+    format_ = _FORMAT.search(task)
+    return TaskFacts(
+        task=task,
+        persona=domain.persona if domain else DEFAULT_PERSONA,
+        constraints=(domain.constraints if domain else ()) + GENERAL_CONSTRAINTS,
+        audience=_audience(task),
+        tone=_tone(task),
+        length=f"{length.group(1)} {length.group(2).lower()}" if length else None,
+        format=format_.group(1).lower() if format_ else None,
+    )
+
+
+def detailed(facts: TaskFacts) -> str:
+    constraints = list(facts.constraints)
+    if facts.length:
+        constraints.insert(0, f"Length: {facts.length}, as requested.")
+    if facts.format:
+        constraints.insert(0, f"Format the answer as a {facts.format}.")
+    sections = [
+        f"### Persona\nYou are {facts.persona}.",
+        f"### Task\n{_instruction(facts.task)}",
+        "### Constraints\n" + "\n".join(f"- {line}" for line in constraints),
+    ]
+    if facts.audience:
+        sections.append(f"### Audience\nWrite for {facts.audience}; match their level of knowledge and interests.")
+    if facts.tone:
+        sections.append(f"### Tone & Style\nUse a {facts.tone} tone consistently.")
+    return "\n\n".join(sections)
+
+
+def short(facts: TaskFacts) -> str:
+    parts = [f"You are {facts.persona}.", _instruction(facts.task)]
+    if facts.audience:
+        parts.append(f"Write for {facts.audience}.")
+    if facts.tone:
+        parts.append(f"Use a {facts.tone} tone.")
+    if facts.format:
+        parts.append(f"Format it as a {facts.format}.")
+    if facts.length:
+        parts.append(f"Keep it to {facts.length}.")
+    parts.append(facts.constraints[0])
+    return " ".join(parts)
+
+
+RENDERERS = {"detailed": detailed, "short": short}
+
+
+def render_local(task: str, mode_name: str = "detailed") -> str:
+    """A prompt for ``task`` in the given mode ("detailed" or "short"), built without any network call."""
+    return RENDERERS[mode_name](extract(task))
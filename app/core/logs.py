@@ -0,0 +1,186 @@
+"""Non-blocking structured logging.
+
+Log calls on the event loop only format a record and put it on a bounded
+queue; a ``QueueListener`` thread writes JSON lines to stderr and, if
+``LOG_FILE`` is set, to a size-rotated file. When the queue is full, records
+are dropped and counted in ``log_records_dropped_total``, so logging never
+makes a request wait.
+
+``RequestContextMiddleware`` gives every request an ID (taken from an
+incoming ``X-Request-ID`` or generated). The ID is attached to every record
+logged while handling that request and echoed back in the response headers.
+Each request also gets one access record with its timing.
+"""
+
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import counter
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of chat requests whose message and reply text are logged (truncated to LOG_BODY_MAX_CHARS).
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "0"))
+LOG_BODY_MAX_CHARS = int(os.getenv("LOG_BODY_MAX_CHARS", "500"))
+
+log_records_dropped = counter("log_records_dropped_total", "Log records dropped because the log queue was full.")
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+access_logger = logging.getLogger("app.access")
+
+# Attributes every LogRecord has; anything else was passed via ``extra=`` and goes into the JSON.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request ID and any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RESERVED)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request ID; runs on the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that drops (and counts) records instead of blocking when full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve args and tracebacks now (they may not be safe to touch later), but leave JSON formatting to the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+
+class _Pipeline:
+    def __init__(self, handler: BoundedQueueHandler, listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.listener = listener
+
+
+_pipeline: _Pipeline | None = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    log_file: str = LOG_FILE,
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> None:
+    """Route the root logger through the queue to a background writer thread (idempotent)."""
+    global _pipeline
+    if _pipeline is not None:
+        return
+    formatter = JsonFormatter()
+    writers: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        writers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"))
+    for writer in writers:
+        writer.setFormatter(formatter)
+
+    handler = BoundedQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(handler.queue, *writers, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    _pipeline = _Pipeline(handler, listener)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _pipeline
+    if _pipeline is None:
+        return
+    logging.getLogger().removeHandler(_pipeline.handler)
+    _pipeline.listener.stop()
+    for writer in _pipeline.listener.handlers:
+        writer.close()
+    _pipeline = None
+
+
+def sample_bodies(rate: float | None = None) -> bool:
+    """Whether this request's message/reply text should be logged."""
+    rate = LOG_BODY_SAMPLE_RATE if rate is None else rate
+    return rate > 0 and random.random() < rate
+
+
+def truncate(text: str, limit: int = LOG_BODY_MAX_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class RequestContextMiddleware:
+    """Assigns a request ID, exposes it as ``X-Request-ID`` and writes one access record per request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = incoming[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            access_logger.info("request", extra={"method": scope["method"], "path": scope["path"], "status": status["code"], "duration_ms": duration_ms})
+            request_id_var.reset(token)
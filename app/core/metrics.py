@@ -0,0 +1,195 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+With several worker processes each one keeps its own values; ``snapshot``
+exports them and ``render(snapshots)`` merges the exports (see
+``shared_state.MetricsStore``).
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+_registry: list["Counter | Gauge | Histogram"] = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value as the text exposition format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """A monotonically increasing value, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> list[list]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def collect(self, snapshots: dict[str, list] | None = None) -> list[str]:
+        """Sample lines for this process, or summed over ``snapshots`` (one per worker)."""
+        if snapshots is None:
+            with self._lock:
+                items = sorted(self._values.items())
+        else:
+            totals: dict[tuple[str, ...], float] = defaultdict(float)
+            for values in snapshots.values():
+                for key, value in values:
+                    totals[tuple(key)] += value
+            items = sorted(totals.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}" for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down (e.g. requests in flight)."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def collect(self, snapshots: dict[str, list] | None = None) -> list[str]:
+        """Like ``Counter.collect``, but across workers each value keeps a ``worker`` label: levels do not always add up."""
+        if snapshots is None:
+            return super().collect()
+        items = sorted((tuple(key) + (worker,), value) for worker, values in snapshots.items() for key, value in values)
+        return [f"{self.name}{_format_labels(self.labelnames + ('worker',), key)} {value:g}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative bucketed observations (e.g. latencies in seconds), optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def sum(self, **labels: str) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> list[list]:
+        with self._lock:
+            return [[list(key), list(counts), self._sums[key]] for key, counts in self._counts.items()]
+
+    def collect(self, snapshots: dict[str, list] | None = None) -> list[str]:
+        """Sample lines for this process, or with buckets and sums added up over ``snapshots``."""
+        lines = []
+        if snapshots is None:
+            with self._lock:
+                items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        else:
+            merged: dict[tuple[str, ...], tuple[list[int], float]] = {}
+            for values in snapshots.values():
+                for key, counts, total in values:
+                    previous, previous_total = merged.get(tuple(key), ([0] * len(counts), 0.0))
+                    merged[tuple(key)] = ([a + b for a, b in zip(previous, counts)], previous_total + total)
+            items = sorted((key, counts, total) for key, (counts, total) in merged.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    """Create a counter and register it for ``/metrics``."""
+    metric = Counter(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    """Create a gauge and register it for ``/metrics``."""
+    metric = Gauge(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Create a histogram and register it for ``/metrics``."""
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def snapshot() -> dict[str, list]:
+    """Every registered metric's values in a JSON-serializable form."""
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def without_gauges(snapshot: dict[str, list]) -> dict[str, list]:
+    gauges = {metric.name for metric in _registry if metric.kind == "gauge"}
+    return {name: values for name, values in snapshot.items() if name not in gauges}
+
+
+def render(snapshots: dict[str, dict[str, list]] | None = None) -> str:
+    """Render every registered metric in the Prometheus text format.
+
+    ``snapshots`` maps worker IDs to ``snapshot()`` results; when given, the
+    output covers all of those workers instead of just this process.
+    """
+    lines: list[str] = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if snapshots is None:
+            lines.extend(metric.collect())
+        else:
+            lines.extend(metric.collect({worker: snapshot[metric.name] for worker, snapshot in snapshots.items() if metric.name in snapshot}))
+    return "\n".join(lines) + "\n"
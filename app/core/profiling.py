@@ -0,0 +1,321 @@
+"""On-demand request profiling.
+
+With ``PROFILING_ENABLED=1``, ``ProfilingMiddleware`` profiles a request
+when it carries ``X-Profile: 1``, or at random for ``PROFILE_SAMPLE_RATE`` of
+requests to ``PROFILE_PATHS``. If ``PROFILE_TOKEN`` is set, the header must
+carry that token instead of ``1``. A profile has two parts:
+
+* a statistical profile. A sampler thread reads the event-loop thread's stack
+  every ``PROFILE_INTERVAL`` seconds with ``sys._current_frames``, and also
+  the stacks of ``asyncio.to_thread`` workers while they run. Each stack is
+  rooted at "request" (the request's own task), "other" (another task
+  holding the loop) or "idle" (the loop waiting for I/O). Time the request
+  spends blocking the loop shows up under "request"; time it spends starved
+  by other work shows up under "other".
+* a loop-lag trace. A task sleeps ``PROFILE_LAG_INTERVAL`` and records how
+  late it wakes.
+
+The last ``PROFILE_KEEP`` profiles are kept in memory. They are served by
+``/admin/profiles`` as collapsed stacks (for flamegraph.pl or speedscope) or
+in speedscope's JSON format.
+
+When profiling is disabled the middleware is not installed at all. When it is
+enabled, a request that is not profiled costs one header lookup. The sampler
+thread and lag task run only while a profile is being captured.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .logs import request_id_var
+from .metrics import counter
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_PATHS = tuple(path.strip() for path in os.getenv("PROFILE_PATHS", "/generate,/api/chat").split(",") if path.strip())
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_LAG_INTERVAL = float(os.getenv("PROFILE_LAG_INTERVAL", "0.01"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_MAX_DEPTH = 128
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+profiles_captured = counter("profiles_captured_total", "Requests profiled, by what triggered the profile (header or sample).", ("trigger",))
+
+
+@dataclass
+class Profile:
+    """One profiled request: stack samples and the loop-lag trace."""
+
+    id: str
+    method: str
+    path: str
+    trigger: str
+    interval: float
+    request_id: str = "-"
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    status: int = 0
+    # Collapsed stack ("request;handler (app/main.py:117);...") -> samples.
+    stacks: Counter = field(default_factory=Counter)
+    # (seconds since start, lag seconds)
+    lag: list[tuple[float, float]] = field(default_factory=list)
+
+    def summary(self) -> dict[str, Any]:
+        lags = [lag for _, lag in self.lag]
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "status": self.status,
+            "samples": sum(self.stacks.values()),
+            "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 2),
+        }
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one ``frame;frame;... count`` line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self) -> dict[str, Any]:
+        frames: dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(name, len(frames)) for name in stack.split(";")])
+            weights.append(count * self.interval)
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": f"{self.method} {self.path} ({self.id})",
+            "exporter": "app.core.profiling",
+            "shared": {"frames": [{"name": name} for name in frames]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{self.method} {self.path}",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    """``filename`` relative to the longest ``sys.path`` entry containing it."""
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix):
+            return filename[len(prefix) :].lstrip("/\\")
+    return filename
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _stack(frame: FrameType | None) -> list[str]:
+    names: list[str] = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def _is_idle(frame: FrameType) -> bool:
+    """The loop thread is blocked in the selector, i.e. waiting for I/O or a timer."""
+    return frame.f_code.co_name in ("select", "poll", "control") and "selectors" in frame.f_code.co_filename
+
+
+def _is_worker_busy(frame: FrameType | None) -> bool:
+    """An executor thread running a work item, as opposed to waiting for one."""
+    while frame is not None:
+        if frame.f_code.co_name == "run" and frame.f_code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py")):
+            return True
+        frame = frame.f_back
+    return False
+
+
+@dataclass
+class _Capture:
+    profile: Profile
+    loop: asyncio.AbstractEventLoop
+    thread_id: int
+    task: asyncio.Task | None
+    start: float
+
+
+class Profiler:
+    """Runs the sampler thread and lag task while any capture is active; keeps finished profiles."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, lag_interval: float = PROFILE_LAG_INTERVAL, keep: int = PROFILE_KEEP):
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self.profiles: deque[Profile] = deque(maxlen=keep)
+        # id(capture) -> capture
+        self._active: dict[int, _Capture] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._lag_tasks: dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+        # When the lag task is next due to run, per loop; lateness against it is lag.
+        self._lag_due: dict[asyncio.AbstractEventLoop, float] = {}
+
+    def get(self, profile_id: str) -> Profile | None:
+        return next((profile for profile in self.profiles if profile.id == profile_id), None)
+
+    def start(self, method: str, path: str, trigger: str) -> _Capture:
+        """Begin profiling the calling task; must be called on the event loop."""
+        profile = Profile(uuid.uuid4().hex[:16], method, path, trigger, self.interval, request_id_var.get())
+        loop = asyncio.get_running_loop()
+        capture = _Capture(profile, loop, threading.get_ident(), asyncio.current_task(), time.perf_counter())
+        with self._lock:
+            self._active[id(capture)] = capture
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        if loop not in self._lag_tasks:
+            self._lag_due[loop] = loop.time()
+            self._lag_tasks[loop] = loop.create_task(self._trace_lag(loop))
+        profiles_captured.inc(trigger=trigger)
+        return capture
+
+    def stop(self, capture: _Capture, status: int) -> Profile:
+        with self._lock:
+            self._active.pop(id(capture), None)
+            others = any(active.loop is capture.loop for active in self._active.values())
+        due = self._lag_due.get(capture.loop)
+        if due is not None and capture.loop.time() > due:
+            # A stall still in progress (the lag task has not woken yet) belongs to this request too.
+            self._record_lag([capture], capture.loop.time() - due)
+        if not others and capture.loop in self._lag_tasks:
+            self._lag_tasks.pop(capture.loop).cancel()
+            self._lag_due.pop(capture.loop, None)
+        capture.profile.duration = time.perf_counter() - capture.start
+        capture.profile.status = status
+        self.profiles.append(capture.profile)
+        return capture.profile
+
+    def _captures(self) -> list[_Capture]:
+        with self._lock:
+            return list(self._active.values())
+
+    def _sample_loop(self) -> None:
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                captures = list(self._active.values())
+            self.sample(captures)
+            time.sleep(self.interval)
+
+    def sample(self, captures: list[_Capture]) -> None:
+        """Record one stack sample per thread of interest into every active capture."""
+        frames = sys._current_frames()
+        by_thread: dict[int, list[_Capture]] = {}
+        for capture in captures:
+            by_thread.setdefault(capture.thread_id, []).append(capture)
+        workers = [
+            "thread:" + thread.name + ";" + ";".join(_stack(frames[thread.ident]))
+            for thread in threading.enumerate()
+            if thread.ident in frames and thread.ident not in by_thread and thread.name.startswith("asyncio_") and _is_worker_busy(frames[thread.ident])
+        ]
+        for thread_id, thread_captures in by_thread.items():
+            frame = frames.get(thread_id)
+            if frame is None:
+                continue
+            running = asyncio.current_task(thread_captures[0].loop)
+            stack = ";".join(_stack(frame))
+            for capture in thread_captures:
+                if _is_idle(frame):
+                    root = "idle"
+                elif running is not None and running is capture.task:
+                    root = "request"
+                else:
+                    root = "other"
+                capture.profile.stacks[f"{root};{stack}" if root != "idle" else "idle"] += 1
+                for worker in workers:
+                    capture.profile.stacks[worker] += 1
+
+    @staticmethod
+    def _record_lag(captures: list[_Capture], lag: float) -> None:
+        now = time.perf_counter()
+        for capture in captures:
+            capture.profile.lag.append((round(now - capture.start, 6), lag))
+
+    async def _trace_lag(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            while True:
+                captures = [capture for capture in self._captures() if capture.loop is loop]
+                if not captures:
+                    return
+                self._record_lag(captures, max(0.0, loop.time() - self._lag_due[loop]))
+                self._lag_due[loop] = loop.time() + self.lag_interval
+                await asyncio.sleep(self.lag_interval)
+        finally:
+            if self._lag_tasks.get(loop) is asyncio.current_task():
+                del self._lag_tasks[loop]
+
+
+def requested(headers: list[tuple[bytes, bytes]], path: str, token: str | None = None, sample_rate: float | None = None) -> str | None:
+    """Why this request should be profiled ("header" or "sample"), or None."""
+    token = PROFILE_TOKEN if token is None else token
+    sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+    for name, value in headers:
+        if name == b"x-profile":
+            if value.decode("latin-1") == (token or "1"):
+                return "header"
+            break
+    if sample_rate > 0 and path.startswith(PROFILE_PATHS) and random.random() < sample_rate:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """Profiles the requests ``requested`` selects and names the profile in ``X-Profile-ID``."""
+
+    def __init__(self, app: ASGIApp, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        trigger = requested(scope["headers"], scope["path"]) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        capture = self.profiler.start(scope["method"], scope["path"], trigger)
+        status = {"code": 500}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", capture.profile.id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.stop(capture, status["code"])
+
+
+profiler = Profiler()
@@ -0,0 +1,96 @@
+"""Prompt templates compiled once from ``app/prompts``.
+
+System prompts live in Markdown files, not in string literals, so they can be
+edited without re-indenting Python. On load, each file is dedented and
+minified (trailing whitespace dropped, runs of spaces and blank lines
+collapsed). Its token count is also estimated. Compiled templates are cached
+by content hash, so loading the same text twice does no work.
+
+Routes register the fixed prompt they send upstream on every request with
+``record_prompt_cost``. Per-endpoint costs are exported as
+``endpoint_prompt_tokens`` and checked against budgets in the tests, so a
+template edit that inflates every request fails CI.
+"""
+
+import hashlib
+import re
+import textwrap
+from dataclasses import dataclass
+from pathlib import Path
+
+from .metrics import gauge
+
+PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
+
+prompt_template_tokens = gauge("prompt_template_tokens", "Estimated tokens of each compiled prompt template.", ("template",))
+endpoint_prompt_tokens = gauge("endpoint_prompt_tokens", "Estimated fixed prompt tokens (system prompt and user prefix) sent upstream per request.", ("endpoint", "provider"))
+
+_INNER_SPACES = re.compile(r"(?<=\S)[ \t]{2,}")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+_PIECES = re.compile(r"\w+|[^\w\s]+|\n+")
+
+
+@dataclass(frozen=True)
+class Template:
+    name: str
+    text: str
+    sha256: str
+    tokens: int
+
+
+def minify(text: str) -> str:
+    """Dedent, drop trailing whitespace and collapse repeated spaces and blank lines."""
+    lines = [_INNER_SPACES.sub(" ", line.rstrip()) for line in textwrap.dedent(text).splitlines()]
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines)).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE-style token count: words (long ones split), punctuation runs and line breaks.
+
+    Not exact for any particular model, but deterministic and dependency-free,
+    which is what budget checks need.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        if piece[0] == "\n":
+            tokens += 1
+        elif piece[0].isalnum() or piece[0] == "_":
+            tokens += 1 + (len(piece) - 1) // 6
+        else:
+            tokens += 1 + (len(piece) - 1) // 3
+    return tokens
+
+
+_compiled: dict[tuple[str, str], Template] = {}
+
+
+def compile_template(name: str, raw: str) -> Template:
+    """Minify ``raw`` and estimate its tokens, reusing the result for identical content."""
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    template = _compiled.get((name, digest))
+    if template is None:
+        text = minify(raw)
+        template = _compiled[(name, digest)] = Template(name, text, digest, estimate_tokens(text))
+        prompt_template_tokens.set(template.tokens, template=name)
+    return template
+
+
+def load_template(name: str, directory: Path = PROMPTS_DIR) -> Template:
+    """Load ``<directory>/<name>.md`` and compile it."""
+    return compile_template(name, (directory / f"{name}.md").read_text(encoding="utf-8"))
+
+
+_endpoint_costs: dict[tuple[str, str], int] = {}
+
+
+def record_prompt_cost(endpoint: str, provider: str, *parts: str) -> int:
+    """Register the fixed text ``endpoint`` sends to ``provider`` on every request; returns its token estimate."""
+    tokens = sum(estimate_tokens(part) for part in parts)
+    _endpoint_costs[(endpoint, provider)] = tokens
+    endpoint_prompt_tokens.set(tokens, endpoint=endpoint, provider=provider)
+    return tokens
+
+
+def prompt_costs() -> dict[tuple[str, str], int]:
+    """Estimated fixed prompt tokens per ``(endpoint, provider)``."""
+    return dict(_endpoint_costs)
@@ -0,0 +1,393 @@
+"""Provider registry and async client for Together's OpenAI-compatible chat API.
+
+Every provider ("openai", "llama", "gemma" and the chat models) is looked up
+through ``registry``. The registry owns a single pooled ``httpx.AsyncClient``
+with keep-alive (and optional HTTP/2), so upstream calls reuse warm
+connections instead of paying a TCP+TLS handshake per request.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Iterator
+
+import httpx
+
+from .instrumentation import add_upstream_time
+from .metrics import counter, histogram
+from .ratelimit import RETRYABLE_ERRORS, RETRYABLE_STATUS, RateLimiterRegistry, RetryPolicy, parse_retry_after, rate_limit_throttled, rate_limit_wait_seconds, upstream_retries
+from .ratelimit import limiters as default_limiters
+
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", "https://api.together.xyz/v1")
+TOGETHER_TIMEOUT = float(os.getenv("TOGETHER_TIMEOUT", "60"))
+TOGETHER_HTTP2 = os.getenv("TOGETHER_HTTP2", "0") == "1"
+TOGETHER_MAX_CONNECTIONS = int(os.getenv("TOGETHER_MAX_CONNECTIONS", "100"))
+TOGETHER_MAX_KEEPALIVE = int(os.getenv("TOGETHER_MAX_KEEPALIVE", "20"))
+TOGETHER_KEEPALIVE_EXPIRY = float(os.getenv("TOGETHER_KEEPALIVE_EXPIRY", "30"))
+
+logger = logging.getLogger(__name__)
+
+upstream_requests = counter("upstream_requests_total", "Upstream HTTP requests by whether they reused a pooled connection.", ("reused",))
+upstream_connections = counter("upstream_connections_opened_total", "New TCP connections opened to the upstream.")
+upstream_tls_handshakes = counter("upstream_tls_handshakes_total", "TLS handshakes performed with the upstream.")
+upstream_handshake_seconds = counter("upstream_handshake_seconds_total", "Seconds spent in TCP connect and TLS handshakes.")
+upstream_request_seconds = histogram("upstream_request_seconds", "Chat completion latency per model, including rate limiting and retries.", ("model", "outcome"))
+upstream_errors = counter("upstream_errors_total", "Failed chat completion calls by model and error type.", ("model", "type"))
+upstream_tokens = counter("upstream_tokens_total", "Tokens reported in the upstream usage field.", ("model", "kind"))
+provider_request_seconds = histogram("provider_request_seconds", "Chat completion latency per provider name.", ("provider", "outcome"))
+
+
+def extract_content(response: Any) -> str:
+    """Best-effort extraction of text from a chat completion response.
+    Handles variations where choices/message/content may be missing or None.
+    """
+    try:
+        choices = getattr(response, "choices", None)
+        if choices:
+            first = choices[0]
+            msg = getattr(first, "message", None)
+            if msg and getattr(msg, "content", None):
+                return msg.content
+            if getattr(first, "text", None):
+                return first.text
+        if isinstance(response, dict):
+            ch = response.get("choices")
+            if ch and isinstance(ch, list):
+                first = ch[0]
+                if isinstance(first, dict):
+                    msg = first.get("message") or {}
+                    if isinstance(msg, dict) and msg.get("content"):
+                        content = msg["content"]
+                        if isinstance(content, list):
+                            return " ".join(str(item) for item in content)
+                        return str(content)
+                    if first.get("text"):
+                        return first["text"]
+        return ""
+    except Exception:
+        return ""
+
+
+class ConnectionTracer:
+    """httpcore ``trace`` hook that records whether a request opened a new connection."""
+
+    def __init__(self) -> None:
+        self.reused = True
+        self._started: dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name.endswith(".started"):
+            self._started[event_name[: -len(".started")]] = time.perf_counter()
+            return
+        if event_name == "connection.connect_tcp.complete":
+            self.reused = False
+            upstream_connections.inc()
+            self._record_handshake("connection.connect_tcp")
+        elif event_name == "connection.start_tls.complete":
+            upstream_tls_handshakes.inc()
+            self._record_handshake("connection.start_tls")
+
+    def _record_handshake(self, step: str) -> None:
+        started = self._started.pop(step, None)
+        if started is not None:
+            upstream_handshake_seconds.inc(time.perf_counter() - started)
+
+    def finish(self) -> None:
+        upstream_requests.inc(reused="true" if self.reused else "false")
+
+
+class AsyncTogetherClient:
+    """Minimal async wrapper around ``POST /chat/completions``."""
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient | None = None,
+        api_key: str | None = None,
+        limiters: RateLimiterRegistry | None = None,
+        retry: RetryPolicy | None = None,
+    ):
+        self._http_client = http_client
+        self._api_key = api_key
+        self.limiters = limiters or default_limiters
+        self.retry = retry or RetryPolicy()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self._http_client or registry.http_client
+
+    async def chat(self, model: str, messages: list[dict[str, str]], **params: Any) -> dict[str, Any]:
+        """Send a chat completion request and return the decoded JSON body.
+
+        Raises ``httpx.HTTPStatusError`` for non-2xx responses.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self._send(model, {"model": model, "messages": messages, **params})
+            data = response.json()
+        except Exception as e:
+            _record_call(model, start, e)
+            raise
+        _record_usage(model, data.get("usage"))
+        _record_call(model, start)
+        return data
+
+    async def stream_chat(self, model: str, messages: list[dict[str, str]], *, finish: list[str] | None = None, **params: Any) -> AsyncGenerator[str, None]:
+        """Request a streamed completion and yield content deltas as they arrive.
+
+        Parses the server-sent ``data:`` lines until ``[DONE]``. Raises
+        ``httpx.HTTPStatusError`` if the upstream rejects the request. The
+        finish reason, when the upstream sends one, is appended to ``finish``.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self._send(model, {"model": model, "messages": messages, **params, "stream": True}, stream=True)
+        except Exception as e:
+            _record_call(model, start, e)
+            raise
+        body_start = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Together reports usage on the final chunk.
+                _record_usage(model, chunk.get("usage"))
+                reason = finish_reason(chunk)
+                if reason and finish is not None:
+                    finish.append(reason)
+                delta = _extract_delta(chunk)
+                if delta:
+                    yield delta
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await response.aclose()
+            add_upstream_time(time.perf_counter() - body_start)
+            _record_call(model, start, error)
+
+    async def _send(self, model: str, payload: dict[str, Any], stream: bool = False) -> httpx.Response:
+        """POST through the model's rate limiter, retrying transient failures.
+
+        429s slow the model's bucket down (honouring ``Retry-After``); 5xx
+        responses and dropped connections back off with jitter. Returns a
+        successful response whose body is left unread when ``stream`` is set.
+        """
+        headers = {"Authorization": f"Bearer {self._api_key}"} if self._api_key else None
+        bucket = self.limiters.get(model)
+        attempt = 0
+        while True:
+            rate_limit_wait_seconds.observe(await bucket.acquire(), model=model)
+            tracer = ConnectionTracer()
+            request = self.http_client.build_request("POST", "/chat/completions", json=payload, headers=headers, extensions={"trace": tracer})
+            sent_at = time.perf_counter()
+            try:
+                response = await self.http_client.send(request, stream=stream)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.retry.attempts:
+                    raise
+                upstream_retries.inc(model=model, reason=type(e).__name__)
+                await asyncio.sleep(self.retry.backoff(attempt))
+                attempt += 1
+                continue
+            finally:
+                tracer.finish()
+                add_upstream_time(time.perf_counter() - sent_at)
+
+            if response.status_code in RETRYABLE_STATUS:
+                retry_after = parse_retry_after(response.headers.get("retry-after"))
+                if response.status_code == 429:
+                    rate_limit_throttled.inc(model=model)
+                    await bucket.on_throttle(retry_after)
+                if attempt < self.retry.attempts:
+                    await response.aclose()
+                    upstream_retries.inc(model=model, reason=str(response.status_code))
+                    if response.status_code != 429:
+                        # 429s wait in the bucket; other transient errors back off here.
+                        await asyncio.sleep(retry_after if retry_after is not None else self.retry.backoff(attempt))
+                    attempt += 1
+                    continue
+            if response.is_error:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+            await bucket.on_success()
+            return response
+
+
+def _error_type(error: BaseException) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    return type(error).__name__
+
+
+def _record_call(model: str, start: float, error: BaseException | None = None) -> None:
+    outcome = "ok" if error is None else "error"
+    upstream_request_seconds.observe(time.perf_counter() - start, model=model, outcome=outcome)
+    if error is not None:
+        upstream_errors.inc(model=model, type=_error_type(error))
+
+
+def _record_usage(model: str, usage: Any) -> None:
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if isinstance(tokens, (int, float)):
+            upstream_tokens.inc(tokens, model=model, kind=kind)
+
+
+def finish_reason(response: Any) -> str | None:
+    """Why the upstream stopped generating: "stop", "length" (hit ``max_tokens``), or ``None`` if unreported."""
+    choices = response.get("choices") if isinstance(response, dict) else None
+    if not choices or not isinstance(choices[0], dict):
+        return None
+    return choices[0].get("finish_reason")
+
+
+def _extract_delta(chunk: dict[str, Any]) -> str:
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    first = choices[0]
+    delta = first.get("delta") or {}
+    return delta.get("content") or first.get("text") or ""
+
+
+# Provider kinds: models offered for prompt generation, and models only the chat assistant uses.
+GENERATION = "generation"
+CHAT = "chat"
+
+
+@dataclass(frozen=True)
+class Provider:
+    """A named model served through an ``AsyncTogetherClient``."""
+
+    name: str
+    model: str
+    client: AsyncTogetherClient
+    kind: str = GENERATION
+
+    async def chat(self, messages: list[dict[str, str]], **params: Any) -> dict[str, Any]:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.client.chat(self.model, messages, **params)
+            outcome = "ok"
+            return response
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            provider_request_seconds.observe(time.perf_counter() - start, provider=self.name, outcome=outcome)
+
+    async def stream_chat(self, messages: list[dict[str, str]], *, finish: list[str] | None = None, **params: Any) -> AsyncGenerator[str, None]:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            async for delta in self.client.stream_chat(self.model, messages, finish=finish, **params):
+                yield delta
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            provider_request_seconds.observe(time.perf_counter() - start, provider=self.name, outcome=outcome)
+
+
+class ProviderRegistry:
+    """Owns the shared upstream transport and maps provider names to models."""
+
+    def __init__(
+        self,
+        base_url: str = TOGETHER_BASE_URL,
+        http2: bool = TOGETHER_HTTP2,
+        limits: httpx.Limits | None = None,
+        timeout: float = TOGETHER_TIMEOUT,
+    ):
+        self.base_url = base_url
+        self.http2 = http2
+        self.limits = limits or httpx.Limits(
+            max_connections=TOGETHER_MAX_CONNECTIONS,
+            max_keepalive_connections=TOGETHER_MAX_KEEPALIVE,
+            keepalive_expiry=TOGETHER_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = timeout
+        self.client = AsyncTogetherClient()
+        self._providers: dict[str, Provider] = {}
+        self._http_client: httpx.AsyncClient | None = None
+
+    def register(self, name: str, model: str, client: AsyncTogetherClient | None = None, kind: str = GENERATION) -> Provider:
+        provider = Provider(name=name, model=model, client=client or self.client, kind=kind)
+        self._providers[name] = provider
+        return provider
+
+    def get(self, name: str) -> Provider:
+        """Look up a provider by name; raises ``KeyError`` if it is not registered."""
+        return self._providers[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._providers
+
+    def of_kind(self, kind: str = GENERATION) -> list[Provider]:
+        """The registered providers of ``kind``, in registration order."""
+        return [provider for provider in self._providers.values() if provider.kind == kind]
+
+    def serves(self, name: str, kind: str = GENERATION) -> bool:
+        """Whether ``name`` is a registered provider of ``kind``."""
+        provider = self._providers.get(name)
+        return provider is not None and provider.kind == kind
+
+    def __iter__(self) -> Iterator[Provider]:
+        return iter(self._providers.values())
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """The pooled keep-alive client, created on first use."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = self._build_http_client()
+        return self._http_client
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        kwargs: dict[str, Any] = {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(self.timeout, connect=10.0),
+            "limits": self.limits,
+            "headers": {"Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY', '')}"},
+        }
+        try:
+            return httpx.AsyncClient(http2=self.http2, **kwargs)
+        except ImportError:
+            logger.warning("TOGETHER_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+            return httpx.AsyncClient(**kwargs)
+
+    async def aclose(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+registry = ProviderRegistry()
+registry.register("openai", "openai/gpt-oss-20b")
+registry.register("llama", "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free")
+registry.register("gemma", "google/gemma-3n-E4B-it")
+# Chat models used by the Vani assistant; not offered for prompt generation.
+registry.register("vani", "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free", kind=CHAT)
+registry.register("gpt", "openai/gpt-oss-20b", kind=CHAT)
+
+
+def get_provider(name: str) -> Provider:
+    """Return a registered provider; raises ``KeyError`` for unknown names."""
+    return registry.get(name)
+
+
+async def aclose() -> None:
+    """Close the pooled HTTP client (used on shutdown and by benchmarks)."""
+    await registry.aclose()
@@ -0,0 +1,237 @@
+"""Per-model adaptive rate limiting and retry scheduling for upstream calls.
+
+``AdaptiveTokenBucket`` hands out send slots in arrival order (a reservation
+based token bucket), so queued requests are spread out fairly instead of all
+hitting the upstream at once. The refill rate adapts AIMD-style: it halves on
+a 429 (and honours ``Retry-After``) and creeps back up on successes.
+
+With ``SHARED_STATE_PATH`` set, ``SharedTokenBucket`` keeps each bucket's
+state in SQLite, so all worker processes draw on one per-model budget.
+
+``RetryPolicy`` decides which failures are transient (429, 5xx, dropped
+connections) and how long to back off (full-jitter exponential).
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+import httpx
+
+from .metrics import counter, histogram
+from .shared_state import SHARED_STATE_PATH, connect
+
+T = TypeVar("T")
+
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "5"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", "0.2"))
+# Optional per-model overrides, e.g. "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free=0.5,google/gemma-3n-E4B-it=2"
+RATE_LIMIT_OVERRIDES = os.getenv("RATE_LIMIT_OVERRIDES", "")
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.5"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "8"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+rate_limit_wait_seconds = histogram("rate_limit_wait_seconds", "Time requests spent queued in the per-model rate limiter.", ("model",))
+rate_limit_throttled = counter("rate_limit_throttled_total", "429 responses received from the upstream.", ("model",))
+upstream_retries = counter("upstream_retries_total", "Upstream calls retried after a transient failure.", ("model", "reason"))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class AdaptiveTokenBucket:
+    """Token bucket with FIFO reservations and an AIMD-adjusted refill rate."""
+
+    def __init__(self, rate: float = RATE_LIMIT_RPS, burst: int = RATE_LIMIT_BURST, min_rate: float = RATE_LIMIT_MIN_RPS, clock: Callable[[], float] = time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, rate)
+        self._clock = clock
+        # Theoretical arrival time of the next request (GCRA); slots are handed out in call order.
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Claim the next send slot and return how long to wait for it."""
+        now = self._clock()
+        slot = max(self._next_slot, now)
+        tolerance = (self.burst - 1) / self.rate
+        delay = max(slot - now - tolerance, self._blocked_until - now, 0.0)
+        self._next_slot = slot + 1 / self.rate
+        return delay
+
+    async def acquire(self) -> float:
+        """Wait for a send slot; returns the seconds spent waiting."""
+        start = self._clock()
+        delay = self.reserve()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            # A 429 may have pushed the block further out while we slept.
+            delay = self._blocked_until - self._clock()
+        return self._clock() - start
+
+    async def on_success(self) -> None:
+        self._recover()
+
+    async def on_throttle(self, retry_after: float | None = None) -> None:
+        self._back_off(retry_after)
+
+    def _recover(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def _back_off(self, retry_after: float | None = None) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+        now = self._clock()
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self._blocked_until = max(self._blocked_until, now + pause)
+        self._next_slot = max(self._next_slot, self._blocked_until)
+
+
+class BucketStore:
+    """Token bucket state in SQLite, one row per model, shared by every process using ``path``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (model TEXT PRIMARY KEY, rate REAL NOT NULL, next_slot REAL NOT NULL, blocked_until REAL NOT NULL)")
+        return self._conn
+
+    def update(self, model: str, bucket: AdaptiveTokenBucket, change: Callable[[], T]) -> T:
+        """Load ``bucket``'s shared state, apply ``change`` to it and store the result, all in one write transaction."""
+        with self._lock:
+            conn = self._connect()
+            # IMMEDIATE takes the write lock up front, so two processes cannot claim the same slot.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT rate, next_slot, blocked_until FROM rate_limits WHERE model = ?", (model,)).fetchone()
+                if row is not None:
+                    bucket.rate, bucket._next_slot, bucket._blocked_until = row
+                result = change()
+                conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?)", (model, bucket.rate, bucket._next_slot, bucket._blocked_until))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return result
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class SharedTokenBucket(AdaptiveTokenBucket):
+    """``AdaptiveTokenBucket`` whose state lives in a ``BucketStore``.
+
+    Slots are reserved and rate changes written in a worker thread, so a busy
+    database never blocks the event loop. Rate changes write straight
+    through, but ``on_success`` only writes while the rate is recovering.
+    Times are wall-clock so that they mean the same in every process.
+    """
+
+    def __init__(self, store: BucketStore, model: str, rate: float = RATE_LIMIT_RPS, burst: int = RATE_LIMIT_BURST, min_rate: float = RATE_LIMIT_MIN_RPS, clock: Callable[[], float] = time.time):
+        super().__init__(rate, burst, min_rate, clock)
+        self.store = store
+        self.model = model
+
+    def reserve(self) -> float:
+        return self.store.update(self.model, self, super().reserve)
+
+    async def acquire(self) -> float:
+        start = self._clock()
+        delay = await asyncio.to_thread(self.reserve)
+        while delay > 0:
+            await asyncio.sleep(delay)
+            # Another worker may have seen a 429 while we slept.
+            delay = await asyncio.to_thread(self.store.update, self.model, self, lambda: self._blocked_until - self._clock())
+        return self._clock() - start
+
+    async def on_success(self) -> None:
+        if self.rate < self.max_rate:
+            await asyncio.to_thread(self.store.update, self.model, self, self._recover)
+
+    async def on_throttle(self, retry_after: float | None = None) -> None:
+        await asyncio.to_thread(self.store.update, self.model, self, lambda: self._back_off(retry_after))
+
+
+class RateLimiterRegistry:
+    """One ``AdaptiveTokenBucket`` per model, created on first use; shared between processes when given a ``store``."""
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_RPS,
+        burst: int = RATE_LIMIT_BURST,
+        min_rate: float = RATE_LIMIT_MIN_RPS,
+        overrides: dict[str, float] | None = None,
+        store: BucketStore | None = None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.overrides = overrides or {}
+        self.store = store
+        self._buckets: dict[str, AdaptiveTokenBucket] = {}
+
+    def get(self, model: str) -> AdaptiveTokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            rate = self.overrides.get(model, self.rate)
+            if self.store is not None:
+                bucket = SharedTokenBucket(self.store, model, rate, self.burst, self.min_rate)
+            else:
+                bucket = AdaptiveTokenBucket(rate, self.burst, self.min_rate)
+            self._buckets[model] = bucket
+        return bucket
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Full-jitter exponential backoff for transient upstream failures."""
+
+    attempts: int = UPSTREAM_RETRY_ATTEMPTS
+    base_delay: float = UPSTREAM_RETRY_BASE_DELAY
+    max_delay: float = UPSTREAM_RETRY_MAX_DELAY
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def _parse_overrides(raw: str) -> dict[str, float]:
+    overrides = {}
+    for item in raw.split(","):
+        model, _, rate = item.partition("=")
+        if model.strip() and rate.strip():
+            overrides[model.strip()] = float(rate)
+    return overrides
+
+
+limiters = RateLimiterRegistry(overrides=_parse_overrides(RATE_LIMIT_OVERRIDES), store=BucketStore(SHARED_STATE_PATH) if SHARED_STATE_PATH else None)
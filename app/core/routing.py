@@ -0,0 +1,142 @@
+"""Complexity-aware model routing.
+
+``complexity`` scores a request from cheap local signals:
+- its length in tokens;
+- its structure: lines, list items and code blocks;
+- keywords that mark hard or trivial work ("architecture" against "typo");
+The score goes through ``MODEL_ROUTES``, a table of tiers ordered from the
+fastest model to the most capable. A request gets the first tier whose
+``max_score`` it fits under, i.e. the smallest adequate model. When the user
+names one of Vani's modes, BASIC takes the first tier and DETAIL the last.
+
+Routing applies to generations requested with ``"provider": "auto"``, and,
+with ``ROUTING_ENABLED=1``, to the chat tools. A provider the client picked
+explicitly is always respected. Every decision is counted by tier and
+endpoint. Each routed call's latency is recorded per tier, and so is any
+miss of the tier's latency target. Together these show whether cheap tasks
+got faster without hard tasks being sent to models too small for them.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+from .metrics import counter, histogram
+from .prompt_templates import estimate_tokens
+
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "0") == "1"
+# Tiers, fastest first: "name=provider:max_score:latency_target_seconds". The last tier takes everything left.
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "simple=gemma:1.5:3,standard=openai:4:8,complex=llama::20")
+
+AUTO_PROVIDER = "auto"
+
+logger = logging.getLogger(__name__)
+
+routing_decisions = counter("routing_decisions_total", "Requests routed, by endpoint kind, chosen tier and provider.", ("kind", "tier", "provider"))
+routing_tier_seconds = histogram("routing_tier_seconds", "Latency of routed upstream calls per tier.", ("tier", "provider"))
+routing_target_misses = counter("routing_target_misses_total", "Routed calls slower than their tier's latency target.", ("tier",))
+
+# Signals of hard work: each hit adds one point.
+COMPLEX_WORDS = frozenset(
+    "architecture architect design comprehensive detailed in-depth thorough spec specification requirements strategy "
+    "analyze analyse analysis compare tradeoffs trade-offs evaluate optimize optimise scalable distributed algorithm proof "
+    "multi-step step-by-step research plan roadmap migrate migration refactor security audit".split()
+)
+# Signals of trivial work: each hit takes one point away.
+SIMPLE_WORDS = frozenset("typo typos grammar spelling spell rephrase reword shorten shorter title rename synonym quick brief short one-line tweet caption".split())
+# Extra weight by kind of request; detailed prompts need more of the model than short ones.
+KIND_BIAS = {"short": -1.0, "detailed": 1.0, "chat": 0.0}
+_WORDS = re.compile(r"[a-z][a-z-]*")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+", re.MULTILINE)
+# Vani's modes, when the user names one (in capitals, as Vani's own examples do).
+_MODE = re.compile(r"\b(BASIC|DETAIL)\b")
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    provider: str
+    max_score: float | None  # None: no limit (the last tier)
+    latency_target: float
+
+
+@dataclass(frozen=True)
+class Decision:
+    tier: Tier
+    score: float
+    reasons: tuple[str, ...]
+
+    @property
+    def provider(self) -> str:
+        return self.tier.provider
+
+
+def complexity(text: str, kind: str = "chat") -> tuple[float, tuple[str, ...]]:
+    """A complexity score for ``text`` and the signals that contributed to it."""
+    lowered = text.lower()
+    words = _WORDS.findall(lowered)
+    tokens = estimate_tokens(text)
+    score = tokens / 40
+    reasons = [f"tokens={tokens}"]
+    lines = text.count("\n")
+    items = len(_LIST_ITEM.findall(text))
+    structure = min(lines / 4, 2.0) + min(items / 3, 2.0) + (2.0 if "```" in text else 0.0)
+    if structure:
+        score += structure
+        reasons.append(f"structure={structure:.1f}")
+    hard = sum(word in COMPLEX_WORDS for word in words)
+    easy = sum(word in SIMPLE_WORDS for word in words)
+    if hard:
+        reasons.append(f"complex_words={hard}")
+    if easy:
+        reasons.append(f"simple_words={easy}")
+    score += hard - easy + KIND_BIAS.get(kind, 0.0)
+    return max(score, 0.0), tuple(reasons)
+
+
+class Router:
+    """Picks the first tier of ``tiers`` that a request's score fits under."""
+
+    def __init__(self, tiers: list[Tier]):
+        if not tiers:
+            raise ValueError("MODEL_ROUTES needs at least one tier")
+        self.tiers = tiers
+
+    def classify(self, text: str, kind: str = "chat") -> Decision:
+        score, reasons = complexity(text, kind)
+        mode = _MODE.search(text)
+        if mode is not None:
+            tier = self.tiers[0] if mode.group(1) == "BASIC" else self.tiers[-1]
+            return Decision(tier, score, (*reasons, f"mode={mode.group(1).lower()}"))
+        for tier in self.tiers:
+            if tier.max_score is None or score <= tier.max_score:
+                return Decision(tier, score, reasons)
+        return Decision(self.tiers[-1], score, reasons)
+
+    def route(self, text: str, kind: str = "chat") -> Decision:
+        """Classify and record the decision."""
+        decision = self.classify(text, kind)
+        routing_decisions.inc(kind=kind, tier=decision.tier.name, provider=decision.provider)
+        logger.debug("routed", extra={"kind": kind, "tier": decision.tier.name, "provider": decision.provider, "score": round(decision.score, 2), "reasons": ",".join(decision.reasons)})
+        return decision
+
+    def observe(self, decision: Decision, seconds: float) -> None:
+        """Record how long a routed call took against its tier's target."""
+        routing_tier_seconds.observe(seconds, tier=decision.tier.name, provider=decision.provider)
+        if seconds > decision.tier.latency_target:
+            routing_target_misses.inc(tier=decision.tier.name)
+
+
+def parse_routes(raw: str) -> list[Tier]:
+    tiers = []
+    for item in raw.split(","):
+        name, _, spec = item.partition("=")
+        if not name.strip():
+            continue
+        provider, max_score, target = (spec.split(":") + ["", ""])[:3]
+        tiers.append(Tier(name.strip(), provider.strip(), float(max_score) if max_score.strip() else None, float(target or "inf")))
+    return tiers
+
+
+router = Router(parse_routes(MODEL_ROUTES))
@@ -0,0 +1,194 @@
+"""Server-side conversation sessions for /api/chat.
+
+A session keeps its recent turns as compact records: role, text (capped at
+``CHAT_TURN_MAX_CHARS``) and a token estimate computed once when the turn is
+stored. Before each upstream call the history is walked newest-first and cut
+at ``CHAT_HISTORY_TOKENS``. Building it therefore takes at most
+``CHAT_SESSION_MAX_TURNS`` steps and never re-tokenizes anything.
+
+The store is bounded three ways, evicting least recently used sessions first:
+``CHAT_SESSIONS_MAX`` sessions, ``CHAT_SESSION_TTL`` seconds of inactivity
+and ``CHAT_SESSION_MEMORY_MB`` of stored text in total. Turns beyond the
+per-session limit are dropped. With ``CHAT_SESSION_SUMMARIZE=1`` they are
+instead folded into a short extractive summary, sent ahead of the history.
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable
+
+from .metrics import counter, gauge
+from .prompt_templates import estimate_tokens
+
+CHAT_SESSIONS_MAX = int(os.getenv("CHAT_SESSIONS_MAX", "10000"))
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+CHAT_SESSION_MEMORY_MB = float(os.getenv("CHAT_SESSION_MEMORY_MB", "64"))
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", "20"))
+CHAT_TURN_MAX_CHARS = int(os.getenv("CHAT_TURN_MAX_CHARS", "4000"))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1000"))
+CHAT_SESSION_SUMMARIZE = os.getenv("CHAT_SESSION_SUMMARIZE", "0") == "1"
+SUMMARY_MAX_CHARS = 600
+SUMMARY_WORDS_PER_TURN = 15
+
+chat_sessions_active = gauge("chat_sessions_active", "Conversation sessions currently stored.")
+chat_session_memory_bytes = gauge("chat_session_memory_bytes", "Approximate memory held by stored conversation turns.")
+chat_sessions_evicted = counter("chat_sessions_evicted_total", "Conversation sessions evicted from the store.", ("reason",))
+
+# Rough per-record overhead (object, slots, deque slot) on top of the text itself.
+_TURN_OVERHEAD = 120
+_SESSION_OVERHEAD = 800
+_SENTENCE_END = re.compile(r"(?<=[.?!])\s")
+
+
+class Turn:
+    __slots__ = ("role", "text", "tokens")
+
+    def __init__(self, role: str, text: str):
+        self.role = role
+        self.text = text
+        self.tokens = estimate_tokens(text)
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.text) + _TURN_OVERHEAD
+
+
+class Session:
+    __slots__ = ("id", "turns", "summary", "summary_tokens", "size", "expires_at")
+
+    def __init__(self, session_id: str, expires_at: float):
+        self.id = session_id
+        self.turns: deque[Turn] = deque()
+        self.summary = ""
+        self.summary_tokens = 0
+        self.size = _SESSION_OVERHEAD
+        self.expires_at = expires_at
+
+
+def summarize(summary: str, turn: Turn) -> str:
+    """Fold a dropped turn into ``summary``: the first sentence of each user message, oldest parts dropped first."""
+    if turn.role != "user":
+        return summary
+    first = _SENTENCE_END.split(turn.text.strip(), 1)[0]
+    words = first.split()
+    part = " ".join(words[:SUMMARY_WORDS_PER_TURN]) + ("…" if len(words) > SUMMARY_WORDS_PER_TURN else "")
+    summary = f"{summary} | {part}" if summary else part
+    while len(summary) > SUMMARY_MAX_CHARS and " | " in summary:
+        summary = summary.split(" | ", 1)[1]
+    return summary[-SUMMARY_MAX_CHARS:]
+
+
+class SessionStore:
+    """In-memory sessions with LRU, TTL and total-memory bounds."""
+
+    def __init__(
+        self,
+        max_sessions: int = CHAT_SESSIONS_MAX,
+        ttl: float = CHAT_SESSION_TTL,
+        max_bytes: int = int(CHAT_SESSION_MEMORY_MB * 1024 * 1024),
+        max_turns: int = CHAT_SESSION_MAX_TURNS,
+        max_chars: int = CHAT_TURN_MAX_CHARS,
+        summarize: bool = CHAT_SESSION_SUMMARIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.summarize = summarize
+        self._clock = clock
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str | None = None) -> Session:
+        """The live session with ``session_id``, or a new one (with a fresh ID) if it is unknown or expired."""
+        now = self._clock()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None and session.expires_at <= now:
+            self._evict(session.id, "ttl")
+            session = None
+        if session is None:
+            session = Session(uuid.uuid4().hex, now + self.ttl)
+            self._sessions[session.id] = session
+            self.size += session.size
+            self._enforce_limits()
+        else:
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(session.id)
+        return session
+
+    def add_exchange(self, session: Session, message: str, reply: str) -> None:
+        """Store one user message and the reply to it."""
+        if self._sessions.get(session.id) is not session:
+            return  # evicted while the reply was being generated
+        for role, text in (("user", message), ("assistant", reply)):
+            turn = Turn(role, text[: self.max_chars])
+            session.turns.append(turn)
+            self._resize(session, turn.size)
+        while len(session.turns) > self.max_turns:
+            dropped = session.turns.popleft()
+            self._resize(session, -dropped.size)
+            if self.summarize:
+                self._resize(session, -sys.getsizeof(session.summary))
+                session.summary = summarize(session.summary, dropped)
+                session.summary_tokens = estimate_tokens(session.summary)
+                self._resize(session, sys.getsizeof(session.summary))
+        self._sessions.move_to_end(session.id)
+        self._enforce_limits()
+
+    def history(self, session: Session | None, budget: int = CHAT_HISTORY_TOKENS) -> list[dict[str, str]]:
+        """The most recent turns that fit in ``budget`` tokens, oldest first, led by the summary if it fits too."""
+        if session is None:
+            return []
+        messages, used = [], 0
+        for turn in reversed(session.turns):
+            if used + turn.tokens > budget:
+                break
+            used += turn.tokens
+            messages.append({"role": turn.role, "content": turn.text})
+        if session.summary and used + session.summary_tokens <= budget:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {session.summary}"})
+        messages.reverse()
+        return messages
+
+    def _resize(self, session: Session, delta: int) -> None:
+        session.size += delta
+        self.size += delta
+        chat_session_memory_bytes.set(self.size)
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        session = self._sessions.pop(session_id)
+        self.size -= session.size
+        chat_sessions_evicted.inc(reason=reason)
+        chat_sessions_active.set(len(self._sessions))
+        chat_session_memory_bytes.set(self.size)
+
+    def _enforce_limits(self) -> None:
+        now = self._clock()
+        # Least recently used first, which is also the first to expire.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.expires_at <= now:
+                self._evict(oldest.id, "ttl")
+            elif len(self._sessions) > self.max_sessions:
+                self._evict(oldest.id, "lru")
+            elif self.size > self.max_bytes and len(self._sessions) > 1:
+                self._evict(oldest.id, "memory")
+            else:
+                break
+        chat_sessions_active.set(len(self._sessions))
+        chat_session_memory_bytes.set(self.size)
+
+
+chat_sessions = SessionStore()
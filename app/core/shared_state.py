@@ -0,0 +1,105 @@
+"""State shared between worker processes.
+
+Under several uvicorn or gunicorn workers every module-level cache, limiter
+and counter exists once per process. Set ``SHARED_STATE_PATH`` to a local
+SQLite file and the workers coordinate through it instead:
+
+* the prompt cache's disk tier defaults to this file, so a prompt generated
+  by one worker is a hit in all of them (``cache.build_cache``);
+* per-model rate-limit buckets are rows in it, so together the workers stay
+  within one upstream budget (``ratelimit.SharedTokenBucket``);
+* each worker publishes a snapshot of its metrics every
+  ``SHARED_METRICS_INTERVAL`` seconds, and ``/metrics`` on any worker sums
+  counters and histograms over all of them (``MetricsStore``).
+
+The database runs in WAL mode, so readers never wait for the writer and
+every write is a single short transaction. No other service is needed.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+from . import metrics
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+SHARED_METRICS_INTERVAL = float(os.getenv("SHARED_METRICS_INTERVAL", "1"))
+# Gauges from a worker that has not published for this long (it has exited) are left out.
+SHARED_METRICS_STALE = float(os.getenv("SHARED_METRICS_STALE", "30"))
+SQLITE_BUSY_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open ``path`` for use from several threads and processes at once."""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only risks the last transactions on power loss, never corruption.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class MetricsStore:
+    """One metrics snapshot per worker process; ``render`` merges them."""
+
+    def __init__(self, path: str, worker: str | None = None, stale: float = SHARED_METRICS_STALE, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.worker = worker or str(os.getpid())
+        self.stale = stale
+        self._clock = clock
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS metric_snapshots (worker TEXT PRIMARY KEY, updated_at REAL NOT NULL, snapshot TEXT NOT NULL)")
+        return self._conn
+
+    def publish(self) -> None:
+        """Store this worker's current metrics."""
+        record = json.dumps(metrics.snapshot())
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO metric_snapshots VALUES (?, ?, ?)", (self.worker, self._clock(), record))
+            conn.commit()
+
+    def snapshots(self) -> dict[str, dict[str, Any]]:
+        """Every worker's last snapshot; gauges only from workers that are still publishing."""
+        with self._lock:
+            rows = self._connect().execute("SELECT worker, updated_at, snapshot FROM metric_snapshots").fetchall()
+        cutoff = self._clock() - self.stale
+        snapshots = {}
+        for worker, updated_at, record in rows:
+            snapshot = json.loads(record)
+            snapshots[worker] = snapshot if updated_at >= cutoff else metrics.without_gauges(snapshot)
+        return snapshots
+
+    def render(self) -> str:
+        """Publish this worker's metrics, then render the totals over all workers."""
+        self.publish()
+        return metrics.render(self.snapshots())
+
+    async def run(self, interval: float = SHARED_METRICS_INTERVAL) -> None:
+        """Publish every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.publish)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not publish metrics to {self.path}: {e!r}")
+            await asyncio.sleep(interval)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+shared_metrics = MetricsStore(SHARED_STATE_PATH) if SHARED_STATE_PATH else None
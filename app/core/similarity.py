@@ -0,0 +1,203 @@
+"""Near-duplicate lookup tier for the prompt cache.
+
+Tasks that differ only in filler ("Please summarize the quarterly sales
+reports" / "summarize quarterly sales report") should be served the same
+stored prompt. Each task is reduced to its sequence of content words
+(lower-cased, fillers and plural "s" removed) and then to the set of hashed
+word n-grams (shingles) over that sequence. Shingles keep word order, so tasks
+that ask for opposite things ("French to English" / "English to French") do
+not match; pronouns and direction words ("my", "your", "to", "from") are
+kept for the same reason. The shingle set is summarised by a MinHash
+signature and indexed with locality-sensitive hashing: the signature is cut
+into bands, and tasks sharing any band land in the same bucket. A lookup
+only compares against the few candidates in its buckets, so its cost does
+not grow with the number of stored entries. Candidates are accepted when the
+Jaccard similarity of the shingle sets reaches ``SIMILARITY_THRESHOLD``.
+
+Entries are scoped (provider, mode, model, system prompt), bounded by count
+with LRU eviction and expire after ``PROMPT_CACHE_TTL``.
+"""
+
+import hashlib
+import os
+import re
+import time
+from array import array
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from .cache import PROMPT_CACHE_TTL, cache_evictions, cache_hits
+
+# Off by default: a false match serves a prompt for a different task.
+SIMILARITY_CACHE_ENABLED = os.getenv("SIMILARITY_CACHE_ENABLED", "0") == "1"
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+SIMILARITY_CACHE_SIZE = int(os.getenv("SIMILARITY_CACHE_SIZE", "10000"))
+# 8 bands x 4 rows: a pair at 0.8 Jaccard shares a bucket ~98.5% of the time, at 0.9 ~99.98%.
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+# Words per shingle; 2 makes word order count while tolerating a dropped or added filler.
+SHINGLE_SIZE = 2
+
+_MERSENNE = (1 << 61) - 1
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# Fillers only: pronouns and prepositions carry direction ("to my boss", "from French") and are kept.
+STOPWORDS = frozenset("a an the is are be please can could would will just some any very really kindly".split())
+
+
+def _coefficients(count: int) -> list[tuple[int, int]]:
+    """Deterministic (a, b) pairs for the ``(a * x + b) mod p`` hash family."""
+    pairs = []
+    for i in range(count):
+        digest = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        pairs.append((int.from_bytes(digest[:8], "big") % (_MERSENNE - 1) + 1, int.from_bytes(digest[8:], "big") % _MERSENNE))
+    return pairs
+
+
+_COEFFICIENTS = _coefficients(MINHASH_BANDS * MINHASH_ROWS)
+
+
+def content_words(task: str) -> tuple[str, ...]:
+    """Lower-cased words in order, minus fillers, with a trailing plural "s" dropped."""
+    words = []
+    for word in _WORD.findall(task.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return tuple(words)
+
+
+def shingles(task: str, size: int = SHINGLE_SIZE) -> frozenset[int]:
+    """Hashed word n-grams of the task's content words; a task shorter than ``size`` is one shingle."""
+    words = content_words(task)
+    if not words:
+        return frozenset()
+    grams = (" ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1)))
+    return frozenset(int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "big") for gram in grams)
+
+
+def jaccard(a: frozenset[int], b: frozenset[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(hashed: frozenset[int]) -> tuple[int, ...]:
+    values = list(hashed) or [0]
+    return tuple(min((a * x + b) % _MERSENNE for x in values) for a, b in _COEFFICIENTS)
+
+
+class _Entry:
+    __slots__ = ("key", "shingles", "bands", "value", "expires_at")
+
+    def __init__(self, key: tuple[Hashable, frozenset[int]], bands: array, value: str, expires_at: float):
+        self.key = key
+        self.shingles = key[1]
+        self.bands = bands
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SimilarityIndex:
+    """MinHash-LSH index mapping tasks to stored prompts, bounded by entry count."""
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_entries: int = SIMILARITY_CACHE_SIZE,
+        ttl: float = PROMPT_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._ids: dict[tuple[Hashable, frozenset[int]], int] = {}
+        # Band hash -> entry id, or a list of ids once several entries share the band.
+        # Most buckets hold a single entry, so storing the bare id keeps the index compact.
+        self._buckets: dict[int, int | list[int]] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _bands(scope: Hashable, hashed: frozenset[int]) -> array:
+        signature = minhash(hashed)
+        return array("q", (hash((scope, band, signature[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS])) for band in range(MINHASH_BANDS)))
+
+    def get(self, scope: Hashable, task: str) -> tuple[str, float] | None:
+        """Return ``(value, similarity)`` of the closest stored task at or above the threshold."""
+        hashed = shingles(task)
+        if not hashed:
+            return None
+        candidates = set()
+        for band in self._bands(scope, hashed):
+            bucket = self._buckets.get(band)
+            if isinstance(bucket, int):
+                candidates.add(bucket)
+            elif bucket is not None:
+                candidates.update(bucket)
+        best, best_score = None, self.threshold
+        now = self._clock()
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.key[0] != scope:
+                continue
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+                continue
+            score = jaccard(hashed, entry.shingles)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        cache_hits.inc(tier="similar")
+        return self._entries[best].value, best_score
+
+    def set(self, scope: Hashable, task: str, value: str) -> None:
+        hashed = shingles(task)
+        if not hashed:
+            return
+        key = (scope, hashed)
+        if key in self._ids:
+            self._remove(self._ids[key])
+        entry_id = self._next_id
+        self._next_id += 1
+        bands = self._bands(scope, hashed)
+        self._entries[entry_id] = _Entry(key, bands, value, self._clock() + self.ttl)
+        self._ids[key] = entry_id
+        for band in bands:
+            bucket = self._buckets.get(band)
+            if bucket is None:
+                self._buckets[band] = entry_id
+            elif isinstance(bucket, int):
+                self._buckets[band] = [bucket, entry_id]
+            else:
+                bucket.append(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            cache_evictions.inc(tier="similar")
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        del self._ids[entry.key]
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket == entry_id:
+                del self._buckets[band]
+            elif isinstance(bucket, list):
+                bucket.remove(entry_id)
+                if len(bucket) == 1:
+                    self._buckets[band] = bucket[0]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._ids.clear()
+        self._buckets.clear()
+
+
+similar_prompts = SimilarityIndex() if SIMILARITY_CACHE_ENABLED else None
@@ -0,0 +1,63 @@
+"""Request coalescing: concurrent identical calls share one upstream request.
+
+The first caller for a key (the leader) starts the work as a task; callers
+that arrive while it is in flight await the same task, so nobody waits longer
+than the leader does. The task is shielded from individual callers: one
+caller giving up (a client disconnect, a deadline) does not cancel the work
+for the others. Only when every waiter has gone is the task cancelled, so an
+abandoned upstream call does not keep running.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from .metrics import counter
+
+T = TypeVar("T")
+
+singleflight_leaders = counter("singleflight_leaders_total", "Calls that went upstream (first caller for a key).", ("group",))
+singleflight_deduplicated = counter("singleflight_deduplicated_total", "Calls that joined an identical in-flight call instead of going upstream.", ("group",))
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key within one event loop."""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: dict[Hashable, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda done: self._forget(key, done))
+            singleflight_leaders.inc(group=self.group)
+        else:
+            singleflight_deduplicated.inc(group=self.group)
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        call = self._calls.get(key)
+        if call is not None and call.task is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away.
+            task.exception()
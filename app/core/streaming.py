@@ -0,0 +1,56 @@
+"""Server-Sent Events helpers for the streaming endpoints.
+
+Each token delta is sent as ``data: {"delta": "..."}``. The stream ends with
+``event: done`` carrying ``ttft_ms`` (time to first token) and ``total_ms``,
+or ``event: error`` if generation failed after the response had started.
+"""
+
+import json
+import logging
+import time
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
+from .metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+stream_first_token_seconds = histogram("stream_first_token_seconds", "Time from request to the first streamed token.", ("endpoint",))
+stream_duration_seconds = histogram("stream_duration_seconds", "Total duration of streamed responses.", ("endpoint",))
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def sse_stream(chunks: AsyncIterator[str], endpoint: str) -> AsyncIterator[str]:
+    """Wrap a token iterator as SSE events and record TTFT / total latency."""
+    start = time.perf_counter()
+    first_token_at: float | None = None
+    try:
+        async for chunk in chunks:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                stream_first_token_seconds.observe(first_token_at - start, endpoint=endpoint)
+            yield sse_event({"delta": chunk})
+    except Exception as e:
+        logger.error(f"Streaming {endpoint} failed: {e}")
+        yield sse_event({"error": str(e)}, event="error")
+        return
+    finally:
+        stream_duration_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+    end = time.perf_counter()
+    ttft = (first_token_at or end) - start
+    yield sse_event({"ttft_ms": round(ttft * 1000, 1), "total_ms": round((end - start) * 1000, 1)}, event="done")
+
+
+def sse_response(chunks: AsyncIterator[str], endpoint: str) -> StreamingResponse:
+    """Build a ``text/event-stream`` response that is not buffered by proxies."""
+    return StreamingResponse(
+        sse_stream(chunks, endpoint),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
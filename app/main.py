@@ -1,82 +1,225 @@
 # main.py
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.responses import HTMLResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from app.prompt_generator import create_prompt ,create_short_prompt
+from app.prompt_generator import Generation, gate_provider, generate, generate_batch, stream_prompt
 from app.api.chatbot_routes import router as chatbot_router
+from app.api.job_routes import router as job_router
+from app.api.profile_routes import router as profile_router
+from app.core import assets, lifecycle, metrics, profiling
+from app.core.admission import DETAILED, SHORT, ClientDisconnected, Overloaded, admission, disconnected_response, overloaded_response
+from app.core.instrumentation import MetricsMiddleware
+from app.core.logs import RequestContextMiddleware
+from app.core.shared_state import shared_metrics
+from app.core.streaming import sse_response
+import asyncio
+import json
 import os
+from typing import Any
 
 # load_dotenv()  # Load .env variables
 
-app = FastAPI()
-
-print(f"Current working directory: {os.getcwd()}")
-print(f"Templates folder path: {os.path.join(os.getcwd(), 'templates')}")
-
-# Provide a default value (e.g., for local development if the env var isn't set)
-allowed_origins_str = os.getenv("ALLOWED_ORIGINS", "*")
-
-# Split the string by comma to create a list of origins
-# and strip any leading/trailing whitespace from each origin
-allowed_origins = [origin.strip() for origin in allowed_origins_str.split(",")]
-
-# If you want to allow all origins if the environment variable is "*"
-if "*" in allowed_origins and len(allowed_origins) == 1:
-    pass
-elif allowed_origins_str == "*": # A common way to signify all origins in env
-    allowed_origins = ["*"]
-elif not any(allowed_origins): # If the env var is empty or only commas
-    allowed_origins = [] # Or a sensible default like your local dev URL
-
-# Allow HTML/JS on localhost to call FastAPI
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,  # For development only, allows all
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.include_router(chatbot_router, prefix="/api")
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+
+def _allowed_origins() -> list[str]:
+    # Provide a default value (e.g., for local development if the env var isn't set)
+    allowed_origins_str = os.getenv("ALLOWED_ORIGINS", "*")
+
+    # Split the string by comma to create a list of origins
+    # and strip any leading/trailing whitespace from each origin
+    allowed_origins = [origin.strip() for origin in allowed_origins_str.split(",")]
+
+    # If you want to allow all origins if the environment variable is "*"
+    if "*" in allowed_origins and len(allowed_origins) == 1:
+        pass
+    elif allowed_origins_str == "*": # A common way to signify all origins in env
+        allowed_origins = ["*"]
+    elif not any(allowed_origins): # If the env var is empty or only commas
+        allowed_origins = [] # Or a sensible default like your local dev URL
+    return allowed_origins
+
+
+def create_app() -> FastAPI:
+    """
+    Build the application. Nothing touches the network at import time: the
+    upstream client is created on first use (or pre-warmed by the lifespan
+    when UPSTREAM_PREWARM=1), and shutdown drains in-flight requests before
+    the shared client is closed.
+    """
+    drain = lifecycle.Drain()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with lifecycle.lifespan(drain):
+            yield
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_exception_handler(Overloaded, overloaded_response)
+    app.add_exception_handler(ClientDisconnected, disconnected_response)
+
+    # Allow HTML/JS on localhost to call FastAPI
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=_allowed_origins(),  # For development only, allows all
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Lets cross-origin chat clients read the session ID of streamed replies.
+        expose_headers=["X-Session-ID"],
+    )
+    app.add_middleware(lifecycle.DrainMiddleware, drain=drain)
+    if profiling.PROFILING_ENABLED:
+        # Not installed at all when disabled, so unprofiled deployments pay nothing.
+        app.add_middleware(profiling.ProfilingMiddleware, profiler=profiling.profiler)
+    # Outside CORS and draining, so latency includes them and the full body of streamed responses.
+    app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+    # Outermost: the request ID is set before anything else can log.
+    app.add_middleware(RequestContextMiddleware)
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+    app.include_router(router)
+    app.include_router(chatbot_router, prefix="/api")
+    app.include_router(job_router)
+    if profiling.PROFILING_ENABLED:
+        app.include_router(profile_router)
+    return app
+
+
+router = APIRouter()
 
 # Templates
 templates = Jinja2Templates(directory="templates")
 # Import functions and variables from prompt_generator.py
-@app.get("/", response_class=HTMLResponse)
+@router.get("/", response_class=HTMLResponse)
 async def prompt_page(request: Request):
-    return templates.TemplateResponse("generate_prompt.html", {"request": request})
+    # Nothing on the page varies per request: it is rendered once and revalidated with its ETag.
+    return assets.serve(request, assets.page(templates, "generate_prompt.html"))
 
 
-# @app.get("/", response_class=HTMLResponse)
+@router.get("/assets/{name}")
+async def asset(request: Request, name: str):
+    """Content-hashed CSS/JS, precompressed and cacheable forever."""
+    found = assets.bundle().by_name.get(name)
+    if found is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return assets.serve(request, found)
+
+
+# @router.get("/", response_class=HTMLResponse)
 # async def read_root(request: Request):
 #     return RedirectResponse(url="/home")
 
-@app.post("/generate")
+def _generation_response(result: Generation) -> JSONResponse:
+    headers = {"X-Cache": result.cache}
+    if result.provider:
+        # After a hedge or failover this names the provider that actually answered.
+        headers["X-Provider"] = result.provider
+    return JSONResponse({"prompt": result.text}, headers=headers)
+
+
+def _invalid_task(task: Any) -> Response | dict[str, str] | None:
+    """The error response for a missing or malformed ``task``; ``None`` when it is usable."""
+    if not task:
+        return {"error": "Please provide a 'task'"}
+    if not isinstance(task, str):
+        return JSONResponse({"error": "'task' must be a string"}, status_code=400)
+    if not task.strip():
+        return {"error": "Please provide a 'task'"}
+    return None
+
+
+@router.post("/generate")
 async def generate_prompt(request: Request):
     body = await request.json()
     task_description = body.get("task")
     provider = body.get("provider")
-    if not task_description:
-        return {"error": "Please provide a 'task'"}
+    if (invalid := _invalid_task(task_description)) is not None:
+        return invalid
     if not provider:
         return {"error": "Please select a 'provider'"}
-    prompt = create_prompt(task_description, provider)
-    return {"prompt": prompt}
-@app.post("/generate-short")
+    gate = gate_provider(task_description, provider, "detailed")
+    if gate is None:
+        # Unknown providers are answered at once, without a gate of their own.
+        return _generation_response(await generate(task_description, str(provider), "detailed"))
+    async with admission.admit(request, "/generate", gate, DETAILED):
+        result = await generate(task_description, provider, "detailed")
+    return _generation_response(result)
+
+
+@router.post("/generate/stream")
+async def generate_prompt_stream(request: Request):
+    """Like /generate, but streams tokens as Server-Sent Events."""
+    body = await request.json()
+    task_description = body.get("task")
+    provider = body.get("provider")
+    if (invalid := _invalid_task(task_description)) is not None:
+        return invalid
+    if not provider:
+        return {"error": "Please select a 'provider'"}
+    gate = gate_provider(task_description, provider, "detailed")
+    response = sse_response(stream_prompt(task_description, str(provider)), endpoint="/generate/stream")
+    if gate is None:
+        return response
+    return await admission.hold("/generate/stream", gate, DETAILED, response)
+
+
+@router.post("/generate/batch")
+async def generate_prompt_batch(request: Request):
+    """
+    Generate prompts for a list of {task, provider, mode} items. Results are
+    streamed back as NDJSON, one line per item, in completion order.
+    """
+    body = await request.json()
+    items = body.get("items") if isinstance(body, dict) else body
+    if not isinstance(items, list) or not items:
+        return JSONResponse({"error": "Please provide a non-empty 'items' list"}, status_code=400)
+    if len(items) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"A batch may contain at most {BATCH_MAX_ITEMS} items"}, status_code=400)
+
+    async def ndjson():
+        async for result in generate_batch(items):
+            yield json.dumps(result) + "\n"
+
+    return await admission.hold("/generate/batch", None, DETAILED, StreamingResponse(ndjson(), media_type="application/x-ndjson"))
+
+
+@router.post("/generate-short")
 async def generate_short_prompt(request: Request):
     data = await request.json()
     task = data.get("task")
     provider = data.get("provider")
-    if not task:
-        return {"error": "Please provide a 'task'"}
+    if (invalid := _invalid_task(task)) is not None:
+        return invalid
     if not provider:
         return {"error": "Please select a 'provider'"}
+    gate = gate_provider(task, provider, "short")
+    if gate is None:
+        return _generation_response(await generate(task, str(provider), "short"))
 
     try:
-        prompt = create_short_prompt(task, provider)
-        return JSONResponse({"prompt": prompt})
+        async with admission.admit(request, "/generate-short", gate, SHORT):
+            result = await generate(task, provider, "short")
+        return _generation_response(result)
+    except (Overloaded, ClientDisconnected):
+        raise
     except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Under several workers, report the totals over all of them.
+    body = await asyncio.to_thread(shared_metrics.render) if shared_metrics is not None else metrics.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+app = create_app()
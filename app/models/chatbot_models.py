@@ -3,6 +3,9 @@ from pydantic import BaseModel
 
 class ChatbotRequest(BaseModel):
     message: str
+    # Continue an earlier conversation; omitted, unknown or expired IDs start a new one.
+    session_id: str | None = None
 
 class ChatbotResponse(BaseModel):
     reply: str
+    session_id: str | None = None
@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class JobRequest(BaseModel):
+    # "detailed" or "short" (prompt generation, needs a provider) or "improve" (Vani).
+    kind: str = "detailed"
+    task: str
+    provider: str | None = None
@@ -1,198 +1,350 @@
 # app/prompt_creator.py
+import asyncio
 import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
 
 from dotenv import load_dotenv
-import requests
-from together import Together
 
-load_dotenv()
-client = Together()  # Uses TOGETHER_API_KEY from environment
+from app.core.admission import DETAILED, admission
+from app.core.cache import cache_key, cache_scope, prompt_cache
+from app.core.generation_controls import SectionCutter, TokenBudget, replies_truncated
+from app.core.hedging import hedger
+from app.core.local_generator import LOCAL_PROVIDER, local_fallbacks, render_local
+from app.core.prompt_templates import load_template, record_prompt_cost
+from app.core.providers import extract_content, finish_reason, registry
+from app.core.routing import AUTO_PROVIDER, router
+from app.core.similarity import similar_prompts
+from app.core.singleflight import SingleFlight
 
-# Load API keys from .env
-TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
+load_dotenv()  # Loads TOGETHER_API_KEY from .env
 
-def _safe_extract_content(response) -> str:
-    """Best-effort extraction of text from Together SDK responses.
-    Handles variations where choices/message/content may be missing or None.
+# Upper bound on concurrent upstream calls per provider within one batch.
+BATCH_PROVIDER_CONCURRENCY = int(os.getenv("BATCH_PROVIDER_CONCURRENCY", "4"))
+# Degraded mode: answer with the local rule-based prompt when the upstream fails,
+# or has not answered (for streams: sent its first token) within the budget.
+LOCAL_FALLBACK_ENABLED = os.getenv("LOCAL_FALLBACK_ENABLED", "0") == "1"
+LOCAL_FALLBACK_BUDGET = float(os.getenv("LOCAL_FALLBACK_BUDGET", "10"))
+
+# System prompts are compiled from app/prompts/*.md once, at import.
+DETAILED_SYSTEM_PROMPT = load_template("detailed_system").text
+LLAMA_DETAILED_SYSTEM_PROMPT = load_template("llama_detailed_system").text
+SHORT_SYSTEM_PROMPT = load_template("short_system").text
+
+@dataclass(frozen=True)
+class Mode:
+    """How one kind of prompt ("detailed" / "short") is requested and reported."""
+
+    # (system prompt, user message prefix) per provider; unlisted providers use the default.
+    styles: dict[str, tuple[str, str]]
+    default_style: tuple[str, str]
+    params: dict[str, Any] = field(default_factory=dict)
+    # Sizes max_tokens from the task; overrides any max_tokens in params.
+    budget: TokenBudget | None = None
+    # Trailing sections the UI never shows, per provider style: stopped upstream and cut from the reply.
+    cutters: dict[str, SectionCutter] = field(default_factory=dict)
+    unknown_provider: str = "❌ Unknown provider: {provider}"
+    error: str = "❌ Error: {error}"
+
+    def style(self, provider: str) -> tuple[str, str]:
+        return self.styles.get(provider, self.default_style)
+
+    def cutter(self, provider: str) -> SectionCutter | None:
+        return self.cutters.get(provider)
+
+    def request_params(self, task_description: str, provider: str) -> dict[str, Any]:
+        params = dict(self.params)
+        if self.budget is not None:
+            params["max_tokens"] = self.budget.for_task(task_description)
+        cutter = self.cutter(provider)
+        if cutter is not None:
+            params["stop"] = cutter.stop_sequences()
+        return params
+
+    def finish(self, text: str, provider: str) -> str:
+        cutter = self.cutter(provider)
+        return cutter.cut(text) if cutter is not None else text
+
+
+MODES = {
+    "detailed": Mode(
+        styles={"llama": (LLAMA_DETAILED_SYSTEM_PROMPT, "Here is the user prompt: ")},
+        default_style=(DETAILED_SYSTEM_PROMPT, "user prompt: "),
+        # A full detailed prompt (persona, task, context, format...) runs to several hundred tokens.
+        budget=TokenBudget(base=900, per_input_token=2.0, ceiling=1500),
+        # Only the llama template asks the model to review its own prompt.
+        cutters={"llama": SectionCutter("Review")},
+    ),
+    "short": Mode(
+        styles={
+            "openai": (SHORT_SYSTEM_PROMPT, "Here is the task for which you need to optimize the prompt: "),
+            "llama": (SHORT_SYSTEM_PROMPT, "Here is the task for which you need to write the prompt: "),
+        },
+        default_style=(SHORT_SYSTEM_PROMPT, "user prompt: "),
+        params={"max_tokens": 100},
+        unknown_provider="Provider not supported.",
+        error="Error: {error}",
+    ),
+}
+
+
+# Routes serving each mode, for the per-endpoint prompt token report.
+MODE_ENDPOINTS = {"detailed": ("/generate", "/generate/stream"), "short": ("/generate-short",)}
+
+
+def _record_prompt_costs() -> None:
+    for mode_name, endpoints in MODE_ENDPOINTS.items():
+        for provider in registry.of_kind():
+            for endpoint in endpoints:
+                record_prompt_cost(endpoint, provider.name, *MODES[mode_name].style(provider.name))
+
+
+_record_prompt_costs()
+
+generation_flight = SingleFlight("generate")
+
+
+@dataclass(frozen=True)
+class Generation:
+    """Result of one prompt generation; ``cache`` is surfaced as the X-Cache header."""
+
+    text: str
+    ok: bool = True
+    cache: str = "MISS"  # HIT, SIMILAR (near-duplicate task), MISS or BYPASS (not cacheable)
+    provider: str = ""  # who produced the text; differs from the request after a hedge or failover
+
+
+def _messages(style: tuple[str, str], task_description: str) -> list[dict[str, str]]:
+    system_prompt, user_prefix = style
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"{user_prefix}{task_description}"},
+    ]
+
+
+def _cache_key(task_description: str, provider: str, mode_name: str) -> str:
+    system_prompt, _ = MODES[mode_name].style(provider)
+    return cache_key(provider, mode_name, registry.get(provider).model, system_prompt, task_description)
+
+
+def _cache_scope(provider: str, mode_name: str) -> str:
+    system_prompt, _ = MODES[mode_name].style(provider)
+    return cache_scope(provider, mode_name, registry.get(provider).model, system_prompt)
+
+
+async def _cached(key: str, task_description: str, provider: str, mode_name: str) -> tuple[str | None, str]:
+    """Look the task up exactly, then among near-duplicate tasks; returns ``(text, "HIT" | "SIMILAR" | "MISS")``."""
+    cached, _ = await prompt_cache.get(key)
+    if cached is not None:
+        return cached, "HIT"
+    if similar_prompts is not None:
+        match = similar_prompts.get(_cache_scope(provider, mode_name), task_description)
+        if match is not None:
+            return match[0], "SIMILAR"
+    return None, "MISS"
+
+
+async def _remember(key: str, task_description: str, provider: str, mode_name: str, text: str) -> None:
+    await prompt_cache.set(key, text)
+    if similar_prompts is not None:
+        similar_prompts.set(_cache_scope(provider, mode_name), task_description, text)
+
+
+def gate_provider(task_description: str, provider: Any, mode_name: str = "detailed") -> str | None:
+    """The provider a request will be served by, for its admission gate; ``None`` when it is unknown.
+
+    Resolved the way ``generate`` resolves it (case-insensitive, "auto" routed), so
+    client spellings never create gates of their own.
     """
-    try:
-        choices = getattr(response, "choices", None)
-        if choices:
-            first = choices[0]
-            msg = getattr(first, "message", None)
-            if msg and getattr(msg, "content", None):
-                return msg.content
-            if getattr(first, "text", None):
-                return first.text
-        if isinstance(response, dict):
-            ch = response.get("choices")
-            if ch and isinstance(ch, list):
-                first = ch[0]
-                if isinstance(first, dict):
-                    msg = first.get("message") or {}
-                    if isinstance(msg, dict) and msg.get("content"):
-                        return msg["content"]
-                    if first.get("text"):
-                        return first["text"]
-        return ""
-    except Exception:
-        return ""
-
-def create_prompt(task_description: str, provider: str) -> str:
+    if not isinstance(provider, str):
+        return None
+    provider = provider.lower()
+    if provider == AUTO_PROVIDER:
+        return router.classify(task_description, mode_name).provider
+    if provider == LOCAL_PROVIDER or registry.serves(provider):
+        return provider
+    return None
+
+
+async def generate(task_description: str, provider: str, mode_name: str = "detailed") -> Generation:
+    """Generate a prompt in the given mode; provider "auto" picks the smallest adequate model for the task."""
+    if provider.lower() != AUTO_PROVIDER:
+        return await _generate(task_description, provider, mode_name)
+    decision = router.route(task_description, mode_name)
+    start = time.perf_counter()
+    result = await _generate(task_description, decision.provider, mode_name)
+    if result.ok and result.cache == "MISS":
+        router.observe(decision, time.perf_counter() - start)
+    return result
+
+
+async def _generate(task_description: str, provider: str, mode_name: str) -> Generation:
+    """Generate a prompt in the given mode, serving repeated tasks from the response cache."""
+    mode = MODES[mode_name]
     provider = provider.lower()
+    if provider == LOCAL_PROVIDER:
+        # Built in microseconds, so there is nothing worth caching.
+        return Generation(render_local(task_description, mode_name), cache="BYPASS", provider=LOCAL_PROVIDER)
+    if not registry.serves(provider):
+        return Generation(mode.unknown_provider.format(provider=provider), ok=False, cache="BYPASS")
+
+    key = _cache_key(task_description, provider, mode_name)
+    cached, status = await _cached(key, task_description, provider, mode_name)
+    if cached is not None:
+        return Generation(cached, cache=status, provider=provider)
+
+    # Identical requests arriving while this one is in flight share its upstream call.
+    return await generation_flight.do(key, lambda: _generate_upstream(key, task_description, provider, mode_name))
+
+
+async def _generate_upstream(key: str, task_description: str, provider: str, mode_name: str) -> Generation:
+    mode = MODES[mode_name]
+
+    async def call(name: str) -> dict[str, Any]:
+        return await registry.get(name).chat(_messages(mode.style(name), task_description), **mode.request_params(task_description, name))
+
+    # Falls back along the provider's chain on errors, and hedges slow calls when enabled.
+    chain = hedger.chain(provider, (p.name for p in registry.of_kind()))
+    try:
+        if LOCAL_FALLBACK_ENABLED:
+            response, served_by = await asyncio.wait_for(hedger.run(chain, call), LOCAL_FALLBACK_BUDGET)
+        else:
+            response, served_by = await hedger.run(chain, call)
+    except Exception as e:
+        if LOCAL_FALLBACK_ENABLED:
+            return _local_fallback(task_description, provider, mode_name, e)
+        return Generation(mode.error.format(error=str(e)), ok=False, provider=provider)
+    # Post-processed once here, so cached replies are stored ready to serve.
+    raw = extract_content(response)
+    text = mode.finish(raw, served_by)
+    # Cut off at max_tokens before any section the cutter drops: the prompt itself is incomplete.
+    if finish_reason(response) == "length" and text == raw:
+        replies_truncated.inc(provider=served_by, mode=mode_name)
+        return Generation(text, cache="BYPASS", provider=served_by)
+    if text:
+        # A backup's reply (failover or hedge win) is cached as that provider's, never as the one asked for.
+        if served_by != provider:
+            key = _cache_key(task_description, served_by, mode_name)
+        await _remember(key, task_description, served_by, mode_name, text)
+    return Generation(text, provider=served_by)
+
+
+def _local_fallback(task_description: str, provider: str, mode_name: str, error: BaseException) -> Generation:
+    """The local prompt, served in place of a failed or late upstream reply; not cached, so the next request tries upstream again."""
+    local_fallbacks.inc(provider=provider, mode=mode_name, reason="timeout" if isinstance(error, asyncio.TimeoutError) else "error")
+    return Generation(render_local(task_description, mode_name), cache="BYPASS", provider=LOCAL_PROVIDER)
+
+
+async def create_prompt(task_description: str, provider: str) -> str:
     """
     Takes a simple task description and uses an LLM to generate
     a structured, optimized prompt in Markdown format.
     """
-    
-    # The system prompt is updated to request Markdown output with specific headings.
-    system_prompt = (
-        "You are a senior prompt engineer. Transform the user's request into a "
-        "structured,"
-        " professional prompt in Markdown with the following sections:"
-        "\n\n### Persona\nDescribe the relevant role."
-        "\n\n### Task\nRewrite the user request as a clear instruction."
-        "\n\n### Constraints\nList concrete requirements, acceptance criteria, "
-        "and boundaries."
-        "\n\n### Audience (include only if explicitly provided)"
-        "\n\n### Tone & Style (include only if explicitly provided)"
-    )
+    return (await generate(task_description, provider, "detailed")).text
 
-    try:
-        if provider == "openai":
-            response = client.chat.completions.create(
-                model="openai/gpt-oss-20b",
-                messages=[
-                    {"role": "system", "content": system_prompt },
-                    {"role": "user", "content": f"user prompt: {task_description}"}
-                ],
-                
-            )
-            return _safe_extract_content(response)
-
-        elif provider == "llama":
-            url = "https://api.together.xyz/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {TOGETHER_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "You have to convert the user prompt prompt that will get an "
-                            "output at a professional level. Assume an appropriate role "
-                            "before sending me the prompt, review it yourself and optimize "
-                            "to make it extremely detailed."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            "Here is the user prompt: "
-                            f"{task_description}"
-                        ),
-                    },
-                ],
-            }
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-
-        elif provider == "gemma":
-            response = client.chat.completions.create(
-                model="google/gemma-3n-E4B-it",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"user prompt: {task_description}"}
-                ]
-            )
-            return _safe_extract_content(response)
-
-        else:
-            return f"❌ Unknown provider: {provider}"
 
-    except Exception as e:
-        return f"❌ Error: {str(e)}"    
-            
-def create_short_prompt(task_description: str, provider: str) -> str:
+async def stream_prompt(task_description: str, provider: str) -> AsyncIterator[str]:
+    """Streaming variant of ``create_prompt`` that yields tokens as the model produces them."""
+    mode = MODES["detailed"]
     provider = provider.lower()
+    decision = None
+    if provider == AUTO_PROVIDER:
+        decision = router.route(task_description, "detailed")
+        provider = decision.provider
+    if provider == LOCAL_PROVIDER:
+        yield render_local(task_description)
+        return
+    if not registry.serves(provider):
+        yield mode.unknown_provider.format(provider=provider)
+        return
+
+    key = _cache_key(task_description, provider, "detailed")
+    cached, _ = await _cached(key, task_description, provider, "detailed")
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    finish: list[str] = []
+    start = time.perf_counter()
+    deltas = registry.get(provider).stream_chat(_messages(mode.style(provider), task_description), finish=finish, **mode.request_params(task_description, provider))
+    cutter = mode.cutter(provider)
+    if cutter is not None:
+        deltas = cutter.cut_stream(deltas)
     try:
-        if provider == "openai":
-            response = client.chat.completions.create(
-                model="openai/gpt-oss-20b",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You have to convert the user prompt that will get an output "
-                            "at a professional level. Before sending me the prompt, review "
-                            "it yourself and optimize to make it under 101 tokens."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            "Here is the task for which "
-                            "you need to optimize the prompt: "
-                            f"{task_description}"
-                        ),
-                    },
-                ],
-                max_tokens=100,
-            )
-            return _safe_extract_content(response)
-        elif provider == "llama":
-            url = "https://api.together.xyz/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {TOGETHER_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "You have to convert the user prompt that will get an output "
-                            "at a professional level. Before sending me the prompt, review "
-                            "it yourself and optimize to make it under 101 tokens."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            "Here is the task for which "
-                            "you need to write the prompt: "
-                            f"{task_description}"
-                        ),
-                    },
-                ],
-                "max_tokens": 100,
-            }
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-        elif provider == "gemma":
-            response = client.chat.completions.create(
-                model="google/gemma-3n-E4B-it",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You have to convert the user prompt that will get an output "
-                            "at a professional level. Before sending me the prompt, review "
-                            "it yourself and optimize to make it under 101 tokens."
-                        ),
-                    },
-                    {"role": "user", "content": f"user prompt: {task_description}"},
-                ],
-                max_tokens=100,
-            )
-            return _safe_extract_content(response)
-        else:
-            return "Provider not supported."
+        if LOCAL_FALLBACK_ENABLED:
+            try:
+                first = await asyncio.wait_for(anext(deltas), LOCAL_FALLBACK_BUDGET)
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await deltas.aclose()
+                yield _local_fallback(task_description, provider, "detailed", e).text
+                return
+            parts.append(first)
+            yield first
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
     except Exception as e:
-        return f"Error: {str(e)}"
+        yield mode.error.format(error=str(e))
+        return
+    if parts:
+        if decision is not None:
+            router.observe(decision, time.perf_counter() - start)
+        # The cutter closes the stream before its end, so "length" here means the prompt itself was cut off.
+        if "length" in finish:
+            replies_truncated.inc(provider=provider, mode="detailed")
+        else:
+            await _remember(key, task_description, provider, "detailed", mode.finish("".join(parts), provider))
+
+
+async def create_short_prompt(task_description: str, provider: str) -> str:
+    return (await generate(task_description, provider, "short")).text
+
+
+async def generate_batch(items: list[dict[str, Any]], per_provider: int = BATCH_PROVIDER_CONCURRENCY) -> AsyncIterator[dict[str, Any]]:
+    """Generate prompts for many {task, provider, mode} items concurrently.
+
+    Yields one result dict per item in completion order. Invalid items and
+    upstream failures are reported per item as ``error`` and never fail the batch.
+    """
+    semaphores: dict[str, asyncio.Semaphore] = {}
+
+    async def run_item(index: int, item: Any) -> dict[str, Any]:
+        if not isinstance(item, dict):
+            return {"index": index, "error": "Each item must be an object"}
+        task, provider, mode_name = item.get("task"), item.get("provider"), item.get("mode", "detailed")
+        result: dict[str, Any] = {"index": index, "task": task, "provider": provider, "mode": mode_name}
+        if not task:
+            return {**result, "error": "Please provide a 'task'"}
+        if not provider:
+            return {**result, "error": "Please select a 'provider'"}
+        for name, value in (("task", task), ("provider", provider), ("mode", mode_name)):
+            if not isinstance(value, str):
+                return {**result, "error": f"'{name}' must be a string"}
+        if not task.strip():
+            return {**result, "error": "Please provide a 'task'"}
+        if mode_name not in MODES:
+            return {**result, "error": f"Unknown mode: {mode_name}"}
+        semaphore = semaphores.setdefault(provider.lower(), asyncio.Semaphore(per_provider))
+        try:
+            # Bulk work: items queue for the provider behind interactive requests.
+            async with semaphore, admission.slot(gate_provider(task, provider, mode_name), DETAILED):
+                generation = await generate(task, provider, mode_name)
+        except Exception as e:
+            # One failing item never ends the batch for the others.
+            return {**result, "error": str(e)}
+        if generation.ok:
+            return {**result, "prompt": generation.text, "cache": generation.cache}
+        return {**result, "error": generation.text}
+
+    tasks = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away or the consumer stopped early: drop outstanding work.
+        for task in tasks:
+            task.cancel()
@@ -5,32 +5,52 @@
     const resultSection = document.getElementById('resultSection');
     const resultPre = document.getElementById('result');
 // ...existing code...
-    // --- Mock Functions for Tool Logic ---
-    // Function to simulate showing the loading spinner and then a result
+    // Hide the spinner and show the result as soon as it has arrived
   function showLoadingAndResult(promptText) {
-    resultSection.classList.add('hidden');
-    // Simulate a network request
-    setTimeout(() => {
-      loadingSpinner.classList.add('hidden');
-      resultPre.textContent = promptText;
-      resultSection.classList.remove('hidden');
-    }, 1500); // 1.5 second delay
+    loadingSpinner.classList.add('hidden');
+    resultPre.textContent = promptText;
+    resultSection.classList.remove('hidden');
+  }
+  /**
+   * Reads a Server-Sent Events response and calls onEvent(eventName, data) for each event.
+   * Token events have no name and carry { delta }; the stream ends with "done" or "error".
+   */
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let eventName = 'message';
+        let data = '';
+        for (const line of rawEvent.split('\n')) {
+          if (line.startsWith('event:')) eventName = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (data) onEvent(eventName, JSON.parse(data));
+      }
+    }
   }
   /**
    * Asynchronously generates a prompt based on the user's task description and selected provider.
-   * Shows a loading spinner while fetching data from the server, and updates the result element with
-   * the response prompt or an error message. Displays a copy button if the prompt generation is successful.
+   * Streams tokens from the server and renders them into the result element as they arrive.
    * 
    * Elements:
    * - task: The task description input by the user.
    * - provider: The selected AI provider.
-   * - resultElement: The element where the resulting prompt or error message is displayed.
-   * - copyButtonContainer: The element containing the copy button, shown if a prompt is successfully generated.
-   * - loadingSpinner: The spinner displayed during the API call.
+   * - resultPre: The element where the resulting prompt or error message is displayed.
+   * - loadingSpinner: The spinner displayed until the first token arrives.
    * - generateBtn: The button that triggers prompt generation, disabled during the call.
    * 
    * API:
-   * - POST /generate: Expects a JSON body with 'task' and 'provider' fields, returns a prompt or error.
+   * - POST /generate/stream: Expects a JSON body with 'task' and 'provider' fields, returns
+   *   Server-Sent Events ({ delta } tokens, then "done" with ttft_ms/total_ms) or a JSON error.
    */
     async function generatePrompt() {
       const task = document.getElementById('task').value;
@@ -41,20 +61,31 @@
       generateBtn.classList.add('opacity-50', 'cursor-not-allowed');
       try {
         const baseUrl = window.location.origin; // Gets current domain automatically
-        const response = await fetch(`${baseUrl}/generate`, {
+        const response = await fetch(`${baseUrl}/generate/stream`, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ task, provider })
         });
-        const data = await response.json();
-        let output = data.prompt || data.error || "❌ Unexpected error";
-        // Remove "Review and Optimization:" and everything after it
-        // Remove "Review" and everything after it, if present
-        const reviewMatch = output.match(/Review[\s\S]*/);
-        if (reviewMatch) {
-          output = output.substring(0, reviewMatch.index).trim();
+        const contentType = response.headers.get('content-type') || '';
+        if (!contentType.includes('text/event-stream')) {
+          const data = await response.json();
+          showLoadingAndResult(data.prompt || data.error || "❌ Unexpected error");
+          return;
         }
-        showLoadingAndResult(output);
+        let output = '';
+        resultPre.textContent = '';
+        await readEventStream(response, (eventName, data) => {
+          if (eventName === 'error') {
+            output += `\n❌ ${data.error}`;
+          } else if (eventName === 'done') {
+            console.debug(`prompt streamed: first token ${data.ttft_ms} ms, total ${data.total_ms} ms`);
+          } else {
+            output += data.delta;
+          }
+          loadingSpinner.classList.add('hidden');
+          resultPre.textContent = output;
+          resultSection.classList.remove('hidden');
+        });
       } catch (err) {
         resultPre.innerText = "❌ Unable to reach server. Check console.";
         console.error(err);
@@ -140,6 +171,7 @@
 
     chatbotBody.appendChild(messageDiv);
     chatbotBody.scrollTop = chatbotBody.scrollHeight;
+    return messageDiv;
   };
       
   const showTypingIndicator = () => {
@@ -158,6 +190,8 @@
     }
   };
 
+  let chatSessionId = null;
+
   const handleUserQuery = async (userMessage) => {
     if (!userMessage) return;
 
@@ -172,26 +206,50 @@
     showTypingIndicator();
     // --- Backend Communication ---
     try {
-        // Replace with your actual FastAPI endpoint
-        const response = await fetch(`${API_BASE_URL}/api/chat`, {
+        const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({ message: userMessage }),
+            body: JSON.stringify({ message: userMessage, session_id: chatSessionId }),
         });
 
-        removeTypingIndicator();
-
         if (!response.ok) {
           throw new Error('Network response was not ok');
-            
         }
+        // The server keeps the conversation; later messages continue it.
+        chatSessionId = response.headers.get('X-Session-ID') || chatSessionId;
 
-        const data = await response.json();
-        const botMessage = data.reply; // Adjust based on your API response structure
-
-        addMessage(botMessage, 'bot');
+        // Render Vani's reply incrementally as tokens arrive.
+        let botDiv = null;
+        let botText = '';
+        const render = () => {
+          if (!botDiv) {
+            removeTypingIndicator();
+            botDiv = addMessage('', 'bot');
+          }
+          if (window.marked && typeof window.marked.parse === 'function') {
+            botDiv.innerHTML = window.marked.parse(botText);
+          } else {
+            botDiv.textContent = botText;
+          }
+          chatbotBody.scrollTop = chatbotBody.scrollHeight;
+        };
+        await readEventStream(response, (eventName, data) => {
+          if (eventName === 'error') {
+            botText += botText ? `\n\n${data.error}` : data.error;
+          } else if (eventName === 'done') {
+            console.debug(`reply streamed: first token ${data.ttft_ms} ms, total ${data.total_ms} ms`);
+            return;
+          } else {
+            botText += data.delta;
+          }
+          render();
+        });
+        removeTypingIndicator();
+        if (!botDiv) {
+          addMessage("Sorry, I didn't get a reply. Please try again.", 'bot');
+        }
 
     } catch (error) {
         removeTypingIndicator();
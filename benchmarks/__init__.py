@@ -0,0 +1 @@
+"""Offline benchmarks run against a local fake Together server."""
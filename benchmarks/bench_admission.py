@@ -0,0 +1,124 @@
+"""Overload behaviour with and without admission control.
+
+Requests arrive open-loop (Poisson, ``--rate`` per second) for ``--duration``
+seconds. ``--short-share`` of them go to ``/generate-short`` and the rest to
+``/generate``. The upstream is modelled in-process: it serves ``--capacity``
+calls at a time, each taking ``--latency`` seconds, and queues the rest. Any
+rate above ``capacity / latency`` is therefore overload. Clients give up after
+``--client-timeout`` seconds.
+
+"off" admits everything, as the app did before; "on" uses the gates with the
+limits given. For each class the table shows latency percentiles of the
+answers that arrived in time, how many were shed with a 503, and how many
+timed out. ``wasted`` counts upstream calls made for clients that had already
+given up.
+
+    python -m benchmarks.bench_admission --rate 60 --capacity 8 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+from app import main as app_main
+from app.core.admission import AdmissionController
+from app.prompt_generator import Generation
+
+
+class Upstream:
+    """A provider that handles ``capacity`` calls at once and queues the rest."""
+
+    def __init__(self, capacity: int, latency: float):
+        self.latency = latency
+        self._slots = asyncio.Semaphore(capacity)
+        self.calls = 0
+        self.wasted = 0
+
+    async def generate(self, task_description: str, provider: str, mode_name: str = "detailed") -> Generation:
+        async with self._slots:
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+        if time.perf_counter() > float(task_description):
+            self.wasted += 1
+        return Generation("ok")
+
+
+def _percentile(samples: list[float], p: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100)[p - 1]
+
+
+@dataclass
+class Outcome:
+    ok: list[float] = field(default_factory=list)
+    shed: int = 0
+    timeout: int = 0
+
+
+async def run(args: argparse.Namespace, controller: AdmissionController) -> tuple[dict[str, Outcome], Upstream]:
+    upstream = Upstream(args.capacity, args.latency)
+    app_main.generate = upstream.generate
+    app_main.admission = controller
+    results = {path: Outcome() for path in ("/generate-short", "/generate")}
+    rng = random.Random(1)
+
+    async def one(client: httpx.AsyncClient, path: str) -> None:
+        start = time.perf_counter()
+        # The task carries the client's deadline so the upstream can tell wasted calls.
+        payload = {"task": str(start + args.client_timeout), "provider": "llama"}
+        try:
+            response = await asyncio.wait_for(client.post(path, json=payload), args.client_timeout)
+        except asyncio.TimeoutError:
+            results[path].timeout += 1
+            return
+        if response.status_code == 503:
+            results[path].shed += 1
+        else:
+            results[path].ok.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app_main.app), base_url="http://bench") as client:
+        tasks = []
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            path = "/generate-short" if rng.random() < args.short_share else "/generate"
+            tasks.append(asyncio.ensure_future(one(client, path)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+        # Let calls already in the upstream finish, so ``wasted`` counts them.
+        await asyncio.sleep(args.client_timeout)
+    return results, upstream
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=60, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--short-share", type=float, default=0.3)
+    parser.add_argument("--capacity", type=int, default=8, help="concurrent upstream calls")
+    parser.add_argument("--latency", type=float, default=0.2, help="upstream seconds per call")
+    parser.add_argument("--client-timeout", type=float, default=3.0)
+    parser.add_argument("--limit", type=int, default=8, help="admission in-flight limit per gate")
+    parser.add_argument("--queue", type=int, default=16, help="admission queue per gate")
+    parser.add_argument("--queue-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{args.rate:g} req/s offered, upstream capacity {args.capacity / args.latency:g} req/s, client timeout {args.client_timeout:g}s")
+    print(f"{'admission':<11}{'endpoint':<17}{'ok':>6}{'p50':>9}{'p99':>9}{'shed':>6}{'timeout':>8}{'wasted':>8}")
+    scenarios = {
+        "off": AdmissionController(endpoint_limit=10**6, endpoint_queue=0, provider_limit=10**6, provider_queue=0),
+        "on": AdmissionController(endpoint_limit=10**6, endpoint_queue=0, provider_limit=args.limit, provider_queue=args.queue, timeout=args.queue_timeout),
+    }
+    for label, controller in scenarios.items():
+        results, upstream = asyncio.run(run(args, controller))
+        for path, r in results.items():
+            print(f"{label:<11}{path:<17}{len(r.ok):>6}{_percentile(r.ok, 50) * 1000:>7.0f}ms{_percentile(r.ok, 99) * 1000:>7.0f}ms{r.shed:>6}{r.timeout:>8}{upstream.wasted:>8}")
+
+
+if __name__ == "__main__":
+    main()
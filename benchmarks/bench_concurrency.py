@@ -0,0 +1,88 @@
+"""Throughput of /generate, /generate-short and /api/chat vs. client concurrency.
+
+Runs the app in-process against a local fake upstream with a fixed latency.
+With a non-blocking provider layer, requests/second should grow roughly
+linearly with concurrency (up to ``concurrency / latency``); a blocking call
+anywhere on the path pins it at ``1 / latency``. Every request carries a
+distinct task, so the response cache and request coalescing never answer
+for the upstream.
+
+    python -m benchmarks.bench_concurrency --latency 0.1 --requests 64
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+import httpx
+
+from benchmarks.fake_together import FakeTogether
+
+# Request bodies; "{n}" makes each one distinct.
+ENDPOINTS = {
+    "/generate": {"task": "write a poem about the sea, variant {n}", "provider": "llama"},
+    "/generate-short": {"task": "write a poem about the sea, variant {n}", "provider": "gemma"},
+    "/api/chat": {"message": "Ask GPT: what is haiku number {n}?"},
+}
+_serial = itertools.count()
+
+
+async def drive(app, path: str, body: dict, total: int, concurrency: int) -> float:
+    """Send ``total`` requests with at most ``concurrency`` in flight; return requests/second."""
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one() -> None:
+            n = next(_serial)
+            async with semaphore:
+                response = await client.post(path, json={key: value.format(n=n) for key, value in body.items()})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return total / (time.perf_counter() - start)
+
+
+async def run(args: argparse.Namespace) -> None:
+    from app import main
+    from app.core import providers
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"upstream latency {args.latency * 1000:.0f} ms, {args.requests} requests per cell")
+    print(f"{'endpoint':<16}" + "".join(f"{f'c={c}':>12}" for c in args.concurrency))
+    for path, body in ENDPOINTS.items():
+        row = [await drive(main.app, path, body, args.requests, c) for c in args.concurrency]
+        print(f"{path:<16}" + "".join(f"{rps:>9.1f}/s" for rps in row))
+    reused = providers.upstream_requests.value(reused="true")
+    fresh = providers.upstream_requests.value(reused="false")
+    print(f"upstream connections: {fresh:.0f} opened, {reused:.0f} requests reused a pooled connection")
+    await providers.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    server = FakeTogether(latency=args.latency)
+    os.environ["TOGETHER_BASE_URL"] = server.start()
+    os.environ.setdefault("TOGETHER_API_KEY", "bench-key")
+    # Measure the request path, not the client-side rate limiter.
+    os.environ.setdefault("RATE_LIMIT_RPS", "100000")
+    os.environ.setdefault("RATE_LIMIT_BURST", "100000")
+    os.environ["SIMILARITY_CACHE_ENABLED"] = "0"
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""First-load and repeat-load cost of the prompt page.
+
+A small client plays the browser's part. It fetches the page and then every
+stylesheet and script on it. On a repeat load it skips responses it may
+cache (``max-age``/``immutable``) and revalidates the rest with their
+``ETag``/``Last-Modified``. It accepts gzip and, if installed, brotli.
+
+"before" serves the page as it used to be served: the template is rendered
+on every hit, and ``/static/style.css`` and ``/static/main.js`` come from the
+plain ``StaticFiles`` mount. The old page also loaded the Tailwind Play CDN
+script, which compiles CSS in the browser, and Google Fonts. Neither can be
+fetched offline, so "before" understates the old cost. "after" is the
+current page: it is rendered once and served with an ETag, and it uses
+hashed, precompressed assets.
+
+Bytes are what went over the wire. ``est`` models a ``--rtt`` ms /
+``--mbps`` link: one round trip per dependency level, plus transfer time.
+
+    python -m benchmarks.bench_frontend --rtt 80 --mbps 10
+"""
+
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+
+from app import main as app_main
+from app.core.assets import brotli
+
+LEGACY_URLS = {"app.css": "/static/style.css", "main.js": "/static/main.js"}
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+
+    @app.get("/")
+    async def page(request: Request):
+        return app_main.templates.TemplateResponse(request, "generate_prompt.html", {"asset_url": LEGACY_URLS.get})
+
+    return app
+
+
+class Browser:
+    """Just enough of an HTTP cache to tell first loads from repeat loads."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.cache: dict[str, httpx.Response] = {}
+
+    async def fetch(self, url: str) -> tuple[httpx.Response | None, int]:
+        """Return (response or None if served from cache, bytes downloaded)."""
+        cached = self.cache.get(url)
+        headers = {}
+        if cached is not None:
+            cache_control = cached.headers.get("cache-control", "")
+            if "immutable" in cache_control or re.search(r"max-age=[1-9]", cache_control):
+                return None, 0
+            if "etag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["etag"]
+            if "last-modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["last-modified"]
+        response = await self.client.get(url, headers=headers)
+        if response.status_code == 200:
+            self.cache[url] = response
+        return response, response.num_bytes_downloaded
+
+    async def load(self) -> tuple[float, int, int, int]:
+        """Load the page; return (seconds, requests, bytes, round trips)."""
+        start = time.perf_counter()
+        response, size = await self.fetch("/")
+        requests, trips = int(response is not None), int(response is not None)
+        html = (response if response is not None and response.status_code == 200 else self.cache["/"]).text
+        urls = re.findall(r'<(?:link rel="stylesheet"|script)[^>]*(?:href|src)="(/[^"]+)"', html)
+        results = await asyncio.gather(*(self.fetch(url) for url in urls))
+        fetched = [r for r, _ in results if r is not None]
+        requests += len(fetched)
+        trips += bool(fetched)
+        return time.perf_counter() - start, requests, size + sum(n for _, n in results), trips
+
+
+async def measure(app, loads: int, encoding: str) -> dict[str, tuple[float, int, int, int]]:
+    rows = {}
+    for label in ("first", "repeat"):
+        samples = []
+        for _ in range(loads):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", headers={"Accept-Encoding": encoding}) as client:
+                browser = Browser(client)
+                result = await browser.load()
+                if label == "repeat":
+                    result = await browser.load()
+                samples.append(result)
+        seconds = statistics.median(s[0] for s in samples)
+        rows[label] = (seconds, *samples[-1][1:])
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loads", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=80, help="modelled round-trip time, ms")
+    parser.add_argument("--mbps", type=float, default=10, help="modelled bandwidth, Mbit/s")
+    args = parser.parse_args()
+
+    encoding = "br, gzip" if brotli is not None else "gzip"
+    print(f"Accept-Encoding: {encoding}; modelled link {args.rtt:.0f} ms RTT, {args.mbps:g} Mbit/s")
+    print(f"{'version':<9}{'load':<8}{'requests':>9}{'bytes':>9}{'server':>10}{'est':>9}")
+    for label, app in (("before", legacy_app()), ("after", app_main.app)):
+        for load, (seconds, requests, size, trips) in asyncio.run(measure(app, args.loads, encoding)).items():
+            estimate = trips * args.rtt / 1000 + size * 8 / (args.mbps * 1e6)
+            print(f"{label:<9}{load:<8}{requests:>9}{size:>9}{seconds * 1000:>8.2f}ms{estimate * 1000:>7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
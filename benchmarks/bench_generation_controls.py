@@ -0,0 +1,83 @@
+"""Generation time and completion tokens with and without generation controls.
+
+The fake upstream replies with a ``--prompt-words`` prompt followed by a
+``**Review:**`` section of ``--review-words`` that the UI never shows, at
+``--token-delay`` seconds per word. Requests go to llama, whose template is
+the one that asks for a review. "before" sends the detailed mode without
+stop sequences or a token budget (the review is generated and thrown away);
+"after" uses the mode as configured. Tasks are distinct, so nothing is cached.
+
+    python -m benchmarks.bench_generation_controls --requests 20 --token-delay 0.002
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import os
+import statistics
+import time
+
+from benchmarks.fake_together import FakeTogether
+
+
+async def run(pg, server: FakeTogether, total: int, stream: bool) -> tuple[list[float], float, float]:
+    """Return per-request seconds, completion tokens per request and reply characters per request."""
+    samples, chars = [], 0
+    tokens_before = server.completion_tokens
+    for i in range(total):
+        task = f"write a product launch email for gadget {i} {time.perf_counter()}"
+        start = time.perf_counter()
+        if stream:
+            text = "".join([delta async for delta in pg.stream_prompt(task, "llama")])
+        else:
+            text = (await pg.generate(task, "llama", "detailed")).text
+        samples.append(time.perf_counter() - start)
+        chars += len(text)
+    return samples, (server.completion_tokens - tokens_before) / total, chars / total
+
+
+async def compare(pg, server: FakeTogether, total: int) -> None:
+    from app.core.providers import aclose
+
+    configured = pg.MODES["detailed"]
+    uncontrolled = dataclasses.replace(configured, budget=None, cutters={})
+    print(f"{'endpoint':<12}{'controls':<10}{'p50':>9}{'mean':>9}{'completion tokens':>19}{'reply chars':>13}")
+    try:
+        for stream in (False, True):
+            for label, mode in (("before", uncontrolled), ("after", configured)):
+                pg.MODES["detailed"] = mode
+                samples, tokens, chars = await run(pg, server, total, stream)
+                endpoint = "stream" if stream else "generate"
+                print(f"{endpoint:<12}{label:<10}{statistics.median(samples) * 1000:>7.0f}ms{statistics.mean(samples) * 1000:>7.0f}ms{tokens:>19.0f}{chars:>13.0f}")
+    finally:
+        pg.MODES["detailed"] = configured
+        # The shared upstream client is bound to this event loop.
+        await aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--prompt-words", type=int, default=250)
+    parser.add_argument("--review-words", type=int, default=250)
+    args = parser.parse_args()
+
+    content = "### Task\n" + " ".join(["word"] * args.prompt_words) + "\n**Review:** " + " ".join(["note"] * args.review_words)
+    server = FakeTogether(latency=args.latency, token_delay=args.token_delay, content=content)
+    os.environ["TOGETHER_BASE_URL"] = server.start()
+    os.environ.setdefault("TOGETHER_API_KEY", "bench-key")
+    os.environ.setdefault("RATE_LIMIT_RPS", "100000")
+    os.environ.setdefault("RATE_LIMIT_BURST", "100000")
+    os.environ["SIMILARITY_CACHE_ENABLED"] = "0"
+    import app.prompt_generator as pg
+
+    try:
+        asyncio.run(compare(pg, server, args.requests))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Tail latency of prompt generation with and without hedged requests.
+
+The fake upstream answers in ``--latency`` seconds, except for ``--tail-rate``
+of requests which take ``--tail-latency``. Generations are sent one after
+another (distinct tasks, so nothing is cached) with hedging off and then on;
+with hedging, a backup request to the next provider is fired once the primary
+passes its observed ``--percentile`` latency.
+
+    python -m benchmarks.bench_hedging --requests 200 --tail-rate 0.05 --tail-latency 1
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core import hedging, providers, ratelimit
+from benchmarks.fake_together import FakeTogether
+
+CHAIN = ["llama", "gemma"]
+
+
+async def run(base_url: str, hedger: hedging.Hedger, total: int) -> list[float]:
+    limiters = ratelimit.RateLimiterRegistry(rate=100000, burst=100000)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        client = providers.AsyncTogetherClient(http_client=http, api_key="bench-key", limiters=limiters)
+        models = {name: providers.registry.get(name).model for name in CHAIN}
+
+        async def call(name: str) -> dict:
+            return await client.chat(models[name], [{"role": "user", "content": f"task {time.perf_counter()}"}])
+
+        samples = []
+        for _ in range(total):
+            start = time.perf_counter()
+            await hedger.run(CHAIN, call)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=1.0)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--percentile", type=float, default=90)
+    parser.add_argument("--default-delay", type=float, default=0.2, help="hedge delay until 20 latencies have been observed")
+    args = parser.parse_args()
+
+    server = FakeTogether(latency=args.latency, tail_latency=args.tail_latency, tail_rate=args.tail_rate)
+    base_url = server.start()
+    try:
+        print(f"{'hedging':<10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'upstream calls':>16}")
+        for enabled in (False, True):
+            hedger = hedging.Hedger(enabled=enabled, percentile=args.percentile, min_samples=20, default_delay=args.default_delay)
+            calls_before = server.calls
+            samples = asyncio.run(run(base_url, hedger, args.requests))
+            q = statistics.quantiles(samples, n=100)
+            row = [q[49], q[94], q[98], max(samples)]
+            print(f"{'on' if enabled else 'off':<10}" + "".join(f"{s * 1000:>7.0f}ms" for s in row) + f"{server.calls - calls_before:>16}")
+        fired = sum(hedging.hedges_fired.value(provider=name) for name in CHAIN)
+        won = sum(hedging.hedges_won.value(provider=name, backup=backup) for name in CHAIN for backup in CHAIN)
+        print(f"hedges fired {fired:.0f}, won by the backup {won:.0f}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Load test: requests/second, latency percentiles and event-loop lag per endpoint.
+
+The app runs under uvicorn in a background thread against a local fake
+Together server, so the whole run is offline. For each endpoint
+``--concurrency`` clients send requests back to back for ``--duration``
+seconds, after ``--warmup`` seconds whose results are discarded. Every task
+is distinct, so the caches are never hit. Event-loop lag is sampled on the
+app's own loop: a task sleeps ``LAG_INTERVAL`` and records how late it wakes.
+
+The fake upstream's latency distribution, 503 rate and 429 rate limit are
+configurable. That allows the same run to be repeated under failover and
+back-off as well as on the happy path.
+
+``--save-baseline FILE`` writes the results together with the settings that
+produced them. ``--baseline FILE`` reruns those settings and exits with
+status 1 if any endpoint regressed beyond ``--tolerance``.
+
+    python -m benchmarks.bench_load --duration 5 --concurrency 32
+    python -m benchmarks.bench_load --baseline benchmarks/baselines/default.json
+    python -m benchmarks.bench_load --error-rate 0.05 --rate-limit 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_together import DISTRIBUTIONS, FakeTogether, serve_in_thread
+
+LAG_INTERVAL = 0.005
+
+ENDPOINTS = {
+    "/generate": lambda i: {"task": f"write a poem about the sea, take {i}", "provider": "llama"},
+    "/generate-short": lambda i: {"task": f"write a poem about the sea, take {i}", "provider": "gemma"},
+    "/generate/stream": lambda i: {"task": f"write a poem about the sea, take {i}", "provider": "llama"},
+    "/api/chat": lambda i: {"message": f"Ask GPT: what is a haiku? ({i})"},
+}
+
+# Metric: (better when "higher" or "lower", absolute slack on top of the relative tolerance).
+# The slack keeps millisecond-scale jitter from failing a run.
+CHECKS = {
+    "rps": ("higher", 0.0),
+    "p50_ms": ("lower", 5.0),
+    "p95_ms": ("lower", 10.0),
+    "p99_ms": ("lower", 50.0),
+    "loop_lag_p99_ms": ("lower", 5.0),
+    "error_rate": ("lower", 0.01),
+}
+SETTINGS = ("latency", "distribution", "jitter", "token_delay", "error_rate", "rate_limit", "concurrency", "duration", "warmup")
+
+
+class LoopLagProbe:
+    """ASGI wrapper that samples event-loop lag on the loop serving ``app``."""
+
+    def __init__(self, app, interval: float = LAG_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._sample())
+        await self.app(scope, receive, send)
+
+    async def _sample(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(loop.time() - start - self.interval)
+
+    def take(self) -> list[float]:
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def _failed(response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        return "event: error" in response.text
+    return "error" in response.json()
+
+
+def _percentile(samples: list[float], p: int) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100)[p - 1]
+
+
+async def drive(client: httpx.AsyncClient, path: str, concurrency: int, duration: float) -> tuple[list[float], int]:
+    """Keep ``concurrency`` requests in flight for ``duration`` seconds; return latencies and the error count."""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=ENDPOINTS[path](next(counter)))
+                failed = _failed(response)
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def run(base_url: str, probe: LoopLagProbe, args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for path in args.endpoints:
+            if args.warmup:
+                await drive(client, path, args.concurrency, args.warmup)
+            probe.take()
+            start = time.perf_counter()
+            latencies, errors = await drive(client, path, args.concurrency, args.duration)
+            elapsed = time.perf_counter() - start
+            lag = probe.take()
+            results[path] = {
+                "requests": len(latencies),
+                "rps": len(latencies) / elapsed,
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p95_ms": _percentile(latencies, 95) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+                "error_rate": errors / max(len(latencies), 1),
+                "loop_lag_p99_ms": _percentile(lag, 99) * 1000,
+                "loop_lag_max_ms": max(lag, default=0.0) * 1000,
+            }
+    return results
+
+
+def report(results: dict[str, dict[str, float]]) -> None:
+    print(f"{'endpoint':<18}{'requests':>9}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}{'lag p99':>10}{'lag max':>10}")
+    for path, r in results.items():
+        print(f"{path:<18}{r['requests']:>9.0f}{r['rps']:>9.1f}{r['p50_ms']:>7.1f}ms{r['p95_ms']:>7.1f}ms{r['p99_ms']:>7.1f}ms{r['error_rate']:>8.1%}{r['loop_lag_p99_ms']:>8.1f}ms{r['loop_lag_max_ms']:>8.1f}ms")
+
+
+def regressions(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], tolerance: float) -> list[str]:
+    """Human-readable descriptions of every metric that is worse than ``baseline`` allows."""
+    found = []
+    for path, expected in baseline.items():
+        actual = results.get(path)
+        if actual is None:
+            continue
+        for metric, (better, slack) in CHECKS.items():
+            if metric not in expected:
+                continue
+            if better == "higher":
+                limit = expected[metric] * (1 - tolerance) - slack
+                worse = actual[metric] < limit
+            else:
+                limit = expected[metric] * (1 + tolerance) + slack
+                worse = actual[metric] > limit
+            if worse:
+                found.append(f"{path} {metric}: {actual[metric]:.2f} (baseline {expected[metric]:.2f}, limit {limit:.2f})")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean upstream time to first token, seconds")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with 503")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="upstream requests/second before it answers 429 (0 = unlimited)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument("--baseline", type=Path, help="compare with this baseline (and reuse its settings); exit 1 on regression")
+    parser.add_argument("--save-baseline", type=Path, help="write the results to this file as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression against the baseline")
+    known, _ = parser.parse_known_args()
+    baseline = json.loads(known.baseline.read_text()) if known.baseline else None
+    if baseline:
+        # Like for like: the baseline's scenario, unless overridden on the command line.
+        parser.set_defaults(**baseline["settings"])
+    args = parser.parse_args()
+
+    server = FakeTogether(
+        latency=args.latency,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    os.environ["TOGETHER_BASE_URL"] = server.start()
+    os.environ.setdefault("TOGETHER_API_KEY", "bench-key")
+    # Measure the request path, not the client-side rate limiter; with 429s injected it starts at the upstream's limit.
+    os.environ.setdefault("RATE_LIMIT_RPS", str(args.rate_limit or 100000))
+    os.environ.setdefault("RATE_LIMIT_BURST", str(max(int(args.rate_limit), 1) if args.rate_limit else 100000))
+    os.environ.setdefault("SIMILARITY_CACHE_ENABLED", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from app import main as app_main
+
+    probe = LoopLagProbe(app_main.app)
+    base_url, app_server, thread = serve_in_thread(probe)
+    try:
+        print(f"upstream {args.distribution} latency {args.latency * 1000:.0f} ms (jitter {args.jitter}), errors {args.error_rate:.0%}, 429 above {args.rate_limit or '-'} req/s")
+        print(f"{args.concurrency} concurrent clients, {args.duration:.0f}s per endpoint")
+        results = asyncio.run(run(base_url, probe, args))
+    finally:
+        app_server.should_exit = True
+        thread.join(timeout=10)
+        server.stop()
+    report(results)
+
+    if args.save_baseline:
+        settings = {name: getattr(args, name) for name in SETTINGS}
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps({"settings": settings, "endpoints": results}, indent=2) + "\n")
+        print(f"baseline written to {args.save_baseline}")
+    if baseline:
+        found = regressions(results, baseline["endpoints"], args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
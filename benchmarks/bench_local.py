@@ -0,0 +1,63 @@
+"""Throughput of the local rule-based prompt generator on one core.
+
+Renders ``--tasks`` distinct task descriptions in each mode and reports the
+per-call p50/p99 and calls per second. It then runs the same tasks through
+``generate_batch`` with ``provider="local"``, which is the path a /generate/batch
+request takes, so the batch overhead (one task and result dict per item) shows
+next to the raw rendering cost. No network is involved.
+
+    python -m benchmarks.bench_local --tasks 20000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.local_generator import render_local
+from app.prompt_generator import generate_batch
+
+SUBJECTS = ("a python function to parse dates", "a poem about the sea", "a product launch email", "a workout plan", "a 3-day itinerary for Rome", "an explanation of recursion")
+SUFFIXES = ("", " for beginners", " in a formal tone", " as a table", ", under 200 words", " aimed at startup founders in a playful tone")
+
+
+def tasks(count: int) -> list[str]:
+    return [f"Write {SUBJECTS[i % len(SUBJECTS)]}{SUFFIXES[i // len(SUBJECTS) % len(SUFFIXES)]} (#{i})" for i in range(count)]
+
+
+def measure(items: list[str], mode_name: str) -> tuple[float, float, float]:
+    """Return (p50 µs, p99 µs, calls per second)."""
+    samples = []
+    start = time.perf_counter()
+    for task in items:
+        began = time.perf_counter()
+        render_local(task, mode_name)
+        samples.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(samples, n=100)
+    return percentiles[49] * 1e6, percentiles[98] * 1e6, len(items) / elapsed
+
+
+async def batch(items: list[str]) -> float:
+    start = time.perf_counter()
+    results = [item async for item in generate_batch([{"task": task, "provider": "local"} for task in items])]
+    assert all("prompt" in result for result in results)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20000)
+    args = parser.parse_args()
+
+    items = tasks(args.tasks)
+    print(f"{'path':<22}{'p50':>10}{'p99':>10}{'per second':>14}")
+    for mode_name in ("detailed", "short"):
+        p50, p99, rate = measure(items, mode_name)
+        print(f"{'render_local ' + mode_name:<22}{p50:>8.1f}us{p99:>8.1f}us{rate:>14,.0f}")
+    elapsed = asyncio.run(batch(items))
+    print(f"{'generate_batch':<22}{'':>10}{'':>10}{len(items) / elapsed:>14,.0f}  ({len(items)} items in {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Cost of a log call on the request path: synchronous handler vs. the queue pipeline.
+
+The writer is made artificially slow (``--write-delay`` per record, standing
+in for a busy disk or a blocked stdout pipe). With a synchronous handler that
+delay lands on every logging call; with ``app.core.logs`` the caller only
+enqueues, and records beyond ``--queue-size`` are dropped and counted.
+
+    python -m benchmarks.bench_logging --records 2000 --write-delay 0.001
+"""
+
+import argparse
+import logging
+import logging.handlers
+import queue
+import statistics
+import time
+
+from app.core import logs
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.written = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.format(record)
+        time.sleep(self.delay)
+        self.written += 1
+
+
+def measure(logger: logging.Logger, records: int, interval: float) -> list[float]:
+    samples = []
+    for i in range(records):
+        start = time.perf_counter()
+        logger.info("request", extra={"method": "POST", "path": "/generate", "status": 200, "duration_ms": i})
+        samples.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--write-delay", type=float, default=0.001)
+    parser.add_argument("--interval", type=float, default=0.0002, help="pause between log calls")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'pipeline':<10}{'p50':>10}{'p99':>10}{'max':>10}{'written':>9}{'dropped':>9}")
+    for name in ("sync", "queue"):
+        logger = logging.getLogger(f"bench.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        writer = SlowHandler(args.write_delay)
+        writer.setFormatter(logs.JsonFormatter())
+        dropped_before = logs.log_records_dropped.value()
+        if name == "sync":
+            logger.addHandler(writer)
+            samples = measure(logger, args.records, args.interval)
+        else:
+            handler = logs.BoundedQueueHandler(queue.Queue(maxsize=args.queue_size))
+            listener = logging.handlers.QueueListener(handler.queue, writer)
+            listener.start()
+            logger.addHandler(handler)
+            samples = measure(logger, args.records, args.interval)
+            listener.stop()
+        q = statistics.quantiles(samples, n=100)
+        dropped = logs.log_records_dropped.value() - dropped_before
+        print(f"{name:<10}" + "".join(f"{s * 1e6:>8.0f}us" for s in (q[49], q[98], max(samples))) + f"{writer.written:>9}{dropped:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
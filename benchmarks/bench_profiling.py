@@ -0,0 +1,69 @@
+"""Per-request cost of the profiling hooks.
+
+Sends ``--requests`` sequential /generate requests through the full
+middleware stack, in-process, against a generator that answers at once. That
+way the middleware is most of what is measured. Three app builds are
+compared:
+
+* "off": ``PROFILING_ENABLED=0``, so the middleware is not installed (the default);
+* "armed": enabled, but no request is selected (no header, sample rate 0);
+* "profiled": every request sends ``X-Profile: 1``.
+
+"armed" should be within noise of "off". "profiled" shows what one captured
+request costs, with the sampler thread and lag task running.
+
+    python -m benchmarks.bench_profiling --requests 3000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import main as app_main
+from app.core import profiling
+from app.prompt_generator import Generation
+
+
+async def instant_generate(task_description: str, provider: str, mode_name: str = "detailed") -> Generation:
+    return Generation("### Persona\nA benchmark reply.")
+
+
+async def measure(app, requests: int, headers: dict[str, str]) -> list[float]:
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for i in range(requests):
+            start = time.perf_counter()
+            response = await client.post("/generate", json={"task": f"task {i}", "provider": "llama"}, headers=headers)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    app_main.generate = instant_generate
+    profiling.profiler = profiling.Profiler(keep=10)
+    builds = {}
+    for label, enabled in (("off", False), ("armed", True), ("profiled", True)):
+        profiling.PROFILING_ENABLED = enabled
+        builds[label] = (app_main.create_app(), {"X-Profile": "1"} if label == "profiled" else {})
+
+    print(f"{'build':<10}{'mean':>10}{'p50':>10}{'p99':>10}{'vs off':>10}")
+    baseline = None
+    for label, (app, headers) in builds.items():
+        asyncio.run(measure(app, min(200, args.requests), headers))  # warm up
+        samples = asyncio.run(measure(app, args.requests, headers))
+        mean = statistics.fmean(samples)
+        baseline = baseline or mean
+        percentiles = statistics.quantiles(samples, n=100)
+        print(f"{label:<10}{mean * 1e6:>8.0f}us{percentiles[49] * 1e6:>8.0f}us{percentiles[98] * 1e6:>8.0f}us{(mean - baseline) * 1e6:>+8.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Burst behaviour against a rate-limited upstream, with and without the adaptive limiter.
+
+The fake upstream accepts ``--upstream-rps`` requests/second and answers the
+rest with 429 + ``Retry-After: 1``. A burst of ``--requests`` calls is sent at
+once through ``AsyncTogetherClient``:
+
+* ``retry only``  - no client-side limit; every call races the upstream and
+  relies on backoff after each 429.
+* ``adaptive``    - calls queue in the per-model token bucket at
+  ``--client-rps``; 429s halve the rate and successes recover it.
+
+    python -m benchmarks.bench_ratelimit --requests 30 --upstream-rps 10 --client-rps 12
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.core import providers, ratelimit
+from benchmarks.fake_together import FakeTogether
+
+
+async def burst(base_url: str, limiters: ratelimit.RateLimiterRegistry, total: int) -> tuple[float, int]:
+    """Send ``total`` concurrent calls; return (wall seconds, failed calls)."""
+    retry = ratelimit.RetryPolicy(attempts=8, base_delay=0.25, max_delay=4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=200)) as http:
+        client = providers.AsyncTogetherClient(http_client=http, api_key="bench-key", limiters=limiters, retry=retry)
+
+        async def one() -> bool:
+            try:
+                await client.chat("bench/model", [{"role": "user", "content": "hi"}])
+                return True
+            except httpx.HTTPError:
+                return False
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - start, results.count(False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--upstream-rps", type=float, default=10)
+    parser.add_argument("--client-rps", type=float, default=12)
+    args = parser.parse_args()
+
+    scenarios = {
+        "retry only": ratelimit.RateLimiterRegistry(rate=100000, burst=100000),
+        "adaptive": ratelimit.RateLimiterRegistry(rate=args.client_rps, burst=int(args.upstream_rps)),
+    }
+    print(f"{args.requests} concurrent calls, upstream allows {args.upstream_rps:g} req/s")
+    print(f"{'scenario':<12}{'wall':>9}{'upstream calls':>16}{'429s':>7}{'failed':>8}")
+    for name, limiters in scenarios.items():
+        server = FakeTogether(latency=args.latency, rate_limit=args.upstream_rps)
+        base_url = server.start()
+        try:
+            wall, failed = asyncio.run(burst(base_url, limiters, args.requests))
+        finally:
+            server.stop()
+        print(f"{name:<12}{wall:>8.2f}s{server.calls:>16}{server.throttled:>7}{failed:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Mean latency and quality guard for complexity-aware routing.
+
+A labelled workload of chat messages and generation tasks runs twice against
+a fake upstream whose models answer at different speeds (``LATENCY``, scaled by ``--scale``):
+
+* "fixed": the models hard-wired before routing. Detailed prompts and
+  "improve my prompt" go to Llama 70B, "ask GPT" goes to gpt-oss-20b;
+* "routed": ``provider="auto"`` for generations and ``ROUTING_ENABLED`` for chat.
+
+Each workload item is labelled with the smallest tier judged adequate for it.
+``under-routed`` counts items sent to a smaller tier than their label. That
+is the quality regression to watch: it should stay at 0 while mean latency
+drops.
+
+    python -m benchmarks.bench_routing --repeat 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import Any
+
+import app.core.chatbot_handler as handler
+import app.prompt_generator as pg
+from app.core import cache, providers, routing
+
+# Seconds per call by model; small models answer faster.
+LATENCY = {"google/gemma-3n-E4B-it": 0.3, "openai/gpt-oss-20b": 0.8, "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free": 2.0}
+
+# (kind, text, smallest adequate tier)
+WORKLOAD = [
+    ("chat", "Ask GPT: fix the typo in 'recieve'", "simple"),
+    ("chat", "Ask GPT: give me a synonym for quick", "simple"),
+    ("chat", "Ask GPT: what is a haiku?", "simple"),
+    ("chat", "Improve my prompt: BASIC - help with my resume", "simple"),
+    ("chat", "Ask GPT: compare the tradeoffs of event sourcing and CRUD for an audit-heavy billing system, with a migration strategy", "complex"),
+    ("chat", "Improve my prompt: DETAIL using ChatGPT - write me a marketing email", "complex"),
+    ("short", "write a title for a blog post about sourdough", "simple"),
+    ("short", "rephrase: our meeting moved to 3pm", "simple"),
+    ("detailed", "write a poem about rain", "simple"),
+    ("detailed", "write a cover letter for a junior data analyst role, mentioning SQL and Python experience and a career change from teaching", "standard"),
+    ("detailed", "Design a scalable distributed architecture for a multi-tenant SaaS.\nRequirements:\n- SSO\n- usage billing\n- audit logs\n- regional data residency", "complex"),
+]
+TIER_ORDER = {tier.name: index for index, tier in enumerate(routing.router.tiers)}
+
+
+class TimedClient(providers.AsyncTogetherClient):
+    """Answers every chat after the model's modelled latency, without a network call."""
+
+    async def chat(self, model: str, messages: list[dict[str, str]], **params: Any) -> dict[str, Any]:
+        await asyncio.sleep(LATENCY.get(model, 1.0))
+        return {"choices": [{"message": {"content": "REPLY"}}]}
+
+
+async def run(routed: bool, repeat: int) -> tuple[list[float], Counter[str], int]:
+    handler.ROUTING_ENABLED = routed
+    latencies: list[float] = []
+    tiers: Counter[str] = Counter()
+    under = 0
+    for round_ in range(repeat):
+        # Distinct text per round, so neither the cache nor request coalescing serves it.
+        for kind, text, expected in WORKLOAD:
+            text = f"{text} (#{round_})"
+            start = time.perf_counter()
+            if kind == "chat":
+                await handler.process_chat_message(text)
+            else:
+                await pg.generate(text, "auto" if routed else "llama", kind)
+            latencies.append(time.perf_counter() - start)
+            if routed:
+                chosen = routing.router.classify(text, kind).tier.name
+                tiers[chosen] += 1
+                under += TIER_ORDER[chosen] < TIER_ORDER[expected]
+    return latencies, tiers, under
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=0.1, help="multiply the modelled latencies, to keep runs short")
+    args = parser.parse_args()
+
+    for model in LATENCY:
+        LATENCY[model] *= args.scale
+    fake = providers.ProviderRegistry()
+    for provider in providers.registry:
+        fake.register(provider.name, provider.model, client=TimedClient(), kind=provider.kind)
+    pg.registry = handler.registry = fake
+    pg.prompt_cache = cache.ResponseCache(cache.LRUCache())
+    pg.similar_prompts = None
+
+    print(f"{len(WORKLOAD) * args.repeat} requests per run; model latency x{args.scale:g}: " + ", ".join(f"{m.split('/')[1]} {s * 1000:.0f}ms" for m, s in LATENCY.items()))
+    print(f"{'routing':<9}{'mean':>9}{'p50':>9}{'p95':>9}{'under-routed':>14}  tiers")
+    for label, routed in (("fixed", False), ("routed", True)):
+        latencies, tiers, under = asyncio.run(run(routed, args.repeat))
+        percentiles = statistics.quantiles(latencies, n=100)
+        spread = ", ".join(f"{name} {count}" for name, count in sorted(tiers.items())) or "-"
+        print(f"{label:<9}{statistics.fmean(latencies) * 1000:>7.0f}ms{percentiles[49] * 1000:>7.0f}ms{percentiles[94] * 1000:>7.0f}ms{under if routed else '-':>14}  {spread}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Memory and history-building cost of the chat session store.
+
+Fills ``--sessions`` conversations with ``--turns`` exchanges of
+``--chars``-character messages, then times building the token-budgeted
+history for random sessions. Memory is measured with ``tracemalloc`` and
+compared with the store's own estimate, which drives ``CHAT_SESSION_MEMORY_MB``.
+
+    python -m benchmarks.bench_sessions --sessions 5000 --turns 30
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.core.sessions import SessionStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=30, help="exchanges per session (beyond the per-session cap they are dropped)")
+    parser.add_argument("--chars", type=int, default=400)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--summarize", action="store_true")
+    args = parser.parse_args()
+
+    words = "prompt write email poem plan code review improve summary question answer context".split()
+
+    def text() -> str:
+        out = ""
+        while len(out) < args.chars:
+            out += random.choice(words) + " "
+        return out
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    store = SessionStore(max_sessions=args.sessions, max_bytes=1 << 40, summarize=args.summarize)
+    sessions = [store.get() for _ in range(args.sessions)]
+    for _ in range(args.turns):
+        for session in sessions:
+            store.add_exchange(session, text(), text())
+    traced = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    samples = []
+    for _ in range(args.lookups):
+        session = random.choice(sessions)
+        start = time.perf_counter()
+        store.history(session)
+        samples.append(time.perf_counter() - start)
+    q = statistics.quantiles(samples, n=100)
+
+    print(f"sessions {len(store)}, turns stored per session {len(sessions[0].turns)}")
+    print(f"memory: traced {traced / 2**20:.1f} MiB, store estimate {store.size / 2**20:.1f} MiB, {traced / len(store) / 1024:.1f} KiB per session")
+    print(f"history build: p50 {q[49] * 1e6:.1f}us  p99 {q[98] * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
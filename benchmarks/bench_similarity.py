@@ -0,0 +1,88 @@
+"""Lookup latency of the near-duplicate (MinHash LSH) prompt cache tier at scale.
+
+Fills a ``SimilarityIndex`` with ``--entries`` synthetic tasks (random
+combinations from a few-thousand-word vocabulary) and then times lookups:
+reworded versions of stored tasks (expected hits) and unseen tasks (expected
+misses). Lookup cost depends on bucket sizes, not on the number of entries.
+
+    python -m benchmarks.bench_similarity --entries 100000 --lookups 5000
+"""
+
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.core.similarity import SimilarityIndex
+
+FILLERS = ["please", "a", "the", "an", "just", "kindly"]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return list({"".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)})
+
+
+def make_task(vocabulary: list[str], rng: random.Random) -> list[str]:
+    return rng.sample(vocabulary, rng.randint(4, 9))
+
+
+def reword(words: list[str], rng: random.Random) -> str:
+    """Same content words in the same order, with fillers sprinkled in (shingles keep word order)."""
+    mixed = list(words)
+    for filler in rng.sample(FILLERS, 3):
+        mixed.insert(rng.randint(0, len(mixed)), filler)
+    return " ".join(mixed)
+
+
+def percentiles(samples: list[float]) -> str:
+    q = statistics.quantiles(samples, n=100)
+    return f"p50 {q[49] * 1e6:7.1f}us  p99 {q[98] * 1e6:7.1f}us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--memory", action="store_true", help="trace allocations while indexing (slows the build down)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    tasks = [make_task(vocabulary, rng) for _ in range(args.entries)]
+    index = SimilarityIndex(max_entries=args.entries)
+
+    if args.memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for i, words in enumerate(tasks):
+        index.set("scope", " ".join(words), f"prompt {i}")
+    build = time.perf_counter() - start
+    print(f"indexed {len(index)} entries in {build:.1f}s ({build / len(index) * 1e6:.0f}us each)")
+    if args.memory:
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"index memory ~{memory / 2**20:.0f} MiB (excluding task lists; values are short strings here)")
+
+    hits, hit_times = 0, []
+    for words in rng.sample(tasks, args.lookups):
+        query = reword(words, rng)
+        t = time.perf_counter()
+        hits += index.get("scope", query) is not None
+        hit_times.append(time.perf_counter() - t)
+    print(f"reworded lookups: {percentiles(hit_times)}  hit rate {hits / args.lookups:.1%}")
+
+    false_hits, miss_times = 0, []
+    for _ in range(args.lookups):
+        query = " ".join(make_task(vocabulary, rng))
+        t = time.perf_counter()
+        false_hits += index.get("scope", query) is not None
+        miss_times.append(time.perf_counter() - t)
+    print(f"unseen lookups:   {percentiles(miss_times)}  false hits {false_hits}")
+
+
+if __name__ == "__main__":
+    main()
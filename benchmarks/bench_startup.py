@@ -0,0 +1,91 @@
+"""Cold-start cost: import time, time to ready and first-request latency.
+
+``import`` is the median wall time of ``import app.main`` in a fresh
+interpreter. The app is then started under uvicorn (in a subprocess) against
+a fake upstream whose first request on each connection costs
+``--handshake-delay`` (standing in for DNS/TCP/TLS). ``ready`` is the time
+until /healthz answers, and ``first``/``second`` are the latencies of the first two
+/generate calls, with and without UPSTREAM_PREWARM.
+
+    python -m benchmarks.bench_startup --handshake-delay 0.3
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_together import FakeTogether
+
+ROOT = Path(__file__).resolve().parents[1]
+IMPORT_SCRIPT = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def import_time(runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cold_start(upstream_url: str, prewarm: bool) -> tuple[float, float, float]:
+    """Return (seconds to ready, first /generate, second /generate)."""
+    port = free_port()
+    env = {**os.environ, "TOGETHER_BASE_URL": upstream_url, "TOGETHER_API_KEY": "bench-key", "UPSTREAM_PREWARM": "1" if prewarm else "0", "LOG_LEVEL": "WARNING"}
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while True:
+                try:
+                    client.get("/healthz").raise_for_status()
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - start
+            latencies = []
+            for task in ("first task", "second task"):
+                t = time.perf_counter()
+                client.post("/generate", json={"task": task, "provider": "llama"}).raise_for_status()
+                latencies.append(time.perf_counter() - t)
+        return ready, latencies[0], latencies[1]
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--handshake-delay", type=float, default=0.3)
+    parser.add_argument("--import-runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"import app.main: {import_time(args.import_runs) * 1000:.0f} ms (median of {args.import_runs})")
+    server = FakeTogether(latency=args.latency, handshake_delay=args.handshake_delay)
+    upstream_url = server.start()
+    try:
+        print(f"{'prewarm':<10}{'ready':>9}{'first':>9}{'second':>9}")
+        for prewarm in (False, True):
+            ready, first, second = cold_start(upstream_url, prewarm)
+            print(f"{'on' if prewarm else 'off':<10}" + "".join(f"{s * 1000:>7.0f}ms" for s in (ready, first, second)))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
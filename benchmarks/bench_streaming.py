@@ -0,0 +1,80 @@
+"""Time to first byte vs. total latency for /generate and /generate/stream.
+
+The fake upstream waits ``--latency`` before the first token and then emits a
+word every ``--token-delay`` seconds. The buffered endpoint's first byte only
+arrives when generation is complete; the streaming endpoint's first byte
+arrives roughly one upstream TTFT after the request. Each request sends a
+distinct task, so the prompt cache never answers for the upstream.
+
+    python -m benchmarks.bench_streaming --latency 0.2 --token-delay 0.02
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_together import FakeTogether, serve_in_thread
+
+TASK = "write a poem about the sea, variant {n}"
+_serial = itertools.count()
+
+
+async def measure(client: httpx.AsyncClient, path: str) -> tuple[float, float]:
+    """Return (time to first body byte, total time) in seconds for one request."""
+    start = time.perf_counter()
+    first_byte = None
+    body = {"task": TASK.format(n=next(_serial)), "provider": "llama"}
+    async with client.stream("POST", path, json=body) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first_byte if first_byte is not None else total, total
+
+
+async def run(args: argparse.Namespace, app_url: str) -> None:
+    # httpx.ASGITransport buffers whole responses, so the app is served over a real socket.
+    async with httpx.AsyncClient(base_url=app_url, timeout=60) as client:
+        print(f"{'endpoint':<20}{'ttfb p50':>12}{'total p50':>12}")
+        for path in ("/generate", "/generate/stream"):
+            samples = [await measure(client, path) for _ in range(args.requests)]
+            ttfb = statistics.median(s[0] for s in samples) * 1000
+            total = statistics.median(s[1] for s in samples) * 1000
+            print(f"{path:<20}{ttfb:>10.0f}ms{total:>10.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    content = " ".join(["token"] * 50)
+    server = FakeTogether(latency=args.latency, token_delay=args.token_delay, content=content)
+    os.environ["TOGETHER_BASE_URL"] = server.start()
+    os.environ.setdefault("TOGETHER_API_KEY", "bench-key")
+    # Measure the request path, not the client-side rate limiter.
+    os.environ.setdefault("RATE_LIMIT_RPS", "100000")
+    os.environ.setdefault("RATE_LIMIT_BURST", "100000")
+    from app import main as app_main
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    app_url, app_server, app_thread = serve_in_thread(app_main.app)
+    try:
+        asyncio.run(run(args, app_url))
+    finally:
+        app_server.should_exit = True
+        app_thread.join(timeout=5)
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
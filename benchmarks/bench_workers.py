@@ -0,0 +1,128 @@
+"""Cache hit rate, upstream calls and 429s as the number of worker processes grows.
+
+The app runs under ``uvicorn --workers N`` (in a subprocess) against a fake
+upstream that allows ``--upstream-rate`` requests/second. Each worker's
+limiter is configured for that rate. The workload sends ``--tasks`` distinct
+/generate tasks ``--rounds`` times. Every request opens a new connection, so
+requests spread over the workers.
+
+With per-process state ("local"), each worker has a cold cache and its own
+rate budget. Upstream calls and 429s therefore grow with N. With
+``SHARED_STATE_PATH`` ("shared"), the workers share one cache tier and one
+budget, so both should stay flat. "metrics misses" is
+``prompt_cache_misses_total`` as reported by a single /metrics call. With
+shared state it covers every worker.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --tasks 40 --rounds 3
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_startup import free_port
+from benchmarks.fake_together import FakeTogether
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+async def workload(base_url: str, tasks: int, rounds: int, concurrency: int) -> int:
+    """Send every task ``rounds`` times, one round after another; returns failed requests."""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+    # No keep-alive: each request is a new connection, which the kernel hands to any worker.
+    async with httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_keepalive_connections=0), timeout=120) as client:
+
+        async def one(i: int) -> None:
+            nonlocal failures
+            async with semaphore:
+                response = await client.post("/generate", json={"task": f"write a haiku about topic {i}", "provider": "llama"})
+                failures += response.status_code != 200 or "error" in response.json()
+
+        for _ in range(rounds):
+            await asyncio.gather(*(one(i) for i in range(tasks)))
+    return failures
+
+
+def scrape_misses(client: httpx.Client) -> float:
+    text = client.get("/metrics").text
+    return sum(float(value) for value in re.findall(r"^prompt_cache_misses_total(?:\{[^}]*\})? (\S+)$", text, re.MULTILINE))
+
+
+def run(server: FakeTogether, upstream_url: str, workers: int, shared: bool, args: argparse.Namespace) -> tuple[int, int, int, float, float]:
+    """Return (upstream calls, 429s, failed requests, /metrics misses, seconds)."""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "TOGETHER_BASE_URL": upstream_url,
+            "TOGETHER_API_KEY": "bench-key",
+            "RATE_LIMIT_RPS": str(args.upstream_rate),
+            "RATE_LIMIT_BURST": str(max(int(args.upstream_rate), 1)),
+            "SIMILARITY_CACHE_ENABLED": "0",
+            "LOG_LEVEL": "WARNING",
+            "SHARED_STATE_PATH": os.path.join(tmp, "shared.sqlite3") if shared else "",
+            "SHARED_METRICS_INTERVAL": "0.2",
+        }
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+        process = subprocess.Popen(command, cwd=ROOT, env=env)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                while True:
+                    try:
+                        client.get("/healthz").raise_for_status()
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.05)
+                # Let every worker finish starting before the clock starts.
+                time.sleep(1)
+                calls, throttled = server.calls, server.throttled
+                start = time.perf_counter()
+                failures = asyncio.run(workload(base_url, args.tasks, args.rounds, args.concurrency))
+                elapsed = time.perf_counter() - start
+                # Give the other workers time to publish their latest snapshots.
+                time.sleep(0.5)
+                misses = scrape_misses(client)
+            return server.calls - calls, server.throttled - throttled, failures, misses, elapsed
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--tasks", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--upstream-rate", type=float, default=20.0, help="requests/second the fake upstream allows before answering 429")
+    args = parser.parse_args()
+
+    server = FakeTogether(latency=args.latency, rate_limit=args.upstream_rate)
+    upstream_url = server.start()
+    requests = args.tasks * args.rounds
+    try:
+        print(f"{requests} requests: {args.tasks} tasks x {args.rounds} rounds; upstream allows {args.upstream_rate:g} req/s")
+        print(f"{'state':<8}{'workers':>8}{'upstream calls':>16}{'hit rate':>10}{'429s':>7}{'failed':>8}{'metrics misses':>16}{'time':>8}")
+        for shared in (False, True):
+            for workers in args.workers:
+                calls, throttled, failures, misses, elapsed = run(server, upstream_url, workers, shared, args)
+                hits = 1 - (calls - throttled) / requests
+                label = "shared" if shared else "local"
+                print(f"{label:<8}{workers:>8}{calls:>16}{hits:>10.0%}{throttled:>7}{failures:>8}{misses:>16.0f}{elapsed:>7.1f}s")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
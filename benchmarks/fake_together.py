@@ -0,0 +1,220 @@
+"""A local fake of Together's OpenAI-compatible ``/v1/chat/completions`` endpoint.
+
+Usage from a benchmark::
+
+    server = FakeTogether(latency=0.1)
+    base_url = server.start()   # e.g. http://127.0.0.1:54321/v1
+    ...
+    server.stop()
+
+It can also be run standalone: ``python -m benchmarks.fake_together --port 9000``.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+def sample_latency(mean: float, distribution: str = "fixed", jitter: float = 0.0) -> float:
+    """A delay averaging ``mean`` seconds.
+
+    ``jitter`` is the half-width of "uniform" as a fraction of the mean, and
+    the sigma of "lognormal", whose median sits below the mean with a long
+    right tail. "exponential" ignores it.
+    """
+    if mean <= 0 or distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return mean * random.uniform(1 - jitter, 1 + jitter)
+    if distribution == "exponential":
+        return random.expovariate(1 / mean)
+    if distribution == "lognormal":
+        return mean * random.lognormvariate(-(jitter**2) / 2, jitter)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+class FakeTogether:
+    """Serves canned completions after an artificial latency.
+
+    ``latency`` is the mean time to the first token, drawn from
+    ``distribution`` with ``jitter`` (see ``sample_latency``); ``token_delay`` is added per
+    generated word, so streamed responses trickle in like a real model.
+    ``rate_limit`` (requests/second) answers excess requests with a 429 and a
+    ``Retry-After`` header; ``error_rate`` fails that fraction with a 503.
+    ``tail_rate`` of requests take ``tail_latency`` instead of ``latency``.
+    ``handshake_delay`` is added to the first request on each new connection,
+    standing in for the DNS/TCP/TLS setup a real remote upstream costs.
+    Like the real API, ``stop`` sequences and ``max_tokens`` (counted in
+    words) end generation early; ``completion_tokens`` totals what was sent.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.1,
+        content: str = "### Persona\nA fake upstream reply.",
+        token_delay: float = 0.0,
+        rate_limit: float = 0.0,
+        error_rate: float = 0.0,
+        tail_latency: float = 0.0,
+        tail_rate: float = 0.0,
+        handshake_delay: float = 0.0,
+        distribution: str = "fixed",
+        jitter: float = 0.0,
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency = latency
+        self.content = content
+        self.token_delay = token_delay
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.handshake_delay = handshake_delay
+        self.distribution = distribution
+        self.jitter = jitter
+        self._seen_clients: set[tuple] = set()
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self._allowance = rate_limit
+        self._last_check = time.monotonic()
+        self.app = Starlette(
+            routes=[
+                Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+                Route("/v1/models", self.models),
+            ]
+        )
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    def tokens(self, stop: str | list[str] | None = None, max_tokens: int | None = None) -> list[str]:
+        content = self.content
+        for sequence in [stop] if isinstance(stop, str) else stop or ():
+            content = content.split(sequence, 1)[0]
+        words = content.split(" ")
+        tokens = [word if i == 0 else " " + word for i, word in enumerate(words)]
+        return tokens[:max_tokens] if max_tokens else tokens
+
+    def first_token_delay(self) -> float:
+        if self.tail_rate and random.random() < self.tail_rate:
+            return self.tail_latency
+        return sample_latency(self.latency, self.distribution, self.jitter)
+
+    async def stream_tokens(self, model: str, tokens: list[str]):
+        await asyncio.sleep(self.first_token_delay())
+        for token in tokens:
+            chunk = {"object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {"content": token}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(self.token_delay)
+        yield "data: [DONE]\n\n"
+
+    def _over_limit(self) -> bool:
+        """Token bucket holding one second's worth of requests."""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        self._allowance = min(self.rate_limit, self._allowance + (now - self._last_check) * self.rate_limit)
+        self._last_check = now
+        if self._allowance < 1:
+            return True
+        self._allowance -= 1
+        return False
+
+    async def handshake(self, request: Request) -> None:
+        client = tuple(request.scope.get("client") or ())
+        if self.handshake_delay and client not in self._seen_clients:
+            self._seen_clients.add(client)
+            await asyncio.sleep(self.handshake_delay)
+
+    async def models(self, request: Request) -> Response:
+        await self.handshake(request)
+        return JSONResponse({"object": "list", "data": [{"id": "fake/model", "object": "model"}]})
+
+    async def chat_completions(self, request: Request) -> Response:
+        body = await request.json()
+        self.calls += 1
+        await self.handshake(request)
+        if self._over_limit():
+            self.throttled += 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": "1"})
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        tokens = self.tokens(body.get("stop"), body.get("max_tokens"))
+        self.completion_tokens += len(tokens)
+        if body.get("stream"):
+            return StreamingResponse(self.stream_tokens(body.get("model"), tokens), media_type="text/event-stream")
+        await asyncio.sleep(self.first_token_delay() + self.token_delay * len(tokens))
+        return JSONResponse(
+            {
+                "id": f"fake-{self.calls}",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": {"completion_tokens": len(tokens)},
+            }
+        )
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving in a background thread and return the ``/v1`` base URL."""
+        base_url, self._server, self._thread = serve_in_thread(self.app, host, port)
+        return f"{base_url}/v1"
+
+    def stop(self) -> None:
+        if self._server is not None and self._thread is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+
+def serve_in_thread(app, host: str = "127.0.0.1", port: int = 0) -> tuple[str, uvicorn.Server, threading.Thread]:
+    """Run an ASGI app under uvicorn in a daemon thread; returns (base URL, server, thread)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://{host}:{port}", server, thread
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.1, help="mean seconds to wait before the first token")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform half-width (fraction of the mean) or lognormal sigma")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds per generated word")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="requests/second before answering 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = FakeTogether(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        distribution=args.distribution,
+        jitter=args.jitter,
+    )
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
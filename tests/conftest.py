@@ -1,8 +1,28 @@
 import os
 import sys
 
+import pytest
+
 # Ensure project root is on sys.path so `import app` works when running
 # pytest from different working directories or IDEs.
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
+
+# Job results go to a file by default; keep test runs from leaving one behind.
+os.environ.setdefault("JOB_STORE_PATH", ":memory:")
+
+
+class FakeClock:
+    """Stands in for ``time.time``/``time.monotonic``; tests move it with ``clock.now += seconds``."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import prompt_generator
+from app.core import admission as admission_module
+from app.core import chatbot_handler
+from app.core.admission import CHAT, DETAILED, SHORT, AdmissionController, AdmissionGate, ClientDisconnected, Overloaded
+
+
+def test_gate_bounds_in_flight_and_queue():
+    async def run():
+        gate = AdmissionGate("/x", limit=1, queue=1, timeout=1)
+        await gate.acquire(DETAILED)
+        waiter = asyncio.ensure_future(gate.acquire(DETAILED))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await gate.acquire(DETAILED)
+        gate.release()
+        await waiter
+        return gate.active, shed.value.reason
+
+    assert asyncio.run(run()) == (1, "queue_full")
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def run():
+        gate = AdmissionGate("/x", limit=1, queue=10, timeout=1)
+        await gate.acquire(DETAILED)
+        order = []
+
+        async def wait(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [asyncio.ensure_future(wait(name, p)) for name, p in (("d1", DETAILED), ("c1", CHAT), ("s1", SHORT), ("s2", SHORT))]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["s1", "s2", "c1", "d1"]
+
+
+def test_better_class_displaces_worst_waiter_when_full():
+    async def run():
+        gate = AdmissionGate("/x", limit=1, queue=1, timeout=1)
+        await gate.acquire(SHORT)
+        detailed = asyncio.ensure_future(gate.acquire(DETAILED))
+        await asyncio.sleep(0)
+        short = asyncio.ensure_future(gate.acquire(SHORT))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await detailed
+        gate.release()
+        await short
+        return shed.value.reason
+
+    assert asyncio.run(run()) == "displaced"
+
+
+def test_queued_request_is_shed_after_timeout_and_cancelled_waiters_leave():
+    async def run():
+        gate = AdmissionGate("/x", limit=1, queue=5, timeout=0.01)
+        await gate.acquire(SHORT)
+        with pytest.raises(Overloaded) as shed:
+            await gate.acquire(SHORT)
+        gate.timeout = 1
+        waiter = asyncio.ensure_future(gate.acquire(SHORT))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gate.release()
+        return shed.value.reason, gate.active, len(gate._waiters)
+
+    assert asyncio.run(run()) == ("timeout", 0, 0)
+
+
+def test_ticket_is_released_when_provider_gate_sheds():
+    async def run():
+        controller = AdmissionController(endpoint_limit=5, endpoint_queue=0, provider_limit=0, provider_queue=0)
+        with pytest.raises(Overloaded):
+            await controller.acquire("/x", "llama", SHORT)
+        return controller.gate("/x").active
+
+    assert asyncio.run(run()) == 0
+
+
+class _DisconnectingRequest:
+    def __init__(self, after: float):
+        self.after = after
+
+    async def receive(self):
+        await asyncio.sleep(self.after)
+        return {"type": "http.disconnect"}
+
+
+def test_client_disconnect_cancels_the_work():
+    async def run():
+        controller = AdmissionController()
+        finished = False
+        with pytest.raises(ClientDisconnected):
+            async with controller.admit(_DisconnectingRequest(0.01), "/x", "llama", DETAILED):
+                await asyncio.sleep(5)
+                finished = True
+        return finished, controller.gate("/x").active, controller.gate("llama").active
+
+    assert asyncio.run(run()) == (False, 0, 0)
+
+
+def test_saturated_route_answers_503_with_retry_after(monkeypatch):
+    controller = AdmissionController(endpoint_limit=0, endpoint_queue=0)
+    monkeypatch.setattr(main, "admission", controller)
+    client = TestClient(main.app)
+
+    resp = client.post("/generate-short", json={"task": "x", "provider": "llama"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(admission_module.ADMISSION_RETRY_AFTER)
+    assert 'admission_shed_total{gate="/generate-short",priority="short",reason="queue_full"}' in client.get("/metrics").text
+
+
+def test_provider_gates_are_named_after_known_resolved_providers(monkeypatch):
+    async def fake_generate(task, provider, mode_name="detailed"):
+        return main.Generation("ok")
+
+    controller = AdmissionController()
+    monkeypatch.setattr(main, "admission", controller)
+    monkeypatch.setattr(main, "generate", fake_generate)
+    client = TestClient(main.app)
+
+    for provider in ("Llama", "llama", "auto", "local", 'bogus"} 1\nevil_metric 42'):
+        assert client.post("/generate", json={"task": "fix my typo", "provider": provider}).status_code == 200
+    # Case folds, "auto" takes its routed provider's gate and unknown providers get none.
+    assert set(controller._gates) == {"/generate", "llama", "gemma", "local"}
+    assert "\nevil_metric" not in client.get("/metrics").text
+
+
+def test_batch_items_and_chat_calls_take_their_providers_gate(monkeypatch):
+    async def fake_generate(task, provider, mode_name="detailed"):
+        return prompt_generator.Generation("ok")
+
+    controller = AdmissionController(provider_limit=0, provider_queue=0, overrides={"gemma": (1, 0)})
+    monkeypatch.setattr(prompt_generator, "admission", controller)
+    monkeypatch.setattr(prompt_generator, "generate", fake_generate)
+    monkeypatch.setattr(chatbot_handler, "admission", controller)
+
+    async def run():
+        return {r["index"]: r for r in [r async for r in prompt_generator.generate_batch([{"task": "a", "provider": "llama"}, {"task": "b", "provider": "gemma"}])]}
+
+    results = asyncio.run(run())
+    assert results[0]["error"] == "llama is overloaded (queue_full)"
+    assert results[1]["prompt"] == "ok"
+
+    resp = TestClient(main.app).post("/api/chat", json={"message": "ask gpt: hi"})
+    assert resp.status_code == 503
@@ -0,0 +1,79 @@
+import gzip
+import re
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.core import assets
+
+ROOT = Path(__file__).resolve().parents[1]
+# Classes used as JavaScript or styling hooks that deliberately have no rule.
+UNSTYLED = {"ai-tool-body", "form-input", "animated-button"}
+
+client = TestClient(main.app)
+
+
+def _used_classes() -> set[str]:
+    html = (ROOT / "templates" / "generate_prompt.html").read_text()
+    js = (ROOT / "app" / "static" / "main.js").read_text()
+    used = set()
+    for attribute in re.findall(r'class="([^"]*)"', html + js):
+        used.update(attribute.split())
+    for args in re.findall(r"classList\.(?:add|remove|toggle|contains)\(([^)]*)\)", js):
+        used.update(re.findall(r"'([^']+)'", args))
+    for template in re.findall(r"className = [`'](.*?)[`']", js):
+        # `chatbot-message ${sender}-message` -> both user-message and bot-message
+        used.update(template.replace("${sender}", "user").split() + template.replace("${sender}", "bot").split())
+    return used
+
+
+def test_purged_css_covers_every_class_the_page_uses():
+    css = (ROOT / "app" / "static" / "tailwind.css").read_text() + (ROOT / "app" / "static" / "style.css").read_text()
+    selectors = {name: "." + re.sub(r"([:\[\]/.])", r"\\\1", name) for name in _used_classes() - UNSTYLED}
+    # ".border" must not be satisfied by ".border-4".
+    missing = sorted(name for name, selector in selectors.items() if not re.search(re.escape(selector) + r"(?![\w\\-])", css))
+    assert missing == []
+
+
+def test_bundle_hashes_names_and_precompresses():
+    bundle = assets.Bundle(ROOT / "app" / "static")
+    css_url = bundle.url("app.css")
+    assert re.fullmatch(r"/assets/app\.[0-9a-f]{12}\.css", css_url)
+    css = bundle.by_name[css_url.rsplit("/", 1)[1]]
+    assert "/*" not in css.variants["identity"].decode()
+    assert gzip.decompress(css.variants["gzip"]) == css.variants["identity"]
+    assert len(css.variants["gzip"]) < len(css.variants["identity"]) / 3
+    assert css.cache_control == assets.IMMUTABLE
+
+
+def test_negotiate_prefers_the_best_accepted_encoding():
+    available = {"identity": b"", "gzip": b"", "br": b""}
+    assert assets.negotiate("gzip, deflate, br", available) == "br"
+    assert assets.negotiate("br;q=0, gzip", available) == "gzip"
+    assert assets.negotiate("", available) == "identity"
+    assert assets.negotiate("br", {"identity": b"", "gzip": b""}) == "identity"
+
+
+def test_page_is_served_with_etag_and_revalidates_with_304():
+    resp = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    assert "cdn.tailwindcss.com" not in resp.text
+    assert "fonts.googleapis.com" not in resp.text
+
+    again = client.get("/", headers={"If-None-Match": resp.headers["ETag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_hashed_assets_are_immutable_and_compressed():
+    page = client.get("/").text
+    for url in re.findall(r'(?:href|src)="(/assets/[^"]+)"', page):
+        resp = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert resp.headers["Cache-Control"] == assets.IMMUTABLE
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert client.get(url, headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+    assert client.get("/assets/main.000000000000.js").status_code == 404
@@ -0,0 +1,69 @@
+import asyncio
+
+from app.core import cache
+
+
+def test_cache_key_normalizes_task_and_separates_dimensions():
+    base = cache.cache_key("llama", "detailed", "m", "system", "Write a  Poem")
+    assert base == cache.cache_key("llama", "detailed", "m", "system", " write a poem ")
+    assert base != cache.cache_key("gemma", "detailed", "m", "system", "write a poem")
+    assert base != cache.cache_key("llama", "short", "m", "system", "write a poem")
+    assert base != cache.cache_key("llama", "detailed", "other", "system", "write a poem")
+    assert base != cache.cache_key("llama", "detailed", "m", "edited system", "write a poem")
+
+
+def test_lru_evicts_least_recently_used():
+    lru = cache.LRUCache(max_entries=2, ttl=60)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    assert lru.get("a") == "1"  # "b" is now least recently used
+    lru.set("c", "3")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1"
+    assert lru.get("c") == "3"
+    assert len(lru) == 2
+
+
+def test_lru_expires_entries_after_ttl(clock):
+    lru = cache.LRUCache(max_entries=10, ttl=5, clock=clock)
+    lru.set("a", "1")
+    clock.now += 4
+    assert lru.get("a") == "1"
+    clock.now += 2
+    assert lru.get("a") is None
+
+
+def test_sqlite_tier_survives_restart_and_is_bounded(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = cache.SQLiteCache(path, max_entries=2, ttl=60, clock=clock)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        disk.set(key, key.upper())
+    disk.close()
+
+    reopened = cache.SQLiteCache(path, max_entries=2, ttl=60, clock=clock)
+    assert reopened.get("a") is None
+    assert reopened.get("b") == "B"
+    clock.now += 120
+    assert reopened.get("c") is None
+    reopened.close()
+
+
+def test_response_cache_promotes_disk_hits_and_counts(tmp_path):
+    disk = cache.SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    disk.set("k", "from disk")
+    response_cache = cache.ResponseCache(cache.LRUCache(), disk)
+    misses = cache.cache_misses.value()
+    disk_hits = cache.cache_hits.value(tier="disk")
+    memory_hits = cache.cache_hits.value(tier="memory")
+
+    async def run():
+        assert await response_cache.get("missing") == (None, None)
+        assert await response_cache.get("k") == ("from disk", "disk")
+        assert await response_cache.get("k") == ("from disk", "memory")
+
+    asyncio.run(run())
+    assert cache.cache_misses.value() == misses + 1
+    assert cache.cache_hits.value(tier="disk") == disk_hits + 1
+    assert cache.cache_hits.value(tier="memory") == memory_hits + 1
+    disk.close()
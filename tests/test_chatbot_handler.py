@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import app.core.chatbot_handler as handler
+from app.core import providers, sessions
+
+
+class FakeClient:
+    def __init__(self, content="REPLY", delay=0.0):
+        self.content = content
+        self.delay = delay
+        self.calls = []
+        self.cancelled = False
+
+    async def chat(self, model, messages, **params):
+        self.calls.append({"model": model, "messages": messages, **params})
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"choices": [{"message": {"content": self.content}}]}
+
+    async def stream_chat(self, model, messages, **params):
+        for token in self.content.split(" "):
+            try:
+                await asyncio.sleep(self.delay)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+            yield token + " "
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def use(client):
+        fake_registry = providers.ProviderRegistry()
+        for provider in providers.registry:
+            fake_registry.register(provider.name, provider.model, client=client, kind=provider.kind)
+        monkeypatch.setattr(handler, "registry", fake_registry)
+        return client
+
+    return use
+
+
+def test_commands_route_to_the_right_model(fake_client):
+    fake = fake_client(FakeClient())
+    asyncio.run(handler.process_chat_message("Improve my prompt: write an email"))
+    asyncio.run(handler.process_chat_message("Ask GPT: what is a haiku?"))
+    asyncio.run(handler.process_chat_message("hello there"))
+    assert [c["model"] for c in fake.calls] == [providers.registry.get("vani").model] + [providers.registry.get("gpt").model] * 2
+    assert fake.calls[0]["messages"][1]["content"] == "user prompt: write an email"
+    assert fake.calls[1]["messages"][0]["content"] == "what is a haiku?"
+
+
+def test_reply_budget_scales_with_message_length(fake_client):
+    fake = fake_client(FakeClient())
+    asyncio.run(handler.process_chat_message("Ask GPT: hi"))
+    asyncio.run(handler.process_chat_message("Ask GPT: " + "why is the sky blue " * 100))
+    short, long = fake.calls[0]["max_tokens"], fake.calls[1]["max_tokens"]
+    assert short < long == handler.REPLY_BUDGETS["ask"].ceiling
+
+
+def test_session_history_is_sent_and_recorded(fake_client, monkeypatch):
+    store = sessions.SessionStore()
+    monkeypatch.setattr(handler, "chat_sessions", store)
+    fake = fake_client(FakeClient("a haiku has three lines"))
+    session = store.get()
+
+    asyncio.run(handler.process_chat_message("Ask GPT: what is a haiku?", session))
+    asyncio.run(handler.process_chat_message("Improve my prompt: write one", session))
+    assert fake.calls[0]["messages"] == [{"role": "system", "content": "what is a haiku?"}]
+    assert fake.calls[1]["messages"][1:3] == [
+        {"role": "user", "content": "Ask GPT: what is a haiku?"},
+        {"role": "assistant", "content": "a haiku has three lines"},
+    ]
+    assert len(session.turns) == 4
+
+    async def consume():
+        return [chunk async for chunk in handler.stream_chat_message("Ask GPT: another", session)]
+
+    asyncio.run(consume())
+    assert [turn.text for turn in session.turns][-2:] == ["Ask GPT: another", "a haiku has three lines "]  # streamed replies are stored too
+
+
+def test_no_artificial_delay(fake_client):
+    fake_client(FakeClient())
+    start = time.perf_counter()
+    asyncio.run(handler.process_chat_message("Improve my prompt: write an email"))
+    asyncio.run(handler.process_chat_message("search the internet for cats"))
+    assert time.perf_counter() - start < 0.2
+
+
+def test_deadline_cancels_upstream_and_returns_timeout_reply(fake_client, monkeypatch):
+    fake = fake_client(FakeClient(delay=5))
+    monkeypatch.setattr(handler.commands["ask"], "deadline", 0.05)
+    before = handler.chat_timeouts.value(command="ask")
+
+    reply = asyncio.run(handler.process_chat_message("Ask GPT: slow question"))
+    assert reply == handler.TIMEOUT_REPLY
+    assert fake.cancelled
+    assert handler.chat_timeouts.value(command="ask") == before + 1
+
+
+def test_upstream_timeout_maps_to_timeout_reply(fake_client):
+    class TimingOutClient(FakeClient):
+        async def chat(self, model, messages, **params):
+            raise httpx.ReadTimeout("read timed out")
+
+    fake_client(TimingOutClient())
+    with pytest.raises(RuntimeError, match="took longer than expected"):
+        asyncio.run(handler.process_chat_message("Ask GPT: anything"))
+
+
+def test_streaming_deadline_stops_the_stream(fake_client, monkeypatch):
+    fake = fake_client(FakeClient(content="one two three four", delay=0.04))
+    monkeypatch.setattr(handler.commands["improve"], "deadline", 0.1)
+
+    async def run():
+        return [chunk async for chunk in handler.stream_chat_message("Improve my prompt: x")]
+
+    chunks = asyncio.run(run())
+    assert chunks[-1].strip() == handler.TIMEOUT_REPLY
+    assert 1 <= len(chunks) - 1 < 4
+    assert fake.cancelled
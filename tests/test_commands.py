@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.commands import Command, CommandRegistry
+
+
+def _registry(delays=None, failing=()):
+    delays = delays or {}
+    running = {"now": 0, "peak": 0}
+
+    def tool(name):
+        async def run(argument, history):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            try:
+                await asyncio.sleep(delays.get(name, 0))
+            finally:
+                running["now"] -= 1
+            if name in failing:
+                raise RuntimeError(f"{name} failed")
+            return f"{name}({argument})"
+
+        return run
+
+    async def stream_ask(argument, history):
+        for word in ("streamed", argument):
+            yield word + " "
+
+    registry = CommandRegistry(timeout_reply="TIMEOUT")
+    registry.register(Command("improve", ("improve my prompt:",), tool("improve")))
+    registry.register(Command("search", ("search the internet for",), tool("search"), concurrency=1))
+    registry.register(Command("ask", ("ask gpt:",), tool("ask"), stream_ask), default=True)
+    return registry, running
+
+
+def _parsed(registry, message):
+    return [(command.name, argument) for command, argument in registry.parse(message)]
+
+
+def test_parse_finds_every_command_in_one_pass():
+    registry, _ = _registry()
+    assert _parsed(registry, "Improve my prompt: write an email") == [("improve", "write an email")]
+    assert _parsed(registry, "hello there") == [("ask", "hello there")]
+    assert _parsed(registry, "") == [("ask", "")]
+    assert _parsed(registry, "Search the internet for cats and then ask GPT: why do they purr?") == [("search", "cats"), ("ask", "why do they purr?")]
+    assert _parsed(registry, "hi!\nsearch the internet for dogs; improve my prompt: a poem") == [("ask", "hi!"), ("search", "dogs"), ("improve", "a poem")]
+    # The separator before the next command is not part of the argument.
+    assert _parsed(registry, "search the internet for cats, and search the internet for dogs") == [("search", "cats"), ("search", "dogs")]
+    assert _parsed(registry, "hi;\nsearch the internet for cats ;") == [("ask", "hi"), ("search", "cats")]
+    # Trigger phrases inside ordinary text are not commands.
+    assert _parsed(registry, "how do I ask gpt: nicely?") == [("ask", "how do I ask gpt: nicely?")]
+
+
+def test_independent_tools_run_concurrently_and_merge_in_order():
+    registry, _ = _registry({"search": 0.2, "ask": 0.2})
+    start = time.perf_counter()
+    reply = asyncio.run(registry.run(registry.parse("search the internet for cats and ask gpt: why"), []))
+    assert reply == "search(cats)\n\nask(why)"
+    assert time.perf_counter() - start < 0.35
+
+
+def test_each_tool_has_its_own_deadline():
+    registry, _ = _registry({"search": 5})
+    registry["search"].deadline = 0.05
+    reply = asyncio.run(registry.run(registry.parse("search the internet for cats and ask gpt: why"), []))
+    assert reply == "TIMEOUT\n\nask(why)"
+
+
+def test_failures_replace_only_their_own_reply():
+    registry, _ = _registry(failing={"search"})
+    message = "search the internet for cats and ask gpt: why"
+    assert asyncio.run(registry.run(registry.parse(message), [])) == "search failed\n\nask(why)"
+    with pytest.raises(RuntimeError, match="search failed"):
+        asyncio.run(registry.run(registry.parse("search the internet for cats"), []))
+
+
+def test_concurrency_limit_is_per_command():
+    registry, running = _registry({"search": 0.02})
+
+    async def many():
+        await asyncio.gather(*(registry.run(registry.parse(f"search the internet for {i}"), []) for i in range(5)))
+
+    asyncio.run(many())
+    assert running["peak"] == 1
+
+
+def test_stream_relays_first_tool_then_the_others():
+    registry, _ = _registry({"search": 0.05})
+
+    async def consume():
+        return [delta async for delta in registry.stream(registry.parse("ask gpt: tea, search the internet for cake"), [])]
+
+    assert asyncio.run(consume()) == ["streamed ", "tea ", "\n\nsearch(cake)"]
@@ -0,0 +1,70 @@
+import asyncio
+
+from app.core.generation_controls import SectionCutter, TokenBudget
+
+REPLY = "### Persona\nA poet.\n\n### Task\nWrite a poem.\n\n**Review:** I made it clearer and more specific."
+
+
+async def _deltas(text, size):
+    for i in range(0, len(text), size):
+        yield text[i : i + size]
+
+
+def _relay(cutter, text, size):
+    async def go():
+        return [delta async for delta in cutter.cut_stream(_deltas(text, size))]
+
+    return asyncio.run(go())
+
+
+def test_cut_drops_trailing_section_at_a_heading():
+    cutter = SectionCutter("Review")
+    assert cutter.cut(REPLY) == "### Persona\nA poet.\n\n### Task\nWrite a poem."
+    for heading in ("## Review", "Review:", "**Review**", "- **Review:** notes", "Review"):
+        assert cutter.cut(f"Prompt\n{heading}\nnotes") == "Prompt", heading
+    # Only a heading-shaped line counts, not a line that starts with the word or mentions it.
+    for kept in ("### Task\nReview the attached pull request for bugs.", "### Task\nAsk for a code Review.", "## Reviewers\nAlice"):
+        assert cutter.cut(kept) == kept
+
+
+def test_stop_sequences_cover_common_heading_styles():
+    assert SectionCutter("Review").stop_sequences() == ["\nReview:", "\n**Review", "\n## Review", "\n### Review"]
+
+
+def test_cut_stream_matches_cut_for_any_chunking():
+    cutter = SectionCutter("Review")
+    for text in (REPLY, "### Task\nReview the attached pull request.\n\n## Review\nnotes", "Prompt\nReview", "Prompt\nReviewing it"):
+        for size in (1, 3, 7, 1000):
+            assert "".join(_relay(cutter, text, size)).rstrip() == cutter.cut(text), (text, size)
+
+
+def test_cut_stream_only_holds_back_possible_headings():
+    deltas = _relay(SectionCutter("Review"), "Write\na poem\n**Re", 1)
+    # "Write" and "a poem" are relayed as they arrive; the "**Re" line is held until the stream ends.
+    assert deltas[:5] == list("Write")
+    assert deltas[-1] == "**Re"
+
+
+def test_cut_stream_closes_upstream_after_the_cut():
+    closed = []
+
+    async def upstream():
+        try:
+            yield "Prompt\n"
+            yield "Review: long notes"
+            yield " that should never be generated"
+        finally:
+            closed.append(True)
+
+    async def go():
+        return [delta async for delta in SectionCutter("Review").cut_stream(upstream())]
+
+    assert "".join(asyncio.run(go())) == "Prompt\n"
+    assert closed == [True]
+
+
+def test_token_budget_grows_with_task_and_is_capped():
+    budget = TokenBudget(base=100, per_input_token=2.0, ceiling=150)
+    assert budget.for_task("") == 100
+    assert budget.for_task("write a poem") == 106
+    assert budget.for_task("word " * 100) == 150
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.core import hedging
+
+
+def _provider(delays, calls, failing=()):
+    async def call(name):
+        calls.append(name)
+        try:
+            await asyncio.sleep(delays[name])
+        except asyncio.CancelledError:
+            calls.append(f"{name}:cancelled")
+            raise
+        if name in failing:
+            raise RuntimeError(f"{name} failed")
+        return f"from {name}"
+
+    return call
+
+
+def test_fast_primary_does_not_hedge():
+    calls = []
+    hedger = hedging.Hedger({"llama": ["gemma"]}, enabled=True, default_delay=0.2)
+    result = asyncio.run(hedger.run(["llama", "gemma"], _provider({"llama": 0.01, "gemma": 0.01}, calls)))
+    assert result == ("from llama", "llama")
+    assert calls == ["llama"]
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    calls = []
+    before_fired = hedging.hedges_fired.value(provider="llama")
+    before_won = hedging.hedges_won.value(provider="llama", backup="gemma")
+    hedger = hedging.Hedger(enabled=True, default_delay=0.05)
+    result = asyncio.run(hedger.run(["llama", "gemma"], _provider({"llama": 1.0, "gemma": 0.01}, calls)))
+    assert result == ("from gemma", "gemma")
+    assert calls == ["llama", "gemma", "llama:cancelled"]
+    assert hedging.hedges_fired.value(provider="llama") == before_fired + 1
+    assert hedging.hedges_won.value(provider="llama", backup="gemma") == before_won + 1
+
+
+def test_hedge_delay_follows_observed_percentile():
+    hedger = hedging.Hedger(percentile=90, min_samples=10, default_delay=7)
+    assert hedger.hedge_delay("llama") == 7
+    for ms in range(1, 11):
+        hedger.latencies("llama").observe(ms / 100)
+    assert hedger.hedge_delay("llama") == 0.09
+
+
+def test_failover_walks_the_chain_until_one_succeeds():
+    calls = []
+    hedger = hedging.Hedger()
+    delays = {"llama": 0, "gemma": 0, "openai": 0}
+    result = asyncio.run(hedger.run(["llama", "gemma", "openai"], _provider(delays, calls, failing={"llama", "gemma"})))
+    assert result == ("from openai", "openai")
+    assert calls == ["llama", "gemma", "openai"]
+
+
+def test_last_error_is_raised_when_every_provider_fails():
+    hedger = hedging.Hedger()
+    with pytest.raises(RuntimeError, match="gemma failed"):
+        asyncio.run(hedger.run(["llama", "gemma"], _provider({"llama": 0, "gemma": 0}, [], failing={"llama", "gemma"})))
+    with pytest.raises(RuntimeError, match="no candidates"):
+        asyncio.run(hedger.run([], _provider({}, [])))
+
+
+def test_chain_skips_unavailable_providers():
+    hedger = hedging.Hedger(hedging.parse_fallbacks("llama=gemma, openai ; gemma=openai"))
+    assert hedger.chain("llama") == ["llama", "gemma", "openai"]
+    assert hedger.chain("llama", available=["llama", "openai"]) == ["llama", "openai"]
+    assert hedger.chain("vani") == ["vani"]
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core import instrumentation, metrics
+
+
+def _app():
+    async def slow(request):
+        await asyncio.sleep(0.02)
+        instrumentation.add_upstream_time(0.015)
+        return PlainTextResponse(f"in flight: {instrumentation.http_requests_in_flight.value(route='/items/{item_id}')}")
+
+    async def boom(request):
+        raise ValueError("nope")
+
+    routes = [Route("/items/{item_id}", slow), Route("/boom", boom)]
+    app = Starlette(routes=routes)
+    app.add_middleware(instrumentation.MetricsMiddleware, routes=app.router.routes)
+    return app
+
+
+def test_requests_are_labelled_by_route_template_and_split_into_upstream_and_overhead():
+    route = "/items/{item_id}"
+    before = instrumentation.http_request_duration_seconds.count(method="GET", route=route, status="200")
+    before_upstream = instrumentation.http_request_upstream_seconds.sum(route=route)
+
+    resp = TestClient(_app()).get("/items/42")
+    assert resp.text == "in flight: 1.0"
+    assert instrumentation.http_requests_in_flight.value(route=route) == 0
+    assert instrumentation.http_request_duration_seconds.count(method="GET", route=route, status="200") == before + 1
+    assert instrumentation.http_request_upstream_seconds.sum(route=route) == pytest.approx(before_upstream + 0.015)
+    assert instrumentation.http_request_overhead_seconds.count(route=route) >= 1
+
+
+def test_unhandled_exceptions_are_counted_by_type():
+    before = instrumentation.http_exceptions.value(route="/boom", type="ValueError")
+    resp = TestClient(_app(), raise_server_exceptions=False).get("/boom")
+    assert resp.status_code == 500
+    assert instrumentation.http_exceptions.value(route="/boom", type="ValueError") == before + 1
+    assert instrumentation.http_request_duration_seconds.count(method="GET", route="/boom", status="500") >= 1
+
+
+def test_unknown_paths_share_one_label():
+    TestClient(_app()).get("/does/not/exist")
+    assert instrumentation.http_request_duration_seconds.count(method="GET", route="unmatched", status="404") >= 1
+
+
+def test_gauge_renders_with_its_own_type():
+    gauge = metrics.Gauge("test_gauge", "A test gauge.")
+    gauge.inc(3)
+    gauge.dec()
+    assert gauge.value() == 2
+    gauge.set(7)
+    assert gauge.collect() == ["test_gauge 7"]
+    assert "# TYPE http_requests_in_flight gauge" in metrics.render()
+
+
+def test_label_values_are_escaped():
+    counter = metrics.Counter("test_escaped_total", "A test counter.", ("value",))
+    counter.inc(value='a\\b"c\nd')
+    assert counter.collect() == ['test_escaped_total{value="a\\\\b\\"c\\nd"} 1']
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.api import job_routes
+from app.core.jobs import JobQueue, JobStore
+from app.prompt_generator import Generation
+
+
+def _queue(workers=1, max_depth=10, ttl=60.0, clock=None):
+    store = JobStore(":memory:", ttl=ttl, clock=clock) if clock else JobStore(":memory:", ttl=ttl)
+    queue = JobQueue(store, workers=workers, max_depth=max_depth)
+    order = []
+
+    async def run(payload):
+        await asyncio.sleep(payload.get("delay", 0))
+        if payload.get("fail"):
+            raise RuntimeError("upstream failed")
+        order.append(payload["task"])
+        return {"echo": payload["task"]}
+
+    queue.register("short", run, priority=0)
+    queue.register("detailed", run, priority=1)
+    return queue, order
+
+
+def test_short_jobs_are_served_before_detailed_ones():
+    async def run():
+        queue, order = _queue(workers=1)
+        jobs = [queue.submit("detailed", {"task": "d1"}), queue.submit("detailed", {"task": "d2"}), queue.submit("short", {"task": "s1"})]
+        results = [await queue.get(job.id, wait=1) for job in jobs]
+        await queue.close()
+        return order, results
+
+    order, results = asyncio.run(run())
+    assert order == ["s1", "d1", "d2"]
+    assert [r["status"] for r in results] == ["done"] * 3
+    assert results[0]["result"] == {"echo": "d1"}
+
+
+def test_submit_rejects_when_the_queue_is_full_and_unknown_kinds():
+    async def run():
+        queue, _ = _queue(workers=1, max_depth=2)
+        queue.submit("detailed", {"task": "a", "delay": 0.05})
+        await asyncio.sleep(0)  # the worker takes the first job off the queue
+        queue.submit("detailed", {"task": "b"})
+        queue.submit("detailed", {"task": "c"})
+        assert queue.depth() == 2
+        with pytest.raises(asyncio.QueueFull):
+            queue.submit("short", {"task": "d"})
+        with pytest.raises(KeyError):
+            queue.submit("unknown", {"task": "e"})
+        await queue.close()
+
+    asyncio.run(run())
+
+
+def test_failed_job_records_its_error_and_is_kept_in_the_store():
+    async def run():
+        queue, _ = _queue()
+        job = queue.submit("short", {"task": "x", "fail": True})
+        polled = await queue.get(job.id, wait=1)
+        stored = await queue.get(job.id)
+        await queue.close()
+        return polled, stored
+
+    polled, stored = asyncio.run(run())
+    assert polled["status"] == "failed"
+    assert polled["error"] == "upstream failed"
+    assert stored == polled
+
+
+def test_poll_without_wait_returns_the_current_state():
+    async def run():
+        queue, _ = _queue()
+        job = queue.submit("short", {"task": "x", "delay": 0.05})
+        first = await queue.get(job.id)
+        final = await queue.get(job.id, wait=1)
+        await queue.close()
+        return first, final
+
+    first, final = asyncio.run(run())
+    assert first["status"] in ("queued", "running")
+    assert final["status"] == "done"
+
+
+def test_store_expires_results():
+    now = [1000.0]
+    store = JobStore(":memory:", ttl=10, clock=lambda: now[0])
+    store.put({"id": "a", "status": "done"})
+    assert store.get("a") == {"id": "a", "status": "done"}
+    now[0] += 11
+    assert store.get("a") is None
+    store.put({"id": "b", "status": "done"})  # purges the expired row
+    assert store._connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+    store.close()
+
+
+def test_close_marks_unfinished_jobs_failed():
+    async def run():
+        queue, _ = _queue(workers=1)
+        running = queue.submit("detailed", {"task": "a", "delay": 10})
+        queued = queue.submit("detailed", {"task": "b"})
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return await queue.get(running.id), await queue.get(queued.id)
+
+    running, queued = asyncio.run(run())
+    assert running["status"] == queued["status"] == "failed"
+    assert "shut down" in queued["error"]
+
+
+def test_drain_lets_unfinished_jobs_finish_until_the_timeout():
+    async def run():
+        queue, order = _queue(workers=1)
+        queue.submit("detailed", {"task": "a", "delay": 0.02})
+        queue.submit("detailed", {"task": "b", "delay": 0.02})
+        drained = await queue.drain(timeout=1)
+        queue.submit("detailed", {"task": "slow", "delay": 10})
+        timed_out = await queue.drain(timeout=0.01)
+        await queue.close()
+        return drained, timed_out, order
+
+    assert asyncio.run(run()) == (True, False, ["a", "b"])
+
+
+def test_store_keeps_results_across_restarts(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    before = JobStore(path)
+    before.put({"id": "a", "status": "done"})
+    before.close()
+    assert JobStore(path).get("a") == {"id": "a", "status": "done"}
+
+
+def test_shutdown_waits_for_running_jobs(monkeypatch):
+    finished = []
+
+    async def fake_generate(task, provider, mode):
+        await asyncio.sleep(0.05)
+        finished.append(task)
+        return Generation(task)
+
+    monkeypatch.setattr(job_routes, "generate", fake_generate)
+    with TestClient(main.create_app()) as client:
+        assert client.post("/jobs", json={"kind": "short", "task": "t", "provider": "gemma"}).status_code == 202
+    assert finished == ["t"]
+
+
+def test_job_routes_submit_and_long_poll(monkeypatch):
+    async def fake_generate(task, provider, mode):
+        await asyncio.sleep(0.01)
+        return Generation(f"{mode}:{task}", cache="MISS", provider=provider)
+
+    monkeypatch.setattr(job_routes, "generate", fake_generate)
+    with TestClient(main.create_app()) as client:
+        resp = client.post("/jobs", json={"kind": "short", "task": "t", "provider": "gemma"})
+        assert resp.status_code == 202
+        job_id = resp.json()["id"]
+        assert resp.headers["Location"] == f"/jobs/{job_id}"
+
+        data = client.get(f"/jobs/{job_id}", params={"wait": 5}).json()
+        assert data["status"] == "done"
+        assert data["result"] == {"prompt": "short:t", "provider": "gemma", "cache": "MISS"}
+
+        assert client.post("/jobs", json={"kind": "detailed", "task": "t"}).status_code == 400
+        assert client.post("/jobs", json={"kind": "nope", "task": "t", "provider": "gemma"}).status_code == 400
+        assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,77 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.core import lifecycle, providers
+
+
+def test_importing_the_app_has_no_side_effects():
+    # No API key, no log handlers, nothing printed.
+    script = "import logging, app.main; assert not logging.getLogger().handlers"
+    result = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).resolve().parents[1], env={"PATH": ""}, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == ""
+
+
+def test_lifespan_starts_and_closes_the_upstream_client(monkeypatch):
+    closed = []
+
+    async def fake_aclose():
+        closed.append(True)
+
+    monkeypatch.setattr(lifecycle, "aclose", fake_aclose)
+    with TestClient(main.create_app()) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+        assert not closed
+    assert closed == [True]
+
+
+def test_drain_waits_for_in_flight_requests_and_rejects_new_ones():
+    drain = lifecycle.Drain()
+
+    async def inner(scope, receive, send):
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"done"})
+
+    app = lifecycle.DrainMiddleware(inner, drain)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            in_flight = asyncio.ensure_future(client.get("/"))
+            await asyncio.sleep(0.01)
+            assert drain.active == 1
+            drained = asyncio.ensure_future(drain.wait(timeout=1))
+            await asyncio.sleep(0)
+            rejected = await client.get("/")
+            return (await in_flight).text, rejected.status_code, await drained
+
+    assert asyncio.run(run()) == ("done", 503, True)
+
+
+def test_drain_gives_up_after_timeout():
+    drain = lifecycle.Drain()
+    drain.enter()
+    assert asyncio.run(drain.wait(timeout=0.01)) is False
+
+
+def test_prewarm_opens_connections_and_tolerates_failures(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"data": []})
+
+    registry = providers.ProviderRegistry(base_url="https://upstream.test/v1")
+    registry._http_client = httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(lifecycle, "registry", registry)
+
+    assert asyncio.run(lifecycle.prewarm(connections=3)) == 2
+    assert calls == ["/v1/models"] * 3
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+import app.prompt_generator as pg
+from app.core import cache, hedging, providers, similarity
+from app.core.local_generator import LOCAL_PROVIDER, extract, render_local
+
+
+class SlowClient:
+    def __init__(self, delay, fail=False):
+        self.delay = delay
+        self.fail = fail
+
+    async def chat(self, model, messages, **params):
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return {"choices": [{"message": {"content": "UPSTREAM"}}]}
+
+    async def stream_chat(self, model, messages, **params):
+        await asyncio.sleep(self.delay)
+        yield "UPSTREAM"
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(pg, "prompt_cache", cache.ResponseCache(cache.LRUCache()))
+    monkeypatch.setattr(pg, "similar_prompts", similarity.SimilarityIndex())
+    monkeypatch.setattr(pg, "hedger", hedging.Hedger())
+
+
+def use_client(monkeypatch, client):
+    fake_registry = providers.ProviderRegistry()
+    for provider in providers.registry:
+        fake_registry.register(provider.name, provider.model, client=client, kind=provider.kind)
+    monkeypatch.setattr(pg, "registry", fake_registry)
+
+
+def test_detailed_prompt_fills_the_structure_from_the_task():
+    text = render_local("Write a python function to parse dates for beginners in a friendly tone, under 50 lines")
+    assert text.startswith("### Persona\nYou are a senior software engineer")
+    assert "### Task\nWrite a python function to parse dates" in text
+    assert "- Length: 50 lines, as requested." in text
+    assert "### Audience\nWrite for beginners;" in text
+    assert "### Tone & Style\nUse a friendly tone" in text
+
+
+def test_audience_and_tone_only_when_explicit():
+    facts = extract("code for parsing logs")
+    assert (facts.audience, facts.tone) == (None, None)
+    assert "### Audience" not in render_local("code for parsing logs")
+    assert extract("a landing page aimed at startup founders as a table").audience == "startup founders"
+    assert extract("a landing page aimed at startup founders as a table").format == "table"
+
+
+def test_short_prompt_is_one_paragraph():
+    text = render_local("help me plan a trip to Japan", "short")
+    assert text.startswith("You are an experienced travel planner. Help me plan a trip to Japan.")
+    assert "\n" not in text
+    assert len(text.split()) < 100
+
+
+def test_local_provider_answers_without_upstream(monkeypatch):
+    use_client(monkeypatch, SlowClient(10, fail=True))
+    result = asyncio.run(pg.generate("write a haiku about rain", "Local", "detailed"))
+    assert result.ok and result.provider == LOCAL_PROVIDER and result.cache == "BYPASS"
+    assert "award-winning creative writer" in result.text
+
+
+def test_blank_task_renders_and_is_rejected_by_the_routes(monkeypatch):
+    for mode_name in ("detailed", "short"):
+        assert "Ask what the task is" in render_local("   ", mode_name)
+    # The degraded path must not fail on a blank task either.
+    assert pg._local_fallback("  ", "llama", "short", RuntimeError("down")).provider == LOCAL_PROVIDER
+
+    client = TestClient(main.app)
+    for path in ("/generate", "/generate/stream", "/generate-short"):
+        assert client.post(path, json={"task": "   ", "provider": "local"}).json() == {"error": "Please provide a 'task'"}
+
+
+def test_slow_or_failing_upstream_falls_back_to_local(monkeypatch):
+    monkeypatch.setattr(pg, "LOCAL_FALLBACK_ENABLED", True)
+    monkeypatch.setattr(pg, "LOCAL_FALLBACK_BUDGET", 0.05)
+
+    use_client(monkeypatch, SlowClient(5))
+    start = time.perf_counter()
+    slow = asyncio.run(pg.generate("write a haiku about rain", "llama", "short"))
+    assert time.perf_counter() - start < 1
+    assert slow.provider == LOCAL_PROVIDER and slow.text.startswith("You are an award-winning")
+
+    use_client(monkeypatch, SlowClient(0, fail=True))
+    failed = asyncio.run(pg.generate("write a haiku about snow", "llama", "detailed"))
+    assert failed.ok and failed.provider == LOCAL_PROVIDER
+
+    async def stream():
+        return [delta async for delta in pg.stream_prompt("write a haiku about sun", "llama")]
+
+    use_client(monkeypatch, SlowClient(5))
+    assert asyncio.run(stream())[0].startswith("### Persona")
+
+
+def test_large_batch_on_one_core():
+    tasks = [f"Write a marketing email #{i} for enterprise customers in a professional tone, under 200 words" for i in range(10_000)]
+    start = time.perf_counter()
+    prompts = [render_local(task) for task in tasks]
+    elapsed = time.perf_counter() - start
+    assert len(set(prompts)) == len(tasks)
+    # Well under a millisecond each, even on a slow CI machine.
+    assert elapsed / len(tasks) < 0.0005
+
+    async def batch():
+        return [item async for item in pg.generate_batch([{"task": task, "provider": "local"} for task in tasks[:2000]])]
+
+    results = asyncio.run(batch())
+    assert len(results) == 2000 and all("prompt" in item for item in results)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import queue
+import sys
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app.api.chatbot_routes as chatbot_routes
+import app.main as main
+from app.core import logs
+
+
+def _record(msg="hello %s", args=("world",), **extra):
+    record = logging.makeLogRecord({"name": "test", "levelname": "INFO", "levelno": logging.INFO, "msg": msg, "args": args})
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_request_id_and_extra_fields():
+    line = logs.JsonFormatter().format(_record(request_id="abc", duration_ms=12.5))
+    entry = json.loads(line)
+    assert entry["msg"] == "hello world"
+    assert entry["request_id"] == "abc"
+    assert entry["duration_ms"] == 12.5
+    assert entry["level"] == "INFO"
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    handler = logs.BoundedQueueHandler(queue.Queue(maxsize=2))
+    before = logs.log_records_dropped.value()
+    for _ in range(5):
+        handler.emit(_record())
+    assert handler.queue.qsize() == 2
+    assert logs.log_records_dropped.value() == before + 3
+
+
+def test_prepared_records_keep_tracebacks_as_text():
+    handler = logs.BoundedQueueHandler(queue.Queue())
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        record = _record()
+        record.exc_info = sys.exc_info()
+    prepared = handler.prepare(record)
+    assert prepared.exc_info is None
+    assert "ValueError: bad" in json.loads(logs.JsonFormatter().format(prepared))["exc"]
+
+
+def test_pipeline_writes_rotated_json_lines_from_a_background_thread(tmp_path):
+    log_file = tmp_path / "app.log"
+    logs.configure_logging(level="INFO", log_file=str(log_file), max_bytes=300, backup_count=2)
+    try:
+        token = logs.request_id_var.set("req-1")
+        for i in range(20):
+            logging.getLogger("app.test").info("line %d", i)
+        logs.request_id_var.reset(token)
+    finally:
+        logs.shutdown_logging()
+    lines = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert lines[-1]["msg"] == "line 19"
+    assert {line["request_id"] for line in lines} == {"req-1"}
+    assert (tmp_path / "app.log.1").exists()
+    assert not (tmp_path / "app.log.3").exists()
+
+
+def test_middleware_assigns_and_propagates_request_ids(caplog):
+    async def inner(scope, receive, send):
+        logging.getLogger("app.test").info("inside", extra={"seen": logs.request_id_var.get()})
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    app = logs.RequestContextMiddleware(inner)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            generated = await client.get("/")
+            forwarded = await client.get("/", headers={"X-Request-ID": "upstream-42"})
+            return generated.headers["x-request-id"], forwarded.headers["x-request-id"]
+
+    with caplog.at_level(logging.INFO):
+        generated, forwarded = asyncio.run(run())
+    assert len(generated) == 32
+    assert forwarded == "upstream-42"
+    assert [r.seen for r in caplog.records if r.getMessage() == "inside"] == [generated, forwarded]
+    access = [r for r in caplog.records if r.name == "app.access"]
+    assert access[-1].status == 204 and access[-1].path == "/"
+
+
+def test_chat_bodies_are_only_logged_when_sampled(monkeypatch, caplog):
+    async def fake_process(message, session=None):
+        return "the reply"
+
+    monkeypatch.setattr(chatbot_routes, "process_chat_message", fake_process)
+    client = TestClient(main.app)
+    with caplog.at_level(logging.INFO, logger="app.api.chatbot_routes"):
+        monkeypatch.setattr(chatbot_routes, "sample_bodies", lambda: False)
+        client.post("/api/chat", json={"message": "secret question"})
+        monkeypatch.setattr(chatbot_routes, "sample_bodies", lambda: True)
+        client.post("/api/chat", json={"message": "secret question"})
+
+    unsampled, sampled = [r for r in caplog.records if r.getMessage() == "chat reply"]
+    assert unsampled.message_chars == len("secret question")
+    assert not hasattr(unsampled, "message_text")
+    assert (sampled.message_text, sampled.reply_text) == ("secret question", "the reply")
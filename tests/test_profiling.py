@@ -0,0 +1,83 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.api import profile_routes
+from app.core import profiling
+from app.prompt_generator import Generation
+
+
+def _client(monkeypatch, profiler, sample_rate=0.0):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", sample_rate)
+    monkeypatch.setattr(profiling, "profiler", profiler)
+    monkeypatch.setattr(profile_routes, "profiler", profiler)
+    return TestClient(main.create_app())
+
+
+def blocking_generate_work():
+    # Stands in for a synchronous SDK call that blocks the event loop.
+    time.sleep(0.1)
+
+
+async def fake_generate(task, provider, mode_name="detailed"):
+    blocking_generate_work()
+    return Generation("ok")
+
+
+def test_header_profiles_a_request_and_admin_serves_it(monkeypatch):
+    monkeypatch.setattr(main, "generate", fake_generate)
+    client = _client(monkeypatch, profiling.Profiler(interval=0.002))
+
+    plain = client.post("/generate", json={"task": "t", "provider": "llama"})
+    assert "x-profile-id" not in plain.headers
+
+    resp = client.post("/generate", json={"task": "t", "provider": "llama"}, headers={"X-Profile": "1"})
+    profile_id = resp.headers["X-Profile-ID"]
+    listed = client.get("/admin/profiles").json()["profiles"]
+    assert [p["id"] for p in listed] == [profile_id]
+    assert listed[0]["trigger"] == "header" and listed[0]["status"] == 200
+
+    collapsed = client.get(f"/admin/profiles/{profile_id}", params={"format": "collapsed"}).text
+    blocking = [line for line in collapsed.splitlines() if "blocking_generate_work" in line]
+    assert blocking and all(line.startswith("request;") for line in blocking)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in blocking) >= 10
+
+    # The blocked loop shows up as lag in the trace.
+    lag = client.get(f"/admin/profiles/{profile_id}", params={"format": "lag"}).json()
+    assert lag["loop_lag_max_ms"] >= 50
+
+    speedscope = json.loads(client.get(f"/admin/profiles/{profile_id}").content)
+    assert speedscope["$schema"] == profiling.SPEEDSCOPE_SCHEMA
+    profile = speedscope["profiles"][0]
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert all(0 <= i < len(speedscope["shared"]["frames"]) for sample in profile["samples"] for i in sample)
+
+    assert client.get("/admin/profiles/nope").status_code == 404
+
+
+def test_sample_rate_and_token(monkeypatch):
+    monkeypatch.setattr(main, "generate", fake_generate)
+    monkeypatch.setattr(profile_routes, "PROFILE_TOKEN", "s3cret")
+    client = _client(monkeypatch, profiling.Profiler(), sample_rate=1.0)
+
+    resp = client.post("/generate", json={"task": "t", "provider": "llama"})
+    assert resp.headers["X-Profile-ID"]
+    assert client.get("/healthz").headers.get("x-profile-id") is None  # outside PROFILE_PATHS
+    assert client.get("/admin/profiles").status_code == 403
+    listed = client.get("/admin/profiles", headers={"X-Profile-Token": "s3cret"}).json()["profiles"]
+    assert listed[0]["trigger"] == "sample"
+
+    headers = [(b"x-profile", b"1")]
+    assert profiling.requested(headers, "/generate", token="s3cret", sample_rate=0) is None
+    assert profiling.requested([(b"x-profile", b"s3cret")], "/generate", token="s3cret", sample_rate=0) == "header"
+
+
+def test_disabled_profiling_installs_nothing():
+    app = main.create_app()
+    assert not any(m.cls is profiling.ProfilingMiddleware for m in app.user_middleware)
+    client = TestClient(app)
+    assert client.get("/admin/profiles").status_code == 404
+    assert client.get("/healthz", headers={"X-Profile": "1"}).headers.get("x-profile-id") is None
@@ -1,136 +1,274 @@
+import asyncio
+
+import pytest
+
 import app.prompt_generator as pg
+from app.core import cache, hedging, providers, similarity
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    async def chat(self, model, messages, **params):
+        self.calls.append({"model": model, "messages": messages, **params})
+        return {"choices": [{"message": {"content": self.content}}]}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(pg, "prompt_cache", cache.ResponseCache(cache.LRUCache()))
+    monkeypatch.setattr(pg, "similar_prompts", similarity.SimilarityIndex())
+
+
+def use_client(monkeypatch, client):
+    """Point every registered provider at ``client``."""
+    fake_registry = providers.ProviderRegistry()
+    for provider in providers.registry:
+        fake_registry.register(provider.name, provider.model, client=client, kind=provider.kind)
+    monkeypatch.setattr(pg, "registry", fake_registry)
 
 
 def test_create_prompt_unknown_provider():
-    out = pg.create_prompt("do something", "unknown-provider")
+    out = asyncio.run(pg.create_prompt("do something", "unknown-provider"))
     assert "Unknown provider" in out
 
 
 def test_create_prompt_llama_success(monkeypatch):
-    # Ensure API key present for _require_api_key in env file
-    monkeypatch.setenv("TOGETHER_API_KEY", "test-key")
-    pg.TOGETHER_API_KEY = "test-key"
-
-    class DummyResp:
-        def __init__(self, data):
-            self._data = data
-
-        def raise_for_status(self):
-            return None
-
-        def json(self):
-            return self._data
-
-    def fake_post(url, headers=None, json=None, timeout=None):
-        return DummyResp(
-            {
-                "choices": [
-                    {
-                        "message": {
-                            "content": "TOGETHER DETAILED OK",
-                        }
-                    }
-                ],
-            }
-        )
-
-    monkeypatch.setattr(pg.requests, "post", fake_post)
-
-    out = pg.create_prompt("write a poem", "llama")
-    assert out == "TOGETHER DETAILED OK"
+    fake = FakeClient("TOGETHER DETAILED OK")
+    use_client(monkeypatch, fake)
 
+    out = asyncio.run(pg.create_prompt("write a poem", "llama"))
+    assert out == "TOGETHER DETAILED OK"
+    assert fake.calls[0]["model"] == "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"
 
 
 def test_create_short_prompt_llama_success(monkeypatch):
-    monkeypatch.setenv("TOGETHER_API_KEY", "test-key")
-    pg.TOGETHER_API_KEY = "test-key"
-
-    class DummyResp:
-        def __init__(self, data):
-            self._data = data
-
-        def raise_for_status(self):
-            return None
-
-        def json(self):
-            return self._data
-
-    def fake_post(url, headers=None, json=None, timeout=None):
-        return DummyResp(
-            {
-                "choices": [
-                    {
-                        "message": {
-                            "content": "TOGETHER SHORT OK",
-                        }
-                    }
-                ],
-            }
-        )
-
-    monkeypatch.setattr(pg.requests, "post", fake_post)
-
-    out = pg.create_short_prompt("summarize text", "llama")
+    fake = FakeClient("TOGETHER SHORT OK")
+    use_client(monkeypatch, fake)
+
+    out = asyncio.run(pg.create_short_prompt("summarize text", "llama"))
     assert out == "TOGETHER SHORT OK"
+    assert fake.calls[0]["max_tokens"] == 100
+
 
+def test_chat_models_are_not_generation_providers(monkeypatch):
+    fake = FakeClient("OK")
+    use_client(monkeypatch, fake)
+    for name in ("vani", "gpt"):
+        result = asyncio.run(pg.generate("write a poem", name, "detailed"))
+        assert not result.ok and "Unknown provider" in result.text
+        assert pg.gate_provider("write a poem", name) is None
+    assert fake.calls == []
+    assert {p.name for p in pg.registry.of_kind()} == {"openai", "llama", "gemma"}
 
 
-def test_create_prompt_openai_uses_sdk(monkeypatch):
-    class FakeMessage:
-        def __init__(self, content):
-            self.content = content
+def test_create_short_prompt_unknown_provider():
+    out = asyncio.run(pg.create_short_prompt("summarize text", "nope"))
+    assert out == "Provider not supported."
 
-    class FakeChoice:
-        def __init__(self, content):
-            self.message = FakeMessage(content)
 
-    class FakeResponse:
-        def __init__(self, content):
-            self.choices = [FakeChoice(content)]
+def test_create_prompt_openai_uses_client(monkeypatch):
+    use_client(monkeypatch, FakeClient("VISION OK"))
+    out = asyncio.run(pg.create_prompt("describe an image", "openai"))
+    assert out == "VISION OK"
 
-    class FakeCompletions:
-        def create(self, model, messages, max_tokens=None):
-            return FakeResponse("VISION OK")
 
-    class FakeChat:
-        def __init__(self):
-            self.completions = FakeCompletions()
+def test_create_prompt_gemma_uses_client(monkeypatch):
+    use_client(monkeypatch, FakeClient("GEMMA OK"))
+    out = asyncio.run(pg.create_prompt("explain trees", "gemma"))
+    assert out == "GEMMA OK"
 
-    class FakeClient:
-        def __init__(self):
-            self.chat = FakeChat()
 
-    monkeypatch.setattr(pg, "client", FakeClient())
-    out = pg.create_prompt("describe an image", "openai")
-    assert out == "VISION OK"
+def test_create_prompt_uses_provider_style(monkeypatch):
+    fake = FakeClient("OK")
+    use_client(monkeypatch, fake)
+    asyncio.run(pg.create_prompt("write a poem", "openai"))
+    asyncio.run(pg.create_prompt("write a poem", "llama"))
+    openai_messages, llama_messages = fake.calls[0]["messages"], fake.calls[1]["messages"]
+    assert openai_messages[0]["content"] == pg.DETAILED_SYSTEM_PROMPT
+    assert openai_messages[1]["content"] == "user prompt: write a poem"
+    assert llama_messages[0]["content"] == pg.LLAMA_DETAILED_SYSTEM_PROMPT
+    assert llama_messages[1]["content"] == "Here is the user prompt: write a poem"
+
+
+def test_detailed_prompt_stops_before_review_and_caps_tokens(monkeypatch):
+    fake = FakeClient("### Task\nWrite a poem.\n\n**Review:** clearer now.")
+    use_client(monkeypatch, fake)
 
+    first = asyncio.run(pg.generate("write a poem", "llama", "detailed"))
+    assert first.text == "### Task\nWrite a poem."
+    assert fake.calls[0]["stop"][0] == "\nReview:"
+    assert fake.calls[0]["max_tokens"] == pg.MODES["detailed"].budget.for_task("write a poem")
+    # The cut reply is what gets cached.
+    assert asyncio.run(pg.generate("write a poem", "llama", "detailed")).text == first.text
 
 
-def test_create_prompt_gemma_uses_sdk(monkeypatch):
-    class FakeMessage:
-        def __init__(self, content):
-            self.content = content
+def test_reply_cut_off_at_max_tokens_is_served_but_not_cached(monkeypatch):
+    class TruncatingClient(FakeClient):
+        async def chat(self, model, messages, **params):
+            response = await super().chat(model, messages, **params)
+            response["choices"][0]["finish_reason"] = "length"
+            return response
 
-    class FakeChoice:
-        def __init__(self, content):
-            self.message = FakeMessage(content)
+    fake = TruncatingClient("### Persona\nA poet.\n\n### Task\nWrite a")
+    use_client(monkeypatch, fake)
+    first = asyncio.run(pg.generate("write a poem", "gemma", "detailed"))
+    assert (first.text, first.cache) == ("### Persona\nA poet.\n\n### Task\nWrite a", "BYPASS")
+    assert asyncio.run(pg.generate("write a poem", "gemma", "detailed")).cache == "BYPASS"
+    assert len(fake.calls) == 2
 
-    class FakeResponse:
-        def __init__(self, content):
-            self.choices = [FakeChoice(content)]
+    # Cut off only inside the dropped Review section: the prompt itself is complete, so it is cached.
+    fake.content = "### Task\nWrite a poem.\n\n**Review:** I made"
+    asyncio.run(pg.generate("write a haiku", "llama", "detailed"))
+    assert asyncio.run(pg.generate("write a haiku", "llama", "detailed")).cache == "HIT"
 
-    class FakeCompletions:
-        def create(self, model, messages, max_tokens=None):
-            return FakeResponse("GEMMA OK")
 
-    class FakeChat:
-        def __init__(self):
-            self.completions = FakeCompletions()
+def test_only_the_llama_template_is_cut(monkeypatch):
+    reply = "### Persona\nA senior engineer.\n\n### Task\nReview the attached pull request for bugs."
+    fake = FakeClient(reply)
+    use_client(monkeypatch, fake)
+
+    assert asyncio.run(pg.generate("review my pull request", "gemma", "detailed")).text == reply
+    assert "stop" not in fake.calls[0]
+    # The llama template cuts only heading-shaped lines, not a task line that starts with the word.
+    assert asyncio.run(pg.generate("review my pull request", "llama", "detailed")).text == reply
+
+
+def test_create_prompt_upstream_error_is_reported(monkeypatch):
+    class FailingClient:
+        async def chat(self, model, messages, **params):
+            raise RuntimeError("boom")
+
+    use_client(monkeypatch, FailingClient())
+    out = asyncio.run(pg.create_prompt("explain trees", "gemma"))
+    assert out == "❌ Error: boom"
+
+
+def test_failing_provider_fails_over_to_its_backup(monkeypatch):
+    class LlamaDownClient(FakeClient):
+        async def chat(self, model, messages, **params):
+            if model.startswith("meta-llama/"):
+                raise RuntimeError("llama down")
+            return await super().chat(model, messages, **params)
+
+    fake = LlamaDownClient("FROM GEMMA")
+    use_client(monkeypatch, fake)
+    monkeypatch.setattr(pg, "hedger", hedging.Hedger({"llama": ["gemma"]}))
 
-    class FakeClient:
+    result = asyncio.run(pg.generate("write a poem", "llama", "detailed"))
+    assert (result.text, result.provider) == ("FROM GEMMA", "gemma")
+    # The backup is asked with its own system prompt.
+    assert fake.calls[0]["messages"][0]["content"] == pg.DETAILED_SYSTEM_PROMPT
+
+    # The backup's reply is cached as gemma's: llama is asked again next time, not served gemma's text as a HIT.
+    again = asyncio.run(pg.generate("write a poem", "llama", "detailed"))
+    assert (again.cache, again.provider) == ("MISS", "gemma")
+    assert asyncio.run(pg.generate("write a poem", "gemma", "detailed")).cache == "HIT"
+
+
+def test_repeated_task_is_served_from_cache(monkeypatch):
+    fake = FakeClient("CACHED OK")
+    use_client(monkeypatch, fake)
+
+    first = asyncio.run(pg.generate("Write a poem", "llama", "detailed"))
+    second = asyncio.run(pg.generate("  write a   POEM ", "llama", "detailed"))
+    assert (first.cache, second.cache) == ("MISS", "HIT")
+    assert second.text == "CACHED OK"
+    assert len(fake.calls) == 1
+
+    # Mode and provider are part of the key.
+    assert asyncio.run(pg.generate("Write a poem", "llama", "short")).cache == "MISS"
+    assert asyncio.run(pg.generate("Write a poem", "gemma", "detailed")).cache == "MISS"
+
+
+def test_reworded_task_is_served_from_similarity_tier(monkeypatch):
+    fake = FakeClient("SEA POEM PROMPT")
+    use_client(monkeypatch, fake)
+
+    first = asyncio.run(pg.generate("write a poem about the sea", "gemma", "detailed"))
+    second = asyncio.run(pg.generate("Please write a poem about the seas", "gemma", "detailed"))
+    assert (first.cache, second.cache) == ("MISS", "SIMILAR")
+    assert second.text == "SEA POEM PROMPT"
+    assert len(fake.calls) == 1
+    assert asyncio.run(pg.generate("write a poem about the moon", "gemma", "detailed")).cache == "MISS"
+
+
+def test_errors_are_not_cached(monkeypatch):
+    class FlakyClient:
         def __init__(self):
-            self.chat = FakeChat()
+            self.calls = 0
 
-    monkeypatch.setattr(pg, "client", FakeClient())
-    out = pg.create_prompt("explain trees", "gemma")
-    assert out == "GEMMA OK"
+        async def chat(self, model, messages, **params):
+            self.calls += 1
+            if self.calls == 1:
+                raise RuntimeError("boom")
+            return {"choices": [{"message": {"content": "RECOVERED"}}]}
+
+    use_client(monkeypatch, FlakyClient())
+    monkeypatch.setattr(pg, "hedger", hedging.Hedger())  # no failover
+    assert asyncio.run(pg.create_short_prompt("summarize", "gemma")) == "Error: boom"
+    assert asyncio.run(pg.create_short_prompt("summarize", "gemma")) == "RECOVERED"
+    assert asyncio.run(pg.generate("summarize", "nope", "short")).cache == "BYPASS"
+
+
+def test_concurrent_identical_generations_share_one_upstream_call(monkeypatch):
+    class SlowClient(FakeClient):
+        async def chat(self, model, messages, **params):
+            await asyncio.sleep(0.05)
+            return await super().chat(model, messages, **params)
+
+    fake = SlowClient("SHARED")
+    use_client(monkeypatch, fake)
+
+    async def run():
+        return await asyncio.gather(*(pg.generate("write a poem", "llama", "detailed") for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert [r.text for r in results] == ["SHARED"] * 4
+    assert len(fake.calls) == 1
+
+
+def test_generate_batch_bounds_concurrency_per_provider_and_reports_item_errors(monkeypatch):
+    in_flight = {"llama": 0, "gemma": 0}
+    peak = {"llama": 0, "gemma": 0}
+
+    async def fake_generate(task, provider, mode_name="detailed"):
+        in_flight[provider] += 1
+        peak[provider] = max(peak[provider], in_flight[provider])
+        await asyncio.sleep(0.01)
+        in_flight[provider] -= 1
+        if task == "fail":
+            return pg.Generation("❌ Error: boom", ok=False)
+        return pg.Generation(f"{mode_name}:{task}")
+
+    monkeypatch.setattr(pg, "generate", fake_generate)
+    items = [{"task": f"t{i}", "provider": "llama" if i % 2 else "gemma", "mode": "short"} for i in range(12)]
+    items += [{"task": "fail", "provider": "llama"}, {"provider": "llama"}, {"task": "x", "provider": "llama", "mode": "poem"}, "bad"]
+
+    async def run():
+        return [result async for result in pg.generate_batch(items, per_provider=2)]
+
+    results = {r["index"]: r for r in asyncio.run(run())}
+    assert len(results) == len(items)
+    assert peak == {"llama": 2, "gemma": 2}
+    assert results[0]["prompt"] == "short:t0"
+    assert results[12] == {"index": 12, "task": "fail", "provider": "llama", "mode": "detailed", "error": "❌ Error: boom"}
+    assert results[13]["error"] == "Please provide a 'task'"
+    assert results[14]["error"] == "Unknown mode: poem"
+    assert results[15]["error"] == "Each item must be an object"
+
+
+def test_generate_batch_yields_in_completion_order(monkeypatch):
+    async def fake_generate(task, provider, mode_name="detailed"):
+        await asyncio.sleep(float(task))
+        return pg.Generation(task)
+
+    monkeypatch.setattr(pg, "generate", fake_generate)
+    items = [{"task": "0.06", "provider": "llama"}, {"task": "0.0", "provider": "gemma"}, {"task": "0.03", "provider": "openai"}]
+
+    async def run():
+        return [result["index"] async for result in pg.generate_batch(items)]
+
+    assert asyncio.run(run()) == [1, 2, 0]
@@ -0,0 +1,58 @@
+import app.main  # noqa: F401  (registers every route's prompt cost)
+from app.core import prompt_templates
+from app.core.prompt_templates import compile_template, estimate_tokens, load_template, minify, prompt_costs
+
+# Upper bounds on the fixed prompt tokens each endpoint sends upstream per request.
+# Raise one deliberately when a template edit is worth the extra cost on every call.
+PROMPT_TOKEN_BUDGETS = {
+    "/generate": 130,
+    "/generate/stream": 130,
+    "/generate-short": 60,
+    "/api/chat": 800,
+    "/api/chat/stream": 800,
+}
+
+
+def test_minify_dedents_and_collapses_whitespace():
+    raw = """
+        ## Title
+
+        - one    item
+        -   two
+
+
+        **Done**
+    """
+    assert minify(raw) == "## Title\n\n- one item\n- two\n\n**Done**"
+
+
+def test_estimate_tokens_counts_words_punctuation_and_long_words():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("write a poem") == 3
+    assert estimate_tokens("### Persona") == 3  # "###" + two pieces for the 7-letter word
+    assert estimate_tokens("one\n\ntwo") == 3
+
+
+def test_templates_are_compiled_once_per_content():
+    first = compile_template("t", "  hello   world  ")
+    assert first.text == "hello world"
+    assert first.tokens == 2
+    assert compile_template("t", "  hello   world  ") is first
+    assert compile_template("t", "hello there").sha256 != first.sha256
+
+
+def test_bundled_templates_are_already_minified():
+    for path in prompt_templates.PROMPTS_DIR.glob("*.md"):
+        template = load_template(path.stem)
+        assert template.text == minify(template.text)
+        assert template.tokens == estimate_tokens(template.text)
+
+
+def test_every_endpoint_has_a_prompt_cost():
+    endpoints = {endpoint for endpoint, _ in prompt_costs()}
+    assert endpoints == set(PROMPT_TOKEN_BUDGETS)
+
+
+def test_prompt_costs_stay_within_budget():
+    over = {key: tokens for key, tokens in prompt_costs().items() if tokens > PROMPT_TOKEN_BUDGETS[key[0]]}
+    assert not over, f"Prompt templates exceed their per-request token budget: {over}"
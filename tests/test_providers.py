@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.core import metrics, providers
+
+
+def _client(http, retry=providers.RetryPolicy(attempts=0)):
+    limiters = providers.RateLimiterRegistry(rate=1000, burst=1000)
+    return providers.AsyncTogetherClient(http_client=http, api_key="k", limiters=limiters, retry=retry)
+
+
+def _completion(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+def test_chat_posts_payload_with_auth_header():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["url"] = str(request.url)
+        seen["auth"] = request.headers.get("authorization")
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json=_completion("OK"))
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = providers.AsyncTogetherClient(http_client=http, api_key="test-key", limiters=providers.RateLimiterRegistry(rate=1000, burst=1000))
+            return await client.chat("some/model", [{"role": "user", "content": "hi"}], max_tokens=5)
+
+    data = asyncio.run(run())
+    assert providers.extract_content(data) == "OK"
+    assert seen["url"] == "https://upstream.test/v1/chat/completions"
+    assert seen["auth"] == "Bearer test-key"
+    assert seen["body"] == {"model": "some/model", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 5}
+
+
+def test_chat_records_token_usage_and_latency():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={**_completion("OK"), "usage": {"prompt_tokens": 12, "completion_tokens": 30}})
+
+    before = providers.upstream_tokens.value(model="usage/model", kind="completion")
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            await _client(http).chat("usage/model", [])
+
+    asyncio.run(run())
+    assert providers.upstream_tokens.value(model="usage/model", kind="prompt") >= 12
+    assert providers.upstream_tokens.value(model="usage/model", kind="completion") == before + 30
+    assert providers.upstream_request_seconds.count(model="usage/model", outcome="ok") >= 1
+
+
+def test_chat_raises_for_http_errors():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, json={"error": "unavailable"})
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = _client(http)
+            try:
+                await client.chat("m", [])
+            except httpx.HTTPStatusError as exc:
+                return exc.response.status_code
+        return None
+
+    assert asyncio.run(run()) == 503
+    assert providers.upstream_errors.value(model="m", type="http_503") >= 1
+
+
+def test_concurrent_calls_overlap():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json=_completion("OK"))
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = _client(http)
+            start = time.perf_counter()
+            await asyncio.gather(*(client.chat("m", []) for _ in range(10)))
+            return time.perf_counter() - start
+
+    # Ten sequential calls would take ~2s; overlapping calls finish in ~one round trip.
+    assert asyncio.run(run()) < 1.0
+
+
+def test_extract_content_handles_missing_fields():
+    assert providers.extract_content({}) == ""
+    assert providers.extract_content({"choices": [{"message": {"content": None}}]}) == ""
+    assert providers.extract_content({"choices": [{"text": "legacy"}]}) == "legacy"
+    assert providers.extract_content({"choices": [{"message": {"content": ["a", "b"]}}]}) == "a b"
+
+
+def test_registry_lookup_and_default_providers():
+    assert {"openai", "llama", "gemma", "vani", "gpt"} <= {p.name for p in providers.registry}
+    assert providers.registry.get("gemma").model == "google/gemma-3n-E4B-it"
+    with pytest.raises(KeyError):
+        providers.registry.get("unknown")
+
+
+def test_registry_shares_one_pooled_client():
+    registry = providers.ProviderRegistry(base_url="https://upstream.test/v1", limits=httpx.Limits(max_connections=3, max_keepalive_connections=2))
+    first = registry.register("a", "model-a")
+    second = registry.register("b", "model-b")
+    assert first.client is second.client
+    assert registry.http_client is registry.http_client
+    asyncio.run(registry.aclose())
+
+
+def test_connection_tracer_counts_new_and_reused_connections():
+    before_new = providers.upstream_requests.value(reused="false")
+    before_reused = providers.upstream_requests.value(reused="true")
+    before_tls = providers.upstream_tls_handshakes.value()
+
+    async def run():
+        fresh = providers.ConnectionTracer()
+        await fresh("connection.connect_tcp.started", {})
+        await fresh("connection.connect_tcp.complete", {})
+        await fresh("connection.start_tls.started", {})
+        await fresh("connection.start_tls.complete", {})
+        fresh.finish()
+        reused = providers.ConnectionTracer()
+        await reused("http11.send_request_headers.started", {})
+        reused.finish()
+
+    asyncio.run(run())
+    assert providers.upstream_requests.value(reused="false") == before_new + 1
+    assert providers.upstream_requests.value(reused="true") == before_reused + 1
+    assert providers.upstream_tls_handshakes.value() == before_tls + 1
+    assert "upstream_handshake_seconds_total" in metrics.render()
+
+
+def test_stream_chat_yields_deltas_until_done():
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["body"] = json.loads(request.content)
+        chunks = [
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            {"choices": [{"delta": {"content": "Hel"}}]},
+            {"choices": [{"delta": {"content": "lo"}}]},
+            {"choices": [{"delta": {}, "finish_reason": "length"}]},
+        ]
+        body = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = _client(http)
+            return [delta async for delta in client.stream_chat("m", [], finish=finish, max_tokens=3)]
+
+    finish: list[str] = []
+    assert asyncio.run(run()) == ["Hel", "lo"]
+    assert finish == ["length"]
+    assert seen["body"]["stream"] is True
+    assert "finish" not in seen["body"]
+
+
+def test_stream_chat_raises_for_http_errors():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, json={"error": "rate limited"})
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = _client(http)
+            with pytest.raises(httpx.HTTPStatusError):
+                async for _ in client.stream_chat("m", []):
+                    pass
+
+    asyncio.run(run())
@@ -0,0 +1,134 @@
+import asyncio
+
+import httpx
+
+from app.core import providers, ratelimit
+
+
+def test_bucket_allows_burst_then_spaces_requests_in_order(clock):
+    bucket = ratelimit.AdaptiveTokenBucket(rate=2, burst=3, clock=clock)
+    delays = [bucket.reserve() for _ in range(5)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert delays[3:] == [0.5, 1.0]
+
+
+def test_throttle_halves_rate_and_blocks_for_retry_after(clock):
+    bucket = ratelimit.AdaptiveTokenBucket(rate=4, burst=1, min_rate=0.5, clock=clock)
+    asyncio.run(bucket.on_throttle(retry_after=3))
+    assert bucket.rate == 2
+    assert bucket.reserve() == 3
+
+    async def throttled():
+        for _ in range(10):
+            await bucket.on_throttle()
+
+    asyncio.run(throttled())
+    assert bucket.rate == 0.5
+
+
+def test_successes_recover_rate_up_to_the_configured_maximum(clock):
+    bucket = ratelimit.AdaptiveTokenBucket(rate=10, burst=1, clock=clock)
+    asyncio.run(bucket.on_throttle(retry_after=0))
+    assert bucket.rate == 5
+
+    async def recovered():
+        for _ in range(100):
+            await bucket.on_success()
+
+    asyncio.run(recovered())
+    assert bucket.rate == 10
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert ratelimit.parse_retry_after("2") == 2.0
+    assert ratelimit.parse_retry_after(None) is None
+    assert ratelimit.parse_retry_after("soon") is None
+    assert ratelimit.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_registry_applies_per_model_overrides():
+    registry = ratelimit.RateLimiterRegistry(rate=5, overrides={"slow/model": 0.5})
+    assert registry.get("slow/model").rate == 0.5
+    assert registry.get("other").rate == 5
+    assert registry.get("other") is registry.get("other")
+    assert ratelimit._parse_overrides("a=1, b/c=0.25,") == {"a": 1.0, "b/c": 0.25}
+
+
+def _retrying_client(http, attempts=3):
+    limiters = ratelimit.RateLimiterRegistry(rate=1000, burst=1000)
+    retry = ratelimit.RetryPolicy(attempts=attempts, base_delay=0.001, max_delay=0.01)
+    return providers.AsyncTogetherClient(http_client=http, api_key="k", limiters=limiters, retry=retry)
+
+
+def _flaky_handler(failures):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) <= len(failures):
+            return failures[len(calls) - 1]
+        return httpx.Response(200, json={"choices": [{"message": {"content": "OK"}}]})
+
+    return handler, calls
+
+
+def test_chat_retries_429_and_5xx_then_succeeds():
+    handler, calls = _flaky_handler([httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(503)])
+    before = ratelimit.rate_limit_throttled.value(model="m")
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            client = _retrying_client(http)
+            data = await client.chat("m", [])
+            return data, client.limiters.get("m")
+
+    data, bucket = asyncio.run(run())
+    assert providers.extract_content(data) == "OK"
+    assert len(calls) == 3
+    assert ratelimit.rate_limit_throttled.value(model="m") == before + 1
+    assert bucket.rate < bucket.max_rate
+
+
+def test_chat_gives_up_after_configured_attempts():
+    handler, calls = _flaky_handler([httpx.Response(502)] * 10)
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            try:
+                await _retrying_client(http, attempts=2).chat("m", [])
+            except httpx.HTTPStatusError as exc:
+                return exc.response.status_code
+
+    assert asyncio.run(run()) == 502
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    handler, calls = _flaky_handler([httpx.Response(400)])
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            try:
+                await _retrying_client(http).chat("m", [])
+            except httpx.HTTPStatusError as exc:
+                return exc.response.status_code
+
+    assert asyncio.run(run()) == 400
+    assert len(calls) == 1
+
+
+def test_stream_chat_retries_before_first_byte():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, text='data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n\n')
+
+    async def run():
+        async with httpx.AsyncClient(base_url="https://upstream.test/v1", transport=httpx.MockTransport(handler)) as http:
+            return [delta async for delta in _retrying_client(http).stream_chat("m", [])]
+
+    assert asyncio.run(run()) == ["hi"]
+    assert len(calls) == 2
@@ -1,6 +1,11 @@
+import json
+
 from fastapi.testclient import TestClient
 
+import app.api.chatbot_routes as chatbot_routes
 import app.main as main
+import app.prompt_generator as prompt_generator
+from app.prompt_generator import Generation
 
 client = TestClient(main.app)
 
@@ -12,16 +17,19 @@ def test_root_page_renders():
 
 
 def test_generate_returns_prompt(monkeypatch):
-    def fake_create_prompt(task, provider):
-        return "PROMPT_OK"
+    async def fake_generate(task, provider, mode):
+        assert mode == "detailed"
+        return Generation("PROMPT_OK", cache="HIT", provider="gemma")
 
     # Patch the symbol imported into main
-    monkeypatch.setattr(main, "create_prompt", fake_create_prompt)
+    monkeypatch.setattr(main, "generate", fake_generate)
 
     resp = client.post("/generate", json={"task": "x", "provider": "llama"})
     assert resp.status_code == 200
     data = resp.json()
     assert data.get("prompt") == "PROMPT_OK"
+    assert resp.headers["X-Cache"] == "HIT"
+    assert resp.headers["X-Provider"] == "gemma"
 
 
 def test_generate_missing_task():
@@ -36,13 +44,155 @@ def test_generate_missing_provider():
     assert resp.json().get("error") == "Please select a 'provider'"
 
 
+def test_non_string_task_is_rejected_with_400():
+    for path in ("/generate", "/generate/stream", "/generate-short"):
+        resp = client.post(path, json={"task": ["x"], "provider": "llama"})
+        assert resp.status_code == 400, path
+        assert resp.json() == {"error": "'task' must be a string"}
+
+
 def test_generate_short_returns_prompt(monkeypatch):
-    def fake_create_short(task, provider):
-        return "SHORT_OK"
+    async def fake_generate(task, provider, mode):
+        assert mode == "short"
+        return Generation("SHORT_OK")
 
-    monkeypatch.setattr(main, "create_short_prompt", fake_create_short)
+    monkeypatch.setattr(main, "generate", fake_generate)
 
     resp = client.post("/generate-short", json={"task": "x", "provider": "llama"})
     assert resp.status_code == 200
     data = resp.json()
     assert data.get("prompt") == "SHORT_OK"
+    assert resp.headers["X-Cache"] == "MISS"
+
+
+def test_metrics_endpoint_exposes_connection_reuse():
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert "text/plain" in resp.headers.get("content-type", "")
+    assert "# TYPE upstream_requests_total counter" in resp.text
+
+
+def _sse_events(text):
+    events = []
+    for raw in text.strip().split("\n\n"):
+        name, data = "message", None
+        for line in raw.split("\n"):
+            if line.startswith("event:"):
+                name = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:") :])
+        events.append((name, data))
+    return events
+
+
+def test_generate_stream_sends_tokens_then_done(monkeypatch):
+    async def fake_stream(task, provider):
+        for token in ["### ", "Persona"]:
+            yield token
+
+    monkeypatch.setattr(main, "stream_prompt", fake_stream)
+
+    resp = client.post("/generate/stream", json={"task": "x", "provider": "llama"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(resp.text)
+    assert events[:2] == [("message", {"delta": "### "}), ("message", {"delta": "Persona"})]
+    name, data = events[-1]
+    assert name == "done"
+    assert data["ttft_ms"] <= data["total_ms"]
+
+
+def test_generate_stream_missing_task():
+    resp = client.post("/generate/stream", json={"provider": "llama"})
+    assert resp.json().get("error") == "Please provide a 'task'"
+
+
+def test_chat_stream_reports_errors_as_events(monkeypatch):
+    async def failing_stream(message, session=None):
+        yield "partial"
+        raise RuntimeError("Sorry, I encountered an unexpected error. Please try again later.")
+
+    monkeypatch.setattr(chatbot_routes, "stream_chat_message", failing_stream)
+
+    resp = client.post("/api/chat/stream", json={"message": "Ask GPT: hi"})
+    events = _sse_events(resp.text)
+    assert events[0] == ("message", {"delta": "partial"})
+    assert events[-1] == ("error", {"error": "Sorry, I encountered an unexpected error. Please try again later."})
+
+
+def test_chat_session_id_round_trips(monkeypatch):
+    seen = []
+
+    async def fake_process(message, session=None):
+        seen.append(session)
+        return "ok"
+
+    async def fake_stream(message, session=None):
+        yield "ok"
+
+    monkeypatch.setattr(chatbot_routes, "process_chat_message", fake_process)
+    monkeypatch.setattr(chatbot_routes, "stream_chat_message", fake_stream)
+    first = client.post("/api/chat", json={"message": "hi"}).json()
+    second = client.post("/api/chat", json={"message": "again", "session_id": first["session_id"]}).json()
+    assert second["session_id"] == first["session_id"]
+    assert seen[0] is seen[1]
+
+    resp = client.post("/api/chat/stream", json={"message": "hi", "session_id": first["session_id"]})
+    assert resp.headers["x-session-id"] == first["session_id"]
+
+
+def test_generate_batch_streams_ndjson(monkeypatch):
+    async def fake_batch(items):
+        for index, item in enumerate(items):
+            yield {"index": index, "prompt": item["task"].upper()}
+
+    monkeypatch.setattr(main, "generate_batch", fake_batch)
+
+    resp = client.post("/generate/batch", json={"items": [{"task": "a", "provider": "llama"}, {"task": "b", "provider": "gemma", "mode": "short"}]})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert lines == [{"index": 0, "prompt": "A"}, {"index": 1, "prompt": "B"}]
+
+
+def test_generate_batch_reports_malformed_items_without_failing_the_batch(monkeypatch):
+    async def fake_generate(task, provider, mode_name="detailed"):
+        return Generation(f"{provider}:{task}")
+
+    monkeypatch.setattr(prompt_generator, "generate", fake_generate)
+
+    items = [
+        {"task": "a", "provider": "llama"},
+        {"task": "x", "provider": 5},
+        {"task": ["x"], "provider": "llama"},
+        {"task": "x", "provider": "llama", "mode": ["short"]},
+        {"task": "b", "provider": "gemma"},
+    ]
+    resp = client.post("/generate/batch", json={"items": items})
+    assert resp.status_code == 200
+    lines = {line["index"]: line for line in map(json.loads, resp.text.splitlines())}
+    assert len(lines) == len(items)
+    assert (lines[0]["prompt"], lines[4]["prompt"]) == ("llama:a", "gemma:b")
+    assert [lines[i]["error"] for i in (1, 2, 3)] == ["'provider' must be a string", "'task' must be a string", "'mode' must be a string"]
+
+
+def test_generate_batch_reports_an_item_that_raises_and_keeps_the_others(monkeypatch):
+    async def fake_generate(task, provider, mode_name="detailed"):
+        if task == "boom":
+            raise ValueError("generation blew up")
+        return Generation(f"{provider}:{task}")
+
+    monkeypatch.setattr(prompt_generator, "generate", fake_generate)
+
+    items = [{"task": "a", "provider": "llama"}, {"task": "boom", "provider": "llama"}, {"task": "b", "provider": "gemma"}]
+    resp = client.post("/generate/batch", json={"items": items})
+    lines = {line["index"]: line for line in map(json.loads, resp.text.splitlines())}
+    assert (lines[0]["prompt"], lines[2]["prompt"]) == ("llama:a", "gemma:b")
+    assert lines[1]["error"] == "generation blew up"
+
+
+def test_generate_batch_rejects_empty_and_oversized_batches(monkeypatch):
+    assert client.post("/generate/batch", json={"items": []}).status_code == 400
+    monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 1)
+    resp = client.post("/generate/batch", json=[{"task": "a", "provider": "llama"}, {"task": "b", "provider": "llama"}])
+    assert resp.status_code == 400
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import app.core.chatbot_handler as handler
+import app.prompt_generator as pg
+from app.core import cache, metrics, providers, routing, similarity
+
+SPEC = """Design a scalable, distributed architecture for our billing service.
+Requirements:
+- multi-region failover
+- audit logs for every change
+- a migration plan from the current monolith
+Compare the tradeoffs of at least two options."""
+
+
+class FakeClient:
+    def __init__(self):
+        self.models = []
+
+    async def chat(self, model, messages, **params):
+        self.models.append(model)
+        return {"choices": [{"message": {"content": "REPLY"}}]}
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    client = FakeClient()
+    fake_registry = providers.ProviderRegistry()
+    for provider in providers.registry:
+        fake_registry.register(provider.name, provider.model, client=client, kind=provider.kind)
+    monkeypatch.setattr(pg, "registry", fake_registry)
+    monkeypatch.setattr(handler, "registry", fake_registry)
+    monkeypatch.setattr(pg, "prompt_cache", cache.ResponseCache(cache.LRUCache()))
+    monkeypatch.setattr(pg, "similar_prompts", similarity.SimilarityIndex())
+    return client
+
+
+def test_simple_tasks_get_the_smallest_tier_and_complex_ones_the_largest():
+    router = routing.Router(routing.parse_routes(routing.MODEL_ROUTES))
+    assert router.classify("fix my typo: teh cat").tier.name == "simple"
+    assert router.classify("write a poem about rain", "short").provider == "gemma"
+    assert router.classify(SPEC, "detailed").tier.name == "complex"
+    # Vani's mode words override the other signals.
+    assert router.classify("DETAIL - write me an email").tier.name == "complex"
+    assert router.classify(SPEC + "\nBASIC please").tier.name == "simple"
+
+
+def test_routes_table_parsing():
+    tiers = routing.parse_routes("fast=gemma:2:1.5, slow=llama::10")
+    assert tiers == [routing.Tier("fast", "gemma", 2.0, 1.5), routing.Tier("slow", "llama", None, 10.0)]
+    assert routing.Router(tiers).classify(SPEC).provider == "llama"
+
+
+def test_auto_provider_routes_generations_and_records_latency(fake):
+    simple = asyncio.run(pg.generate("write a haiku about rain", "auto", "short"))
+    complex_ = asyncio.run(pg.generate(SPEC, "Auto", "detailed"))
+    assert (simple.provider, complex_.provider) == ("gemma", "llama")
+    assert fake.models == [providers.registry.get("gemma").model, providers.registry.get("llama").model]
+    # An explicit provider is never overridden.
+    asyncio.run(pg.generate("write a haiku about rain", "openai", "short"))
+    assert fake.models[-1] == providers.registry.get("openai").model
+
+    text = metrics.render()
+    assert 'routing_decisions_total{kind="short",tier="simple",provider="gemma"}' in text
+    assert 'routing_tier_seconds_count{tier="complex",provider="llama"}' in text
+
+
+def test_chat_tools_are_routed_only_when_enabled(fake, monkeypatch):
+    asyncio.run(handler.process_chat_message("Ask GPT: fix the typo in 'teh'"))
+    assert fake.models[-1] == providers.registry.get("gpt").model
+
+    monkeypatch.setattr(handler, "ROUTING_ENABLED", True)
+    asyncio.run(handler.process_chat_message("Ask GPT: fix the typo in 'teh'"))
+    assert fake.models[-1] == providers.registry.get("gemma").model
+    asyncio.run(handler.process_chat_message("Improve my prompt: " + SPEC))
+    assert fake.models[-1] == providers.registry.get("llama").model
+
+
+def test_routed_chat_tools_do_not_share_an_upstream_call(monkeypatch):
+    class EchoClient(FakeClient):
+        async def chat(self, model, messages, **params):
+            self.models.append(model)
+            await asyncio.sleep(0.02)
+            return {"choices": [{"message": {"content": messages[0]["content"][:20]}}]}
+
+    client = EchoClient()
+    fake_registry = providers.ProviderRegistry()
+    for provider in providers.registry:
+        fake_registry.register(provider.name, provider.model, client=client, kind=provider.kind)
+    monkeypatch.setattr(handler, "registry", fake_registry)
+    monkeypatch.setattr(handler, "ROUTING_ENABLED", True)
+
+    async def run():
+        return await asyncio.gather(handler.process_chat_message("improve my prompt: write a poem"), handler.process_chat_message("ask gpt: write a poem"))
+
+    improved, answered = asyncio.run(run())
+    # Both route "write a poem" to the same model, but each tool gets its own call and reply.
+    assert client.models == [providers.registry.get("gemma").model] * 2
+    assert improved == handler.VANI_SYSTEM_PROMPT[:20] and answered == "write a poem"
@@ -0,0 +1,65 @@
+from app.core.sessions import SessionStore, Turn, summarize
+
+
+def test_unknown_or_expired_ids_start_a_new_session(clock):
+    store = SessionStore(ttl=60, clock=clock)
+    session = store.get()
+    assert store.get(session.id) is session
+    assert store.get("made-up").id != session.id
+
+    clock.now += 61
+    assert store.get(session.id).id != session.id
+    assert session.id not in store
+
+
+def test_history_keeps_the_newest_turns_within_the_token_budget():
+    store = SessionStore()
+    session = store.get()
+    for i in range(5):
+        store.add_exchange(session, f"question {i}", f"answer {i}")
+    assert [m["content"] for m in store.history(session, budget=10)] == ["question 3", "answer 3", "question 4", "answer 4"]
+    assert store.history(session, budget=1) == []
+    assert store.history(None) == []
+
+
+def test_turns_are_capped_per_session_and_optionally_summarized():
+    store = SessionStore(max_turns=2, max_chars=10, summarize=True)
+    session = store.get()
+    store.add_exchange(session, "Plan a trip to Rome. Budget is tight.", "Sure, here is a plan for you")
+    store.add_exchange(session, "more", "ok")
+    assert [turn.text for turn in session.turns] == ["more", "ok"]
+    history = store.history(session)
+    assert history[0] == {"role": "system", "content": "Summary of the earlier conversation: Plan a tri"}
+    assert [m["content"] for m in history[1:]] == ["more", "ok"]
+
+
+def test_summary_keeps_first_sentences_and_drops_oldest_parts():
+    summary = summarize("", Turn("user", "Write a poem. Make it rhyme."))
+    assert summary == "Write a poem."
+    assert summarize(summary, Turn("assistant", "Here it is")) == summary
+    for _ in range(100):
+        summary = summarize(summary, Turn("user", "another long request with quite a few words in it"))
+    assert len(summary) <= 600 and not summary.startswith("Write a poem")
+
+
+def test_store_evicts_least_recently_used_sessions_by_count_and_memory():
+    store = SessionStore(max_sessions=2)
+    first, second = store.get(), store.get()
+    store.get(first.id)  # "second" is now least recently used
+    store.get()
+    assert first.id in store and second.id not in store
+
+    small = SessionStore(max_bytes=20_000)
+    sessions = [small.get() for _ in range(50)]
+    for session in sessions:
+        small.add_exchange(session, "x" * 1000, "y" * 1000)
+    assert small.size <= 20_000
+    assert sessions[-1].id in small and sessions[0].id not in small
+
+
+def test_exchanges_for_evicted_sessions_are_ignored():
+    store = SessionStore(max_sessions=1)
+    old = store.get()
+    store.get()
+    store.add_exchange(old, "hi", "hello")
+    assert len(store) == 1 and not old.turns
@@ -0,0 +1,120 @@
+import asyncio
+
+from app.core import cache, metrics, ratelimit, sessions, shared_state
+
+
+def test_connections_use_wal(tmp_path):
+    conn = shared_state.connect(str(tmp_path / "shared.sqlite3"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_cache_tier_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    # Two workers, each with its own connection to the same file.
+    first, second = cache.SQLiteCache(path), cache.SQLiteCache(path)
+    first.set("k", "generated by worker one")
+    assert second.get("k") == "generated by worker one"
+    first.close()
+    second.close()
+
+
+def test_workers_draw_on_one_shared_bucket(tmp_path, clock):
+    path = str(tmp_path / "shared.sqlite3")
+    one = ratelimit.SharedTokenBucket(ratelimit.BucketStore(path), "m", rate=10, burst=1, clock=clock)
+    two = ratelimit.SharedTokenBucket(ratelimit.BucketStore(path), "m", rate=10, burst=1, clock=clock)
+    delays = [one.reserve(), two.reserve(), one.reserve(), two.reserve()]
+    assert [round(d, 6) for d in delays] == [0.0, 0.1, 0.2, 0.3]
+
+    # A 429 seen by one worker slows the other down too.
+    asyncio.run(one.on_throttle(retry_after=5))
+    assert two.reserve() == 5
+    assert two.rate == 5
+
+
+def test_shared_bucket_acquire_waits_for_its_slot(tmp_path):
+    store = ratelimit.BucketStore(str(tmp_path / "shared.sqlite3"))
+    registry = ratelimit.RateLimiterRegistry(rate=50, burst=1, store=store)
+    bucket = registry.get("m")
+    assert isinstance(bucket, ratelimit.SharedTokenBucket)
+
+    async def run():
+        return [await bucket.acquire() for _ in range(3)]
+
+    waits = asyncio.run(run())
+    assert waits[0] < 0.01
+    assert 0.01 < waits[2] < 0.1
+    store.close()
+
+
+def test_shared_bucket_waits_for_a_locked_database_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    bucket = ratelimit.SharedTokenBucket(ratelimit.BucketStore(path), "m", rate=10, burst=1)
+    bucket.reserve()
+    # Another worker holds the write lock for a while.
+    other = shared_state.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        throttled = asyncio.ensure_future(bucket.on_throttle(retry_after=1))
+        await asyncio.sleep(0.2)
+        other.rollback()
+        await throttled
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(run()) >= 10
+    assert bucket.rate == 5
+    other.close()
+    bucket.store.close()
+
+
+def test_counters_and_histograms_sum_across_workers_and_gauges_keep_a_worker_label():
+    requests = metrics.Counter("reqs_total", "", ("route",))
+    in_flight = metrics.Gauge("in_flight", "")
+    latency = metrics.Histogram("latency_seconds", "", buckets=(0.1, 1.0))
+    requests.inc(route="/a")
+    in_flight.set(2)
+    latency.observe(0.05)
+    latency.observe(5)
+    one = {"reqs_total": requests.snapshot(), "in_flight": in_flight.snapshot(), "latency_seconds": latency.snapshot()}
+    requests.inc(2, route="/a")
+    in_flight.set(1)
+    two = {"reqs_total": requests.snapshot(), "in_flight": in_flight.snapshot(), "latency_seconds": latency.snapshot()}
+
+    assert requests.collect({"1": one["reqs_total"], "2": two["reqs_total"]}) == ['reqs_total{route="/a"} 4']
+    assert in_flight.collect({"1": one["in_flight"], "2": two["in_flight"]}) == ['in_flight{worker="1"} 2', 'in_flight{worker="2"} 1']
+    assert latency.collect({"1": one["latency_seconds"], "2": two["latency_seconds"]}) == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 10.1",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_metrics_store_renders_totals_and_drops_gauges_of_exited_workers(tmp_path, clock):
+    path = str(tmp_path / "shared.sqlite3")
+    cache.cache_misses.inc()
+    misses = cache.cache_misses.value()
+    sessions.chat_sessions_active.set(3)
+    gone = shared_state.MetricsStore(path, worker="gone", stale=30, clock=clock)
+    gone.publish()
+    clock.now += 60
+    live = shared_state.MetricsStore(path, worker="live", stale=30, clock=clock)
+
+    text = live.render()
+    assert f"prompt_cache_misses_total {misses * 2:g}" in text
+    assert 'chat_sessions_active{worker="live"} 3' in text
+    assert 'worker="gone"' not in text
+    gone.close()
+    live.close()
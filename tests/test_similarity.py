@@ -0,0 +1,66 @@
+from app.core import similarity
+
+
+def test_content_words_keep_order_and_pronouns_but_drop_fillers_and_plurals():
+    assert similarity.content_words("Please write me a poem about the Seas!") == ("write", "me", "poem", "about", "sea")
+    assert similarity.content_words("the a please") == ()
+    assert similarity.shingles("the a please") == frozenset()
+    assert len(similarity.shingles("poems")) == 1
+
+
+def test_reworded_task_matches_but_different_subject_does_not():
+    index = similarity.SimilarityIndex(threshold=0.8)
+    index.set("scope", "write a poem about the sea", "SEA PROMPT")
+    assert index.get("scope", "Please write a poem about the seas") == ("SEA PROMPT", 1.0)
+    assert index.get("scope", "write a poem about the moon") is None
+    assert index.get("other-scope", "write a poem about the sea") is None
+
+
+def test_tasks_asking_for_opposite_things_do_not_match():
+    pairs = [
+        ("Translate this email from English to French", "Translate this email from French to English"),
+        ("Convert Celsius to Fahrenheit", "Convert Fahrenheit to Celsius"),
+        ("Write an email to my boss", "Write your boss an email"),
+    ]
+    for stored, asked in pairs:
+        index = similarity.SimilarityIndex(threshold=0.8)
+        index.set("s", stored, "STORED")
+        assert index.get("s", asked) is None, asked
+        assert index.get("s", stored) == ("STORED", 1.0)
+
+
+def test_best_match_above_threshold_wins():
+    index = similarity.SimilarityIndex(threshold=0.6)
+    index.set("s", "summarize quarterly sales report for the board", "A")
+    index.set("s", "summarize quarterly sales report", "B")
+    value, score = index.get("s", "please summarize the quarterly sales report")
+    assert value == "B" and score == 1.0
+
+
+def test_minhash_estimates_jaccard():
+    a = similarity.shingles("alpha beta gamma delta epsilon zeta eta theta")
+    b = similarity.shingles("alpha beta gamma delta epsilon zeta eta iota")
+    agreement = sum(x == y for x, y in zip(similarity.minhash(a), similarity.minhash(b))) / len(similarity.minhash(a))
+    assert abs(agreement - similarity.jaccard(a, b)) < 0.25
+
+
+def test_bounded_size_evicts_least_recently_used():
+    index = similarity.SimilarityIndex(max_entries=2)
+    index.set("s", "first unique task", "1")
+    index.set("s", "second unique task", "2")
+    assert index.get("s", "first unique task") is not None  # refresh "first"
+    index.set("s", "third unique task", "3")
+    assert len(index) == 2
+    assert index.get("s", "second unique task") is None
+    assert index.get("s", "first unique task") == ("1", 1.0)
+    live = [entry_id for bucket in index._buckets.values() for entry_id in ([bucket] if isinstance(bucket, int) else bucket)]
+    assert set(live) == set(index._entries)
+
+
+def test_entries_expire_and_are_removed_from_buckets(clock):
+    index = similarity.SimilarityIndex(ttl=10, clock=clock)
+    index.set("s", "draft an email to a customer", "EMAIL")
+    clock.now += 11
+    assert index.get("s", "draft an email to a customer") is None
+    assert len(index) == 0
+    assert index._buckets == {}
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight, singleflight_deduplicated
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test-share")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert calls == 1
+    assert singleflight_deduplicated.value(group="test-share") == 4
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight("test-keys")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def run():
+        await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b")))
+        await flight.do("a", lambda: work("a"))
+
+    asyncio.run(run())
+    assert calls == ["a", "b", "a"]
+
+
+def test_errors_propagate_to_every_waiter():
+    flight = SingleFlight("test-errors")
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    flight = SingleFlight("test-cancel")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("k", work))
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_work_is_cancelled_when_every_waiter_gives_up():
+    flight = SingleFlight("test-abandon")
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.do("k", work), timeout=0.02)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flight.in_flight()
+
+    assert asyncio.run(run()) == 0